@@ -7,6 +7,7 @@ from databricks_sync import log, CONTEXT_SETTINGS
 from databricks_sync.cmds.apply import import_cli
 from databricks_sync.cmds.export import export_cli
 from databricks_sync.cmds.init import init_cli
+from databricks_sync.cmds.merge import merge_cli
 from databricks_sync.cmds.triage import triage_cli
 from databricks_sync.cmds.version import print_version_callback, get_version
 
@@ -30,6 +31,7 @@ def cli():
 
 cli.add_command(init_cli, name="init")
 cli.add_command(export_cli, name="export")
+cli.add_command(merge_cli, name="merge")
 cli.add_command(import_cli, name="import")
 cli.add_command(triage_cli, name="triage")
 
@@ -11,7 +11,10 @@ from databricks_cli.utils import InvalidConfigurationError
 
 from databricks_sync import log
 from databricks_sync.cmds.version import get_version
+from databricks_sync.sdk.message import HCLConvertData, LineagePolicy
+from databricks_sync.sdk.service.concurrency import RequestPool, ByteBudget
 from databricks_sync.sdk.sync.constants import GeneratorCatalog
+from databricks_sync.sdk.sync.partition import ExportShard
 
 SUPPORTED_IMPORTS = GeneratorCatalog.list_catalog()
 
@@ -84,6 +87,7 @@ def handle_additional_debug(ctx):
         os.environ["TF_LOG"] = "debug"
         os.environ["GIT_PYTHON_TRACE"] = "full"
         os.environ["DATABRICKS_SYNC_REPORT_DB_TRACE"] = "true"
+        HCLConvertData.lineage_policy = LineagePolicy.FULL
 
 
 def delete_option(f):
@@ -97,6 +101,91 @@ def dask_option(f):
                         help="Use dask to parallelize the process.")(f)
 
 
+def max_concurrent_requests_option(f):
+    return click.option('--max-concurrent-requests', type=click.IntRange(min=1),
+                        default=RequestPool.DEFAULT_MAX_CONCURRENT_REQUESTS,
+                        help="The maximum number of api requests in flight at the same time across all the "
+                             "exported objects.")(f)
+
+
+def max_download_bytes_option(f):
+    return click.option('--max-download-bytes', type=click.IntRange(min=1), default=ByteBudget.DEFAULT_MAX_BYTES,
+                        help="The maximum number of downloaded notebook, dbfs file and init script bytes held in "
+                             "memory at the same time before they are written to disk.")(f)
+
+
+def rate_limit_option(f):
+    def callback(ctx, param, value):  # NOQA
+        family_rates = {}
+        for item in value:
+            family, _, rate = item.partition("=")
+            try:
+                family_rates[family.strip()] = float(rate)
+            except ValueError:
+                raise click.BadParameter(f"expected <endpoint family>=<requests per second> but got: {item}")
+            if family.strip() == "" or family_rates[family.strip()] <= 0:
+                raise click.BadParameter(f"expected <endpoint family>=<requests per second> but got: {item}")
+        return family_rates
+
+    return click.option('--rate-limit', multiple=True, callback=callback,
+                        help="Requests per second allowed for an endpoint family in the form of family=rate, "
+                             "e.g. scim=5 or permissions=20. Use default=rate to change the limit of all the "
+                             "other families. Can be provided multiple times.")(f)
+
+
+def workers_option(f):
+    return click.option('--workers', type=click.IntRange(min=1), default=None,
+                        help="Download, process and write the exported objects on a pool of this many threads. "
+                             "This is a lightweight alternative to --dask.")(f)
+
+
+def processes_option(f):
+    return click.option('--processes', type=click.IntRange(min=1), default=None,
+                        help="Split the export across this many processes. Notebooks and dbfs files are split by "
+                             "the folders directly under their base paths and the results are merged into one "
+                             "export. Rate limits are shared by all the processes, --workers and "
+                             "--max-concurrent-requests apply to each process.")(f)
+
+
+def incremental_option(f):
+    return click.option('--incremental', is_flag=True, default=False,
+                        help="Keep the notebooks and dbfs files of the previous export which did not change since "
+                             "then instead of downloading them again. Downloaded files are tracked in a manifest "
+                             "next to them in the export repo.")(f)
+
+
+def resume_option(f):
+    return click.option('--resume', type=str, default=None,
+                        help="Resume the interrupted export with this run id. Objects which the run already exported "
+                             "are skipped and the export is written into the working tree of the run.")(f)
+
+
+def retry_failed_option(f):
+    return click.option('--retry-failed', type=str, default=None,
+                        help="Export again only the objects which failed in the export with this run id.")(f)
+
+
+def shard_option(f):
+    def callback(ctx, param, value):  # NOQA
+        if value is None:
+            return None
+        try:
+            return ExportShard.parse(value)
+        except ValueError as ve:
+            raise click.BadParameter(str(ve))
+
+    return click.option('--shard', type=str, default=None, callback=callback,
+                        help="Only export the objects owned by this shard in the form of i/N, e.g. 1/4. The shard is "
+                             "written to --local-git-path without being committed, use the merge command to combine "
+                             "all the shards into one commit.")(f)
+
+
+def shard_path_option(f):
+    return click.option('--shard-path', type=click.Path(exists=True, file_okay=False, resolve_path=True),
+                        multiple=True, required=True,
+                        help="Directory of an exported shard. Provide it once for every shard.")(f)
+
+
 def dry_run_option(f):
     def callback(ctx, param, value):  # NOQA
         if value is True:
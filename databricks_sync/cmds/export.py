@@ -7,7 +7,9 @@ from databricks_cli.sdk import ApiClient
 from databricks_sync import CONTEXT_SETTINGS
 from databricks_sync.cmds.config import git_url_option, ssh_key_option, dry_run_option, \
     dask_option, local_git_option, validate_git_params, config_path_option, handle_additional_debug, \
-    wrap_with_user_agent, excel_report_option, inject_profile_as_env, branch_option
+    wrap_with_user_agent, excel_report_option, inject_profile_as_env, branch_option, max_concurrent_requests_option, \
+    workers_option, rate_limit_option, processes_option, shard_option, resume_option, retry_failed_option, \
+    incremental_option, max_download_bytes_option
 from databricks_sync.sdk.sync.export import ExportCoordinator
 
 
@@ -24,12 +26,41 @@ from databricks_sync.sdk.sync.export import ExportCoordinator
 @dry_run_option
 @inject_profile_as_env
 @dask_option
+@workers_option
+@processes_option
+@shard_option
+@resume_option
+@retry_failed_option
+@incremental_option
+@rate_limit_option
+@max_concurrent_requests_option
+@max_download_bytes_option
 @debug_option
 @click.pass_context
-def export_cli(ctx, dry_run, git_ssh_url, local_git_path, dask, config_path, api_client: ApiClient, branch, excel_report):
+def export_cli(ctx, dry_run, git_ssh_url, local_git_path, dask, config_path, api_client: ApiClient, branch, excel_report,
+               max_concurrent_requests, workers, processes, shard, resume, retry_failed, incremental,
+               rate_limit, max_download_bytes):
     # TODO: log the api client config and etc
     handle_additional_debug(ctx)
     validate_git_params(git_ssh_url, local_git_path)
+    if dask is True and workers is not None:
+        raise click.ClickException("Only one of --dask or --workers can be provided but not both")
+    if dask is True and processes is not None:
+        raise click.ClickException("Only one of --dask or --processes can be provided but not both")
+    if shard is not None and local_git_path is None:
+        raise click.ClickException("--local-git-path should be provided to write the shard to")
+    if resume is not None and retry_failed is not None:
+        raise click.ClickException("Only one of --resume or --retry-failed can be provided but not both")
+    resume_run_id = resume or retry_failed
+    if resume_run_id is not None and any([dask is True, processes is not None, shard is not None]):
+        raise click.ClickException("--resume and --retry-failed can not be combined with --dask, --processes or "
+                                   "--shard")
+    if incremental is True and any([dask is True, processes is not None, shard is not None]):
+        raise click.ClickException("--incremental can not be combined with --dask, --processes or --shard")
     ExportCoordinator.export(api_client, Path(config_path), dask_mode=dask, dry_run=dry_run, git_ssh_url=git_ssh_url,
-                             local_git_path=local_git_path, branch=branch, excel_report=excel_report)
+                             local_git_path=local_git_path, branch=branch, excel_report=excel_report,
+                             max_concurrent_requests=max_concurrent_requests, workers=workers,
+                             rate_limits=rate_limit, processes=processes, shard=shard, resume_run_id=resume_run_id,
+                             retry_failed=retry_failed is not None, incremental=incremental,
+                             max_download_bytes=max_download_bytes)
 
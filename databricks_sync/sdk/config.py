@@ -15,15 +15,21 @@ class SingletonNotSetError(Exception):
 # if its a long living interpreter we may want to change config values
 class ExportConfig:
     class __ExportConfigImmutableSingleton:
-        def __init__(self, name, objects: Dict[str, Any] = None, parameterize_permissions=None):
+        def __init__(self, name, objects: Dict[str, Any] = None, parameterize_permissions=None,
+                     for_each_shards=None):
             self.objects = objects
             self.name = name
             self._parameterize_permissions = parameterize_permissions or False
+            self._for_each_shards = for_each_shards
 
         @property
         def parameterize_permissions(self):
             return self._parameterize_permissions
 
+        @property
+        def for_each_shards(self):
+            return self._for_each_shards
+
         def contains(self, item: str):
             return item in self.objects
 
@@ -0,0 +1,160 @@
+import asyncio
+from typing import Callable, Any, List, Optional, Dict
+
+from databricks_sync import log
+from databricks_sync.sdk.message import ErrorMixin
+from databricks_sync.sdk.service.concurrency import StageExecutor, OrderedTurns
+
+
+class Stage:
+    """
+    A pipeline stage with a bounded input queue. Items are taken off the queue by the stage workers, func is applied
+    and the result is put on the queue of every downstream stage (fan out). Putting an item on a full queue waits
+    until the stage catches up which propagates the backpressure all the way up to the generators. Results are put
+    downstream in the order the items were taken off the queue even when several workers finish them out of order.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], maxsize: int,
+                 stage_executor: Optional[StageExecutor] = None):
+        self.name = name
+        self.func = func
+        self.__maxsize = maxsize
+        self.__stage_executor = stage_executor
+        self.__downstreams: List['Stage'] = []
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__workers: List[asyncio.Task] = []
+        self.__turns: Optional[OrderedTurns] = None
+        self.processed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+
+    def to(self, *stages: 'Stage') -> 'Stage':
+        self.__downstreams.extend(stages)
+        return self
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__queue.qsize() if self.__queue is not None else 0
+
+    @property
+    def worker_count(self) -> int:
+        return self.__stage_executor.workers if self.__stage_executor is not None else 1
+
+    async def put(self, item):
+        await self.__queue.put(item)
+        self.max_queue_depth = max(self.max_queue_depth, self.__queue.qsize())
+
+    async def __apply(self, item):
+        if self.__stage_executor is not None:
+            return await self.__stage_executor.run(self.func, item)
+        return self.func(item)
+
+    async def __work(self):
+        while True:
+            item = await self.__queue.get()
+            # The ticket is taken right after the get so the tickets follow the queue order
+            ticket = self.__turns.take()
+            try:
+                result = await self.__apply(item)
+            except Exception as e:
+                # Stage functions manage their errors on the message, anything reaching here is a bug in the stage
+                # itself and should not stall the rest of the pipeline. The message still carries on with the error so
+                # that the results stage reports it as failed.
+                self.failed += 1
+                log.exception(f"Unexpected error in pipeline stage: {self.name}")
+                result = None
+                if isinstance(item, ErrorMixin):
+                    item.add_error(e)
+                    result = item
+            else:
+                self.processed += 1
+            try:
+                await self.__turns.wait(ticket)
+                if result is not None:
+                    for downstream in self.__downstreams:
+                        await downstream.put(result)
+            finally:
+                await self.__turns.done(ticket)
+                self.__queue.task_done()
+
+    def start(self):
+        self.__queue = asyncio.Queue(maxsize=self.__maxsize)
+        self.__turns = OrderedTurns()
+        self.__workers = [asyncio.ensure_future(self.__work()) for _ in range(self.worker_count)]
+
+    async def join(self):
+        await self.__queue.join()
+
+    async def stop(self):
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+        self.__workers = []
+
+
+class PipelineEngine:
+    """
+    Runs the generators into a graph of bounded stages. Stages have to be added upstream first; once the generators
+    are exhausted the stages are joined in that order so every item makes it all the way through the graph.
+    """
+    DEFAULT_QUEUE_SIZE = 64
+    DEFAULT_REPORT_INTERVAL_SECONDS = 30
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 report_interval_seconds: float = DEFAULT_REPORT_INTERVAL_SECONDS):
+        self.__queue_size = queue_size
+        self.__report_interval_seconds = report_interval_seconds
+        self.__stages: List[Stage] = []
+        self.__sources: List[Any] = []
+
+    @property
+    def stages(self) -> List[Stage]:
+        return self.__stages
+
+    @staticmethod
+    def __verify_error(func: Callable[[Any], Any]):
+        if not hasattr(func, "managed_error"):
+            raise ValueError(f"function {func.__name__} does not have its error managed. Please use " +
+                             "BaseTerraformModel.manage_error decorator to make sure that error is propagated "
+                             "through the pipeline.")
+
+    def add_stage(self, name: str, func: Callable[[Any], Any], stage_executor: StageExecutor = None,
+                  verify_error: bool = True) -> Stage:
+        if verify_error is True:
+            self.__verify_error(func)
+        stage = Stage(name, func, self.__queue_size, stage_executor=stage_executor)
+        self.__stages.append(stage)
+        return stage
+
+    def add_source(self, generator, stage: Stage):
+        self.__sources.append((generator, stage))
+
+    @staticmethod
+    async def __drive(generator, stage: Stage):
+        async for item in generator.generate():
+            await stage.put(item)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {stage.name: {"processed": stage.processed,
+                             "failed": stage.failed,
+                             "queue_depth": stage.queue_depth,
+                             "max_queue_depth": stage.max_queue_depth} for stage in self.__stages}
+
+    async def __report(self):
+        while True:
+            await asyncio.sleep(self.__report_interval_seconds)
+            depths = ", ".join(f"{stage.name}: {stage.queue_depth}" for stage in self.__stages)
+            log.info(f"Pipeline queue depths: {depths}")
+
+    async def run(self):
+        for stage in self.__stages:
+            stage.start()
+        reporter = asyncio.ensure_future(self.__report())
+        try:
+            await asyncio.gather(*[self.__drive(generator, stage) for generator, stage in self.__sources])
+            for stage in self.__stages:
+                await stage.join()
+        finally:
+            reporter.cancel()
+            for stage in self.__stages:
+                await stage.stop()
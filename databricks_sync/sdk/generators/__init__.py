@@ -1,5 +1,6 @@
 import copy
 import fnmatch
+import logging
 import os
 import re
 from typing import List, Dict, Any
@@ -33,6 +34,56 @@ def match_patterns(string, patterns) -> (bool, List[str]):
     return any(match_results), matched_patterns
 
 
+class PathPatternMatcher(object):
+    """
+    Glob patterns compiled into a single regular expression so that a path is matched against all of them at once. The
+    literal prefix of every pattern is kept to tell whether anything under a directory can match without listing it.
+    """
+    WILDCARDS = "*?["
+
+    def __init__(self, patterns: List[str]):
+        self.__patterns = list(patterns)
+        self.__regex = re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in self.__patterns)) \
+            if len(self.__patterns) > 0 else None
+        self.__prefixes = [(self.__literal_prefix(pattern), pattern) for pattern in self.__patterns]
+
+    @staticmethod
+    def __literal_prefix(pattern: str) -> str:
+        wildcards = [pattern.index(c) for c in PathPatternMatcher.WILDCARDS if c in pattern]
+        return pattern[:min(wildcards)] if len(wildcards) > 0 else pattern
+
+    @staticmethod
+    def __dir_prefix(dir_path: str) -> str:
+        return dir_path.rstrip("/") + "/"
+
+    @property
+    def patterns(self) -> List[str]:
+        return self.__patterns
+
+    def matches(self, path: str) -> bool:
+        return self.__regex is not None and self.__regex.match(path) is not None
+
+    def matched_patterns(self, path: str) -> List[str]:
+        return [pattern for pattern in self.__patterns if fnmatch.fnmatch(path, pattern)]
+
+    def can_match_under(self, dir_path: str) -> bool:
+        dir_prefix = self.__dir_prefix(dir_path)
+        for literal, pattern in self.__prefixes:
+            if literal == pattern:
+                # Without wildcards only the pattern itself matches
+                if pattern.startswith(dir_prefix) and len(pattern) > len(dir_prefix):
+                    return True
+            # Wildcards match across "/" so the directory can not be ruled out once it shares the literal prefix
+            elif literal.startswith(dir_prefix) or dir_prefix.startswith(literal):
+                return True
+        return False
+
+    def matches_all_under(self, dir_path: str) -> bool:
+        dir_prefix = self.__dir_prefix(dir_path)
+        return any(literal != pattern and set(pattern[len(literal):]) == {"*"} and dir_prefix.startswith(literal)
+                   for literal, pattern in self.__prefixes)
+
+
 class PathInclusionParser(object):
 
     def __init__(self, path_patterns: List[str], resource_type):
@@ -41,6 +92,7 @@ class PathInclusionParser(object):
         self.__base_paths = self.get_base_paths()
         # Normalize for dbfs and remove any file system for processing pattern matching
         self.__all_path_patterns = [pat.lstrip("dbfs:") for pat in list(set(self.__path_patterns + self.__base_paths))]
+        self.__matcher = PathPatternMatcher(self.__all_path_patterns)
         self.__processed_paths = set()
 
     def __add_implicit_recursive_glob(self, path: str):
@@ -92,13 +144,22 @@ class PathInclusionParser(object):
             return False
 
         # Normalize for dbfs and remove any file system
-        is_included, matched_patterns = match_patterns(path.lstrip("dbfs:"), self.__all_path_patterns)
+        is_included = self.__matcher.matches(path.lstrip("dbfs:"))
 
-        if is_included is True:
+        if is_included is True and log.isEnabledFor(logging.DEBUG):
             log.debug(f"[PathInclusion] {self.__resource_type}: {path} path matched the following inclusion patterns: "
-                      f"{matched_patterns} from the full set of: {self.__all_path_patterns}")
+                      f"{self.__matcher.matched_patterns(path.lstrip('dbfs:'))} from the full set of: "
+                      f"{self.__all_path_patterns}")
         return is_included
 
+    def is_subtree_included(self, dir_path):
+        # Directories under which no path can be included do not need to be listed
+        can_match = self.__matcher.can_match_under(dir_path.lstrip("dbfs:"))
+        if can_match is False:
+            log.debug(f"[PathInclusion] {self.__resource_type}: nothing under {dir_path} can match the inclusion "
+                      f"patterns: {self.__all_path_patterns}")
+        return can_match
+
     @property
     def base_paths(self):
         return self.__base_paths
@@ -114,17 +175,29 @@ class PathExclusionParser(object):
             self.__exclude_paths = [exclude_path]
         else:
             self.__exclude_paths = exclude_path
+        # Normalize for dbfs and remove any file system
+        self.__matcher = PathPatternMatcher([pat.lstrip("dbfs:") for pat in self.__exclude_paths or []])
 
     def is_path_excluded(self, path):
         # If no exclude paths are not defined then skip this step
         if self.__exclude_paths is None:
             return False
         # Normalize for dbfs and remove any file system
-        is_excluded, matched_patterns = match_patterns(path.lstrip("dbfs:"),
-                                                       [pat.lstrip("dbfs:") for pat in self.__exclude_paths])
-        if is_excluded is True:
+        is_excluded = self.__matcher.matches(path.lstrip("dbfs:"))
+        if is_excluded is True and log.isEnabledFor(logging.DEBUG):
             log.debug(f"[PathExclusion] {self.__resource_type}: {path} path matched the following exclusion patterns: "
-                      f"{matched_patterns} from the full set of: {self.__exclude_paths}")
+                      f"{self.__matcher.matched_patterns(path.lstrip('dbfs:'))} from the full set of: "
+                      f"{self.__exclude_paths}")
+        return is_excluded
+
+    def is_subtree_excluded(self, dir_path):
+        # Directories whose every path is excluded do not need to be listed
+        if self.__exclude_paths is None:
+            return False
+        is_excluded = self.__matcher.matches_all_under(dir_path.lstrip("dbfs:"))
+        if is_excluded is True:
+            log.debug(f"[PathExclusion] {self.__resource_type}: everything under {dir_path} matches the exclusion "
+                      f"patterns: {self.__exclude_paths}")
         return is_excluded
 
 class RegexFilterCompileError(ValueError):
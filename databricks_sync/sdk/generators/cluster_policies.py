@@ -10,6 +10,7 @@ from databricks_sync.sdk.message import APIData, HCLConvertData
 from databricks_sync.sdk.pipeline import APIGenerator
 from databricks_sync.sdk.processor import MappedGrokVariableBasicAnnotationProcessor
 from databricks_sync.sdk.service.cluster_policies import PolicyService
+from databricks_sync.sdk.service.concurrency import AsyncService
 from databricks_sync.sdk.sync.constants import ResourceCatalog, GeneratorCatalog
 
 
@@ -28,6 +29,7 @@ class ClusterPolicyHCLGenerator(APIGenerator):
         }
         self.__custom_map_vars = {**default_custom_map_vars, **(custom_map_vars or {})}
         self.__service = PolicyService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
         self.__perms = PermissionsHelper(self.api_client)
 
     def __pre_process_custom_map_vars(self, cluster_policy_data) -> (Dict[str, Any], Tuple[str, str]):
@@ -66,8 +68,10 @@ class ClusterPolicyHCLGenerator(APIGenerator):
             pass
 
     async def _generate(self) -> Generator[APIData, None, None]:
-        policies = self.__service.list_policies()
+        policies = await self.__async_service.list_policies()
         for policy in policies.get("policies", []):
+            if self._is_shard_owned(policy["policy_id"]) is False:
+                continue
             for data in HCLConvertData.process_data(ResourceCatalog.CLUSTER_POLICY_RESOURCE,
                                                     policy, self.__process, self.__get_cluster_policy_raw_id):
                 yield data
@@ -1,7 +1,8 @@
 import copy
 from pathlib import Path
-from typing import Generator, Dict, Any, Optional
+from typing import Generator, Dict, Any, Optional, List
 
+import requests
 from databricks_cli.sdk import ApiClient
 from databricks_cli.sdk import ClusterService, ManagedLibraryService
 
@@ -12,9 +13,11 @@ from databricks_sync.sdk.generators.permissions import PermissionsHelper, NoDire
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import APIData
 from databricks_sync.sdk.pipeline import APIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService
 from databricks_sync.sdk.service.global_init_scripts import GlobalInitScriptsService
 from databricks_sync.sdk.sync.constants import ResourceCatalog, CloudConstants, GeneratorCatalog, \
     ForEachBaseIdentifierCatalog
+from databricks_sync.sdk.sync.partition import ForEachPartition
 from databricks_sync.sdk.utils import normalize_identifier, handle_azure_libraries, \
     handle_azure_storage_info, contains_cloud_specific_storage_info, contains_cloud_specific_library_path
 
@@ -39,12 +42,16 @@ class ClusterHCLGenerator(APIGenerator):
         self.__custom_map_vars = {**default_custom_map_vars, **(custom_map_vars or {})}
         self.__service = ClusterService(self.api_client)
         self.__lib_service = ManagedLibraryService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
+        self.__async_lib_service = AsyncService(self.__lib_service)
         self.__global_init_scripts_service = GlobalInitScriptsService(self.api_client)
         self.__perms = PermissionsHelper(self.api_client)
         self.__pin_first_20 = pin_first_20
         self.__max_pin_count = 20
         self.__valid_cluster_sources = valid_cluster_sources or [ClusterSourceConstants.UI, ClusterSourceConstants.API]
         self.__local_filter_by = LocalFilterBy(by, ResourceCatalog.CLUSTER_RESOURCE, self.__get_cluster_raw_id)
+        self.__library_statuses: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self.__is_library_index_available = True
 
     def __create_cluster_data(self, cluster_data: Dict[str, Any]):
         return self._create_data(
@@ -62,13 +69,15 @@ class ClusterHCLGenerator(APIGenerator):
     def _handle_depends_on(tdb: TerraformDictBuilder, has_global_init_scripts):
         depends_on = []
         # If user configures dbfs files wait for that with regards to init scripts
+        partition = ForEachPartition.from_config()
         if export_config.contains(GeneratorCatalog.DBFS_FILE) is True:
-            depends_on.append(Interpolate.depends_on(ResourceCatalog.DBFS_FILE_RESOURCE,
-                                                     ForEachBaseIdentifierCatalog.DBFS_FILES_BASE_IDENTIFIER))
+            depends_on.extend(Interpolate.depends_on(ResourceCatalog.DBFS_FILE_RESOURCE, identifier) for identifier
+                              in partition.names(ForEachBaseIdentifierCatalog.DBFS_FILES_BASE_IDENTIFIER))
         # Wait for all global init scripts to be created before starting clusters
         if export_config.contains(GeneratorCatalog.GLOBAL_INIT_SCRIPT) is True and has_global_init_scripts is True:
-            depends_on.append(Interpolate.depends_on(ResourceCatalog.GLOBAL_INIT_SCRIPTS_RESOURCE,
-                                                     ForEachBaseIdentifierCatalog.GLOBAL_INIT_SCRIPTS_BASE_IDENTIFIER))
+            depends_on.extend(Interpolate.depends_on(ResourceCatalog.GLOBAL_INIT_SCRIPTS_RESOURCE, identifier)
+                              for identifier in
+                              partition.names(ForEachBaseIdentifierCatalog.GLOBAL_INIT_SCRIPTS_BASE_IDENTIFIER))
         if len(depends_on) > 0:
             tdb.add_optional("depends_on", lambda: depends_on)
 
@@ -113,16 +122,42 @@ class ClusterHCLGenerator(APIGenerator):
                 resp["cloud_agnostic_libraries"] += [library]
         return resp
 
+    async def __get_library_statuses(self, cluster_id: str) -> List[Dict[str, Any]]:
+        # The libraries of all the clusters are fetched in one request once the first cluster is exported
+        if self.__library_statuses is None and self.__is_library_index_available is True:
+            try:
+                resp = await self.__async_lib_service.all_cluster_statuses()
+                self.__library_statuses = {status["cluster_id"]: status.get("library_statuses", [])
+                                           for status in resp.get("statuses", [])}
+                log.info(f"Fetched the library statuses of {len(self.__library_statuses)} clusters")
+            except requests.exceptions.HTTPError as e:
+                log.info(f"Unable to fetch the library statuses of all clusters, fetching them for every cluster "
+                         f"instead. Error: {e}")
+                self.__is_library_index_available = False
+        if self.__library_statuses is not None:
+            # Clusters without any libraries are not part of the statuses
+            return self.__library_statuses.get(cluster_id, [])
+        library_status = await self.__async_lib_service.cluster_status(cluster_id)
+        return library_status.get("library_statuses", [])
+
+    def __is_exported(self, cluster: Dict[str, Any]) -> bool:
+        if "cluster_source" in cluster and cluster["cluster_source"] not in self.__valid_cluster_sources:
+            return False
+        return self._is_shard_owned(cluster["cluster_id"])
+
     async def _generate(self) -> Generator[APIData, None, None]:
-        clusters = self.__service.list_clusters().get("clusters", [])
-        for idx, cluster in enumerate(filter(self.__local_filter_by.is_in_criteria, clusters)):
-            if "cluster_source" in cluster and cluster["cluster_source"] not in self.__valid_cluster_sources:
-                continue
+        clusters = (await self.__async_service.list_clusters()).get("clusters", [])
+        # Pinned clusters are counted before the clusters of other sources and shards are skipped
+        exported_clusters = [(idx, cluster) for idx, cluster
+                             in enumerate(filter(self.__local_filter_by.is_in_criteria, clusters))
+                             if self.__is_exported(cluster)]
+        # Permissions of the next exported clusters are fetched while the clusters before them are exported
+        for idx, cluster in self.__perms.iter_prefetched(ResourceCatalog.CLUSTER_RESOURCE, exported_clusters,
+                                                         lambda item: self.__get_cluster_raw_id(item[1])):
             cluster_spec = self.get_cluster_spec(cluster)
             if self.__pin_first_20 is True and idx < self.__max_pin_count:
                 cluster_spec["is_pinned"] = True
-            resp = self.get_dynamic_libraries(
-                self.__lib_service.cluster_status(cluster_spec["cluster_id"]).get("library_statuses", []))
+            resp = self.get_dynamic_libraries(await self.__get_library_statuses(cluster_spec["cluster_id"]))
 
             cluster_spec["aws_libraries"] = resp["aws_libraries"]
             cluster_spec["azure_libraries"] = resp["azure_libraries"]
@@ -132,8 +167,8 @@ class ClusterHCLGenerator(APIGenerator):
 
             yield cluster_data
             try:
-                yield self.__perms.create_permission_data(cluster_data, self.get_local_hcl_path,
-                                                          self.get_relative_hcl_path)
+                yield await self.__perms.create_permission_data_async(cluster_data, self.get_local_hcl_path,
+                                                                      self.get_relative_hcl_path)
             except NoDirectPermissionsError:
                 pass
 
@@ -1,7 +1,9 @@
-import io
+import collections
+import time
 from base64 import b64decode
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Generator, List, Dict, Any, Callable, Union, Tuple, Optional
+from typing import Generator, List, Dict, Any, Callable, Union, Tuple, Optional, Iterator, Deque
 
 from databricks_cli.dbfs.api import FileInfo, BUFFER_SIZE_BYTES
 from databricks_cli.sdk import DbfsService, ApiClient
@@ -12,40 +14,74 @@ from databricks_sync.sdk.generators import PathExclusionParser, PathInclusionPar
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder
 from databricks_sync.sdk.message import APIData, Artifact
 from databricks_sync.sdk.pipeline import DownloaderAPIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService, ListingPrefetcher, request_pool, download_budget
 from databricks_sync.sdk.sync.constants import ResourceCatalog, ForEachBaseIdentifierCatalog, DbfsFileSchema, \
     get_members, GeneratorCatalog
+from databricks_sync.sdk.sync.partition import ForEachPartition
 
 
 class DbfsFile(Artifact):
-
-    @staticmethod
-    def __get_file_contents(dbfs_service: DbfsService, dbfs_path: str, headers=None):
-        abs_path = f"dbfs:{dbfs_path}"
-        json = dbfs_service.get_status(abs_path, headers=headers)
-        file_info = FileInfo.from_json(json)
+    # Ranges of BUFFER_SIZE_BYTES (the largest read the api allows) which are read ahead of the one being written
+    MAX_PARALLEL_READS = 4
+
+    def __read_range(self, abs_path: str, offset: int, length: int) -> bytes:
+        chunks = []
+        bytes_read = 0
+        # The api may return less than the requested length so the rest of the range is read until the end of file
+        while bytes_read < length:
+            response = self.service.read(abs_path, offset + bytes_read, length - bytes_read)
+            if response['bytes_read'] == 0:
+                break
+            chunks.append(b64decode(response['data']))
+            bytes_read += response['bytes_read']
+        return b"".join(chunks)
+
+    def iter_content(self) -> Iterator[bytes]:
+        abs_path = f"dbfs:{self.remote_path}"
+        file_info = FileInfo.from_json(self.service.get_status(abs_path))
         if file_info.is_dir:
             error_and_quit('The dbfs file {} is a directory.'.format(repr(abs_path)))
-        length = file_info.file_size
-        offset = 0
-        output = io.BytesIO()
-        while offset < length:
-            response = dbfs_service.read(abs_path, offset, BUFFER_SIZE_BYTES,
-                                         headers=headers)
-            bytes_read = response['bytes_read']
-            data = response['data']
-            offset += bytes_read
-            output.write(b64decode(data))
-        return output.getvalue()
+        # Ranges are read concurrently on the request pool and yielded in order, so at most MAX_PARALLEL_READS
+        # ranges of the file are held in memory
+        reads = collections.deque()
+        try:
+            for offset in range(0, file_info.file_size, BUFFER_SIZE_BYTES):
+                length = min(BUFFER_SIZE_BYTES, file_info.file_size - offset)
+                # The ranges already read are written before waiting for the budget so downloads never wait on each
+                # other while holding any of it
+                while not download_budget.try_acquire(length):
+                    if len(reads) == 0:
+                        download_budget.acquire(length)
+                        break
+                    yield from self.__pop_range(reads)
+                reads.append((length, request_pool.submit(self.__read_range, abs_path, offset, length)))
+                if len(reads) >= self.MAX_PARALLEL_READS:
+                    yield from self.__pop_range(reads)
+            while len(reads) > 0:
+                yield from self.__pop_range(reads)
+        finally:
+            for length, read in reads:
+                read.cancel()
+                download_budget.release(length)
+
+    @staticmethod
+    def __pop_range(reads: Deque[Tuple[int, Future]]) -> Iterator[bytes]:
+        length, read = reads.popleft()
+        try:
+            yield read.result()
+        finally:
+            download_budget.release(length)
 
     def get_content(self):
-        return DbfsFile.__get_file_contents(self.service, self.remote_path)
+        return b"".join(self.iter_content())
 
 
 class DbfsFileHCLGenerator(DownloaderAPIGenerator):
     DBFS_FOREACH_VAR = "databricks_dbfs_file_for_each_var"
 
     def __init__(self, api_client: ApiClient, base_path: Path, dbfs_path: Union[str, List], patterns=None,
-                 custom_map_vars=None, exclude_path: Optional[Union[str, List]] = None):
+                 custom_map_vars=None, exclude_path: Optional[Union[str, List]] = None,
+                 max_file_size: Optional[int] = None, max_file_age_days: Optional[int] = None):
         super().__init__(api_client, base_path, patterns=patterns)
         if isinstance(dbfs_path, str):
             self.__dbfs_path_patterns = [dbfs_path]
@@ -57,26 +93,70 @@ class DbfsFileHCLGenerator(DownloaderAPIGenerator):
         self.__path_exclusion = PathExclusionParser(exclude_path, ResourceCatalog.DBFS_FILE_RESOURCE)
         self.__service = DbfsService(self.api_client)
         self.__custom_map_vars = custom_map_vars
+        self.__file_versions: Dict[str, Dict[str, Any]] = {}
+        self.__max_file_size = max_file_size
+        # Modification times in the listing are epoch milliseconds
+        self.__min_modification_time = int((time.time() - max_file_age_days * 24 * 60 * 60) * 1000) \
+            if max_file_age_days is not None else None
+        self.__for_each_partition = ForEachPartition.from_config()
 
     @property
     def folder_name(self) -> str:
         return GeneratorCatalog.DBFS_FILE
 
-    def __get_dbfs_file_data_recrusive(self, service: DbfsService, path):
+    def __should_list(self, path: str) -> bool:
+        # Folders are pruned before they are queued so that nothing under them is listed
+        if self.__path_exclusion.is_path_excluded(path) or self.__path_exclusion.is_subtree_excluded(path):
+            return False
+        if self.__path_inclusion.is_subtree_included(path) is False:
+            return False
+        if self._should_visit_path(path) is False:
+            log.debug(f"[PathPartition]: {path} is exported by another process.")
+            return False
+        return True
+
+    def __is_within_limits(self, file: Dict[str, Any]) -> bool:
+        # Only the listing is used so that skipped files are never fetched, unknown sizes and times are kept
+        file_size = file.get("file_size")
+        if self.__max_file_size is not None and file_size is not None and file_size > self.__max_file_size:
+            log.info(f"Skipping DBFS file: {file['path']} of {file_size} bytes which is larger than "
+                     f"{self.__max_file_size} bytes")
+            return False
+        modification_time = file.get("modification_time")
+        if self.__min_modification_time is not None and modification_time is not None \
+                and modification_time < self.__min_modification_time:
+            log.info(f"Skipping DBFS file: {file['path']} which was last modified before the max file age")
+            return False
+        return True
+
+    async def __get_dbfs_file_data_recrusive(self, service: AsyncService, path):
         # is the base path allowed
-        if self.__path_exclusion.is_path_excluded(path):
-            return []
-        resp = service.list(path)
+        if self.__should_list(path) is False:
+            return
+        prefetcher = ListingPrefetcher(service.list)
+        try:
+            async for item in self.__walk_dbfs_files(prefetcher, path):
+                yield item
+        finally:
+            prefetcher.close()
+
+    async def __walk_dbfs_files(self, prefetcher: ListingPrefetcher, path: str):
+        resp = await prefetcher.get(path)
         if "files" not in resp:
-            return []
-        files = resp["files"]
+            return
+        files = [file for file in resp["files"] if not self.__path_exclusion.is_path_excluded(file['path'])]
+        # Sibling folders are listed in parallel while the files are walked depth first in the listed order
+        folders = [file["path"] for file in files if file["is_dir"] is True and self.__should_list(file["path"])]
+        prefetcher.queue(folders)
+        folders = set(folders)
         for file in files:
-            if self.__path_exclusion.is_path_excluded(file['path']):
-                continue
             if file["is_dir"] is True:
-                log.info(f"Export DBFS folder:{file['path']}")
-                yield from self.__get_dbfs_file_data_recrusive(service, file["path"])
-            elif self.__path_inclusion.is_path_included(file['path']):
+                if file["path"] in folders:
+                    log.info(f"Export DBFS folder:{file['path']}")
+                    async for item in self.__walk_dbfs_files(prefetcher, file["path"]):
+                        yield item
+            elif self._is_path_owned(file['path']) and self._is_shard_owned(file['path']) \
+                    and self.__path_inclusion.is_path_included(file['path']) and self.__is_within_limits(file):
                 log.debug(f"Fetching data for file: {file['path']}")
                 yield file
 
@@ -85,7 +165,8 @@ class DbfsFileHCLGenerator(DownloaderAPIGenerator):
         for file in data:
             ret_files.append(DbfsFile(remote_path=data[file]["path"],
                                       local_path=self.get_local_download_path(self.__get_dbfs_identifier(data[file])),
-                                      service=self.__service))
+                                      service=self.__service,
+                                      version=self.__file_versions.get(data[file]["path"])))
         return ret_files
 
     def __get_dbfs_identifier(self, data: Dict[str, Any]) -> str:
@@ -95,9 +176,10 @@ class DbfsFileHCLGenerator(DownloaderAPIGenerator):
     def __get_dbfs_file_raw_id(data: Dict[str, Any]) -> str:
         return data["path"]
 
-    def __make_dbfs_file_dict(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return TerraformDictBuilder(ResourceCatalog.DBFS_FILE_RESOURCE). \
-            add_for_each(lambda: self.DBFS_FOREACH_VAR, get_members(DbfsFileSchema)). \
+    @staticmethod
+    def __make_dbfs_file_dict(for_each_var: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        return lambda x: TerraformDictBuilder(ResourceCatalog.DBFS_FILE_RESOURCE). \
+            add_for_each(lambda: for_each_var, get_members(DbfsFileSchema)). \
             to_dict()
 
     def __get_dbfs_file_dict(self, data: Dict[str, Any], normalize_dbfs_file_name: str) -> Dict[str, Any]:
@@ -107,34 +189,49 @@ class DbfsFileHCLGenerator(DownloaderAPIGenerator):
         }
 
     def __make_dbfs_file_data(self, dbfs_file_data: Dict[str, Any], dbfs_identifier: Callable[[Dict[str, str]], str],
+                              for_each_var: str, filter_func: Callable[[], bool],
                               for_each_var_id_name_pairs: List[Tuple[str, str]] = None):
         dbfs_data = self._create_data(
             ResourceCatalog.DBFS_FILE_RESOURCE,
             dbfs_file_data,
-            # TODO fix this when fixing match_patterns
-            lambda: any([self._match_patterns(d["path"]) for _, d in dbfs_file_data.items()]) is False,
+            filter_func,
             dbfs_identifier,
             dbfs_identifier,
-            self.__make_dbfs_file_dict,
+            self.__make_dbfs_file_dict(for_each_var),
             self.map_processors(self.__custom_map_vars)
         )
-        dbfs_data.upsert_local_variable(self.DBFS_FOREACH_VAR, dbfs_file_data)
+        if dbfs_data is None:
+            return None
+        dbfs_data.upsert_local_variable(for_each_var, dbfs_file_data)
         dbfs_data.add_for_each_var_name_pairs(for_each_var_id_name_pairs)
         return dbfs_data
 
     async def _generate(self) -> Generator[APIData, None, None]:
-        service = DbfsService(self.api_client)
-        # Dictionary to create one hcl json file with foreach for dbfs files
-        dbfs_files = {}
-        dbfs_files_id_name_pairs = []
+        service = AsyncService(DbfsService(self.api_client))
+        partition = self.__for_each_partition
+        # Dictionaries to create one hcl json file with foreach for dbfs files per partition
+        dbfs_files = {index: {} for index in partition.indexes()}
+        dbfs_files_id_name_pairs = {index: [] for index in partition.indexes()}
         for p in self.__dbfs_path:
-            for file in self.__get_dbfs_file_data_recrusive(service, p):
+            async for file in self.__get_dbfs_file_data_recrusive(service, p):
                 id_ = file['path']
-                dbfs_files[id_] = self.__get_dbfs_file_dict(file, self.__get_dbfs_identifier(file))
+                if file.get("modification_time") is not None:
+                    self.__file_versions[id_] = {"file_size": file.get("file_size"),
+                                                 "modification_time": file["modification_time"]}
+                index = partition.index(id_)
+                dbfs_files[index][id_] = self.__get_dbfs_file_dict(file, self.__get_dbfs_identifier(file))
                 # ID and name are same for files
-                dbfs_files_id_name_pairs.append((id_, id_))
+                dbfs_files_id_name_pairs[index].append((id_, id_))
 
-        if dbfs_files != {}:
-            yield self.__make_dbfs_file_data(dbfs_files,
-                                             lambda x: ForEachBaseIdentifierCatalog.DBFS_FILES_BASE_IDENTIFIER,
-                                             for_each_var_id_name_pairs=dbfs_files_id_name_pairs)
+        if any(files != {} for files in dbfs_files.values()):
+            # TODO fix this when fixing match_patterns
+            is_filtered = not any(self._match_patterns(d["path"]) for files in dbfs_files.values()
+                                  for d in files.values())
+            # Every partition is created, even empty ones, as clusters depend on all of them
+            for index in partition.indexes():
+                identifier = partition.name(ForEachBaseIdentifierCatalog.DBFS_FILES_BASE_IDENTIFIER, index)
+                yield self.__make_dbfs_file_data(dbfs_files[index],
+                                                 lambda x, identifier=identifier: identifier,
+                                                 partition.name(self.DBFS_FOREACH_VAR, index),
+                                                 lambda: is_filtered,
+                                                 for_each_var_id_name_pairs=dbfs_files_id_name_pairs[index])
@@ -5,6 +5,7 @@ import re
 
 from databricks_sync.sdk import generators
 from databricks_sync.sdk.pipeline import APIGenerator
+from databricks_sync.sdk.service.transport import HttpTransport
 
 
 class GeneratorFactory:
@@ -33,7 +34,9 @@ class GeneratorFactory:
                     generator_mapping[GeneratorFactory.process_class_name(obj.__name__)] = obj
         return cls(generator_mapping)
 
-    def make_generator(self, generator_name, data):
+    def make_generator(self, generator_name, data, http_transport: HttpTransport = None):
         if generator_name not in self.generator_map:
             raise KeyError(f"unable to find generator with name {generator_name}")
+        if http_transport is not None and data.get("api_client") is not None:
+            http_transport.bind(data["api_client"])
         return self.generator_map[generator_name](**data)
@@ -1,6 +1,6 @@
 from base64 import b64decode
 from pathlib import Path
-from typing import List, Generator, Dict, Any, Tuple, Callable
+from typing import List, Generator, Dict, Any, Tuple, Callable, Iterator
 
 from databricks_cli.sdk import ApiClient
 
@@ -8,12 +8,23 @@ from databricks_sync import log
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder
 from databricks_sync.sdk.message import Artifact, APIData
 from databricks_sync.sdk.pipeline import DownloaderAPIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService, download_budget
 from databricks_sync.sdk.service.global_init_scripts import GlobalInitScriptsService
 from databricks_sync.sdk.sync.constants import ResourceCatalog, get_members, GlobalInitScriptSchema, \
     ForEachBaseIdentifierCatalog, GeneratorCatalog
+from databricks_sync.sdk.sync.partition import ForEachPartition
 
 
 class GlobalInitScriptArtifact(Artifact):
+    # Global init scripts are limited to 64 KiB, their base64 encoding is reserved before they are fetched
+    MAX_ENCODED_SCRIPT_BYTES = 4 * (64 * 1024 + 2) // 3
+
+    def iter_content(self) -> Iterator[bytes]:
+        with download_budget.reserve(self.MAX_ENCODED_SCRIPT_BYTES) as reservation:
+            script = self.service.get_global_init_script(self.remote_path)["script"]
+            reservation.resize(len(script))
+            yield from self.iter_b64decode(script)
+
     def get_content(self):
         data = self.service.get_global_init_script(self.remote_path)
         return b64decode(data["script"].encode("utf-8"))
@@ -26,17 +37,19 @@ class GlobalInitScriptHCLGenerator(DownloaderAPIGenerator):
                  custom_map_vars=None):
         super().__init__(api_client, base_path, patterns=patterns)
         self.__service = GlobalInitScriptsService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
         self.__custom_map_vars = custom_map_vars or {}
+        self.__for_each_partition = ForEachPartition.from_config()
 
     @property
     def folder_name(self) -> str:
         return GeneratorCatalog.GLOBAL_INIT_SCRIPT
 
-    def _get_global_init_scripts(self):
-        resp = self.__service.list_global_init_scripts()
+    async def _get_global_init_scripts(self):
+        resp = await self.__async_service.list_global_init_scripts()
         log.info(f"Fetched all global init scripts")
         if "scripts" not in resp:
-            return []
+            return
         scripts = resp["scripts"]
         for script in scripts:
             yield script
@@ -63,13 +76,15 @@ class GlobalInitScriptHCLGenerator(DownloaderAPIGenerator):
     def __global_init_script_name(data: Dict[str, Any]) -> str:
         return data.get("name", None)
 
-    def __make_global_init_script_dict(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return TerraformDictBuilder(ResourceCatalog.GLOBAL_INIT_SCRIPTS_RESOURCE). \
-            add_for_each(lambda: self.GLOBAL_INIT_SCRIPTS_FOREACH_VAR, get_members(GlobalInitScriptSchema)). \
+    @staticmethod
+    def __make_global_init_script_dict(for_each_var: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        return lambda x: TerraformDictBuilder(ResourceCatalog.GLOBAL_INIT_SCRIPTS_RESOURCE). \
+            add_for_each(lambda: for_each_var, get_members(GlobalInitScriptSchema)). \
             to_dict()
 
     def __make_global_init_scripts_data(self, gis_data: Dict[str, Any],
                                         gis_identifier: Callable[[Dict[str, str]], str],
+                                        for_each_var: str,
                                         for_each_var_id_name_pairs: List[Tuple[str, str]] = None):
         gis_data_obj = self._create_data(
             ResourceCatalog.GLOBAL_INIT_SCRIPTS_RESOURCE,
@@ -78,10 +93,10 @@ class GlobalInitScriptHCLGenerator(DownloaderAPIGenerator):
             lambda: False,
             gis_identifier,
             gis_identifier,
-            self.__make_global_init_script_dict,
+            self.__make_global_init_script_dict(for_each_var),
             self.map_processors(self.__custom_map_vars)
         )
-        gis_data_obj.upsert_local_variable(self.GLOBAL_INIT_SCRIPTS_FOREACH_VAR, gis_data)
+        gis_data_obj.upsert_local_variable(for_each_var, gis_data)
         gis_data_obj.add_for_each_var_name_pairs(for_each_var_id_name_pairs)
         return gis_data_obj
 
@@ -94,17 +109,25 @@ class GlobalInitScriptHCLGenerator(DownloaderAPIGenerator):
         }
 
     async def _generate(self) -> Generator[APIData, None, None]:
-        global_init_scripts = {}
-        global_init_scripts_id_name_pairs = []
-        for script in self._get_global_init_scripts():
+        partition = self.__for_each_partition
+        global_init_scripts = {index: {} for index in partition.indexes()}
+        global_init_scripts_id_name_pairs = {index: [] for index in partition.indexes()}
+        async for script in self._get_global_init_scripts():
             id_ = script['script_id']
-            global_init_scripts[id_] = self.__get_global_init_script_dict(script,
-                                                                          self.__global_init_script_identifier(script))
+            if self._is_shard_owned(id_) is False:
+                continue
+            index = partition.index(id_)
+            global_init_scripts[index][id_] = self.__get_global_init_script_dict(
+                script, self.__global_init_script_identifier(script))
             # ID and name are same for files
-            global_init_scripts_id_name_pairs.append((id_, self.__global_init_script_name(script)))
-
-        if global_init_scripts != {}:
-            for_each_identifier = lambda x: ForEachBaseIdentifierCatalog.GLOBAL_INIT_SCRIPTS_BASE_IDENTIFIER
-            yield self.__make_global_init_scripts_data(global_init_scripts,
-                                                       for_each_identifier,
-                                                       for_each_var_id_name_pairs=global_init_scripts_id_name_pairs)
+            global_init_scripts_id_name_pairs[index].append((id_, self.__global_init_script_name(script)))
+
+        if any(scripts != {} for scripts in global_init_scripts.values()):
+            # Every partition is created, even empty ones, as clusters depend on all of them
+            for index in partition.indexes():
+                identifier = partition.name(ForEachBaseIdentifierCatalog.GLOBAL_INIT_SCRIPTS_BASE_IDENTIFIER, index)
+                yield self.__make_global_init_scripts_data(
+                    global_init_scripts[index],
+                    lambda x, identifier=identifier: identifier,
+                    partition.name(self.GLOBAL_INIT_SCRIPTS_FOREACH_VAR, index),
+                    for_each_var_id_name_pairs=global_init_scripts_id_name_pairs[index])
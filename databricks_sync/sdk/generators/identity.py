@@ -1,3 +1,4 @@
+import asyncio
 import functools
 from pathlib import Path
 from typing import Generator, Dict, Any, Callable, List, Tuple
@@ -9,10 +10,12 @@ from databricks_sync import log
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import APIData
 from databricks_sync.sdk.pipeline import APIGenerator
-from databricks_sync.sdk.service.scim import ScimService
+from databricks_sync.sdk.service.concurrency import AsyncService
+from databricks_sync.sdk.service.scim import ScimService, scim_users, list_scim_resources
 from databricks_sync.sdk.sync.constants import ResourceCatalog, CloudConstants, DefaultDatabricksGroups, \
     ForEachBaseIdentifierCatalog, UserSchema, get_members, GroupSchema, GroupInstanceProfileSchema, \
     UserInstanceProfileSchema, GroupMemberSchema, MeConstants, ServicePrincipalSchema, GeneratorCatalog
+from databricks_sync.sdk.sync.partition import ForEachPartition
 from databricks_sync.sdk.utils import normalize_identifier
 
 
@@ -37,8 +40,10 @@ class IdentityHCLGenerator(APIGenerator):
                  custom_map_vars=None, set_all_users_active=None):
         super().__init__(api_client, base_path, patterns=patterns)
         self.__custom_map_vars = custom_map_vars or {}
-        self.__service: ScimService = ScimService(self.api_client)
         self.__set_all_users_active = set_all_users_active
+        # Groups are looked up from the listing instead of being fetched for every user
+        self.__groups_by_id: Dict[str, Dict[str, Any]] = {}
+        self.__for_each_partition = ForEachPartition.from_config()
 
     @property
     def folder_name(self) -> str:
@@ -46,6 +51,7 @@ class IdentityHCLGenerator(APIGenerator):
 
     def __create_group_data(self, group_data: Dict[str, Any],
                             groups_identifier: Callable[[Dict[str, str]], str],
+                            for_each_var: str,
                             for_each_var_id_name_pairs: List[Tuple[str, str]] = None):
         gd = self._create_data(
             ResourceCatalog.GROUP_RESOURCE,
@@ -54,12 +60,12 @@ class IdentityHCLGenerator(APIGenerator):
             # lambda: any([self._match_patterns(d["display_name"]) for _, d in group_data.items()]) is False,
             groups_identifier,
             groups_identifier,
-            self.__make_group_dict,
+            self.__make_group_dict(for_each_var),
             self.map_processors(self.__custom_map_vars)
         )
         gd.add_for_each_var_name_pairs(for_each_var_id_name_pairs)
         # TODO normalize the keys here and interpolate the value
-        gd.upsert_local_variable(self.GROUPS_FOREACH_VAR, group_data)
+        gd.upsert_local_variable(for_each_var, group_data)
         return gd
 
     def __create_group_instance_profile_data(self, group_instance_profile_data: Dict[str, Any],
@@ -101,16 +107,18 @@ class IdentityHCLGenerator(APIGenerator):
 
     def __interpolate_scim_user_id(self, user_name):
         # Short circuit interpolation if it is "Me" as we are skipping this use
+        identifier = self.__for_each_partition.key_name(ForEachBaseIdentifierCatalog.USERS_BASE_IDENTIFIER, user_name)
         member_interpolation = Interpolate.resource(ResourceCatalog.USER_RESOURCE,
-                                                    f'{ForEachBaseIdentifierCatalog.USERS_BASE_IDENTIFIER}["{user_name}"]',
+                                                    f'{identifier}["{user_name}"]',
                                                     'id', wrap_json_syntax=False)
         return Interpolate.ternary(f'"{user_name}" == {MeConstants.USERNAME_VAR}', '"something temp will be skipped"',
                                    member_interpolation)
 
     def __interpolate_service_principal_id(self, service_principal_id):
+        identifier = self.__for_each_partition.key_name(ForEachBaseIdentifierCatalog.SERVICE_PRINCIPALS_BASE_IDENTIFIER,
+                                                        service_principal_id)
         return Interpolate.resource(ResourceCatalog.SERVICE_PRINCIPAL_RESOURCE,
-                                    f'{ForEachBaseIdentifierCatalog.SERVICE_PRINCIPALS_BASE_IDENTIFIER}'
-                                    f'["{service_principal_id}"]',
+                                    f'{identifier}["{service_principal_id}"]',
                                     'id')
 
     def __interpolate_scim_group_id(self, group_name):
@@ -123,13 +131,15 @@ class IdentityHCLGenerator(APIGenerator):
                                            DefaultDatabricksGroups.USERS_DATA_SOURCE_IDENTIFIER,
                                            DefaultDatabricksGroups.DATA_SOURCE_ID_ATTRIBUTE)
 
+        group_id = normalize_identifier(group_name)
+        identifier = self.__for_each_partition.key_name(ForEachBaseIdentifierCatalog.GROUPS_BASE_IDENTIFIER, group_id)
         return Interpolate.resource(ResourceCatalog.GROUP_RESOURCE,
-                                    f'{ForEachBaseIdentifierCatalog.GROUPS_BASE_IDENTIFIER}'
-                                    f'["{normalize_identifier(group_name)}"]',
+                                    f'{identifier}["{group_id}"]',
                                     'id')
 
     def __create_service_principal_data(self, sp_data: Dict[str, Any],
                                         sp_identifier: Callable[[Dict[str, str]], str],
+                                        for_each_var: str,
                                         for_each_var_id_name_pairs: List[Tuple[str, str]] = None):
         spd = self._create_data(
             ResourceCatalog.SERVICE_PRINCIPAL_RESOURCE,
@@ -137,32 +147,37 @@ class IdentityHCLGenerator(APIGenerator):
             lambda: False,
             sp_identifier,
             sp_identifier,
-            self.__make_service_principal_dict,
+            self.__make_service_principal_dict(for_each_var),
             self.map_processors(self.__custom_map_vars)
         )
         spd.add_for_each_var_name_pairs(for_each_var_id_name_pairs)
-        spd.upsert_local_variable(self.SERVICE_PRINCIPALS_FOREACH_VAR, sp_data)
+        spd.upsert_local_variable(for_each_var, sp_data)
         return spd
 
-    def __make_service_principal_dict(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return TerraformDictBuilder(ResourceCatalog.USER_RESOURCE). \
-            add_for_each(lambda: self.SERVICE_PRINCIPALS_FOREACH_VAR, get_members(ServicePrincipalSchema)). \
+    @staticmethod
+    def __make_service_principal_dict(for_each_var: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        return lambda x: TerraformDictBuilder(ResourceCatalog.USER_RESOURCE). \
+            add_for_each(lambda: for_each_var, get_members(ServicePrincipalSchema)). \
             to_dict()
 
     def __create_user_data(self, user_data: Dict[str, Any],
                            user_identifier: Callable[[Dict[str, str]], str],
+                           for_each_var: str,
+                           filter_func: Callable[[], bool],
                            for_each_var_id_name_pairs: List[Tuple[str, str]] = None):
         ud = self._create_data(
             ResourceCatalog.USER_RESOURCE,
             user_data,
-            lambda: any([self._match_patterns(d["user_name"]) for _, d in user_data.items()]) is False,
+            filter_func,
             user_identifier,
             user_identifier,
-            self.__make_user_dict,
+            self.__make_user_dict(for_each_var),
             self.map_processors(self.__custom_map_vars)
         )
+        if ud is None:
+            return None
         ud.add_for_each_var_name_pairs(for_each_var_id_name_pairs)
-        ud.upsert_local_variable(self.USERS_FOREACH_VAR, user_data)
+        ud.upsert_local_variable(for_each_var, user_data)
         return ud
 
     def __create_failed_instance_profile_data(self, display_name: str, arn: str, resource_type: str, err_msg: str):
@@ -201,9 +216,10 @@ class IdentityHCLGenerator(APIGenerator):
                                    user_instance_profile_data)
         return uipd
 
-    def __make_user_dict(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return TerraformDictBuilder(ResourceCatalog.USER_RESOURCE). \
-            add_for_each(lambda: skip_me(self.USERS_FOREACH_VAR), get_members(UserSchema), just_local=False). \
+    @staticmethod
+    def __make_user_dict(for_each_var: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        return lambda x: TerraformDictBuilder(ResourceCatalog.USER_RESOURCE). \
+            add_for_each(lambda: skip_me(for_each_var), get_members(UserSchema), just_local=False). \
             to_dict()
 
     def __make_user_instance_profile_dict(self, user_name: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
@@ -212,9 +228,10 @@ class IdentityHCLGenerator(APIGenerator):
                          get_members(UserInstanceProfileSchema), just_local=False). \
             to_dict()
 
-    def __make_group_dict(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return TerraformDictBuilder(ResourceCatalog.GROUP_RESOURCE). \
-            add_for_each(lambda: self.GROUPS_FOREACH_VAR, get_members(GroupSchema)). \
+    @staticmethod
+    def __make_group_dict(for_each_var: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        return lambda x: TerraformDictBuilder(ResourceCatalog.GROUP_RESOURCE). \
+            add_for_each(lambda: for_each_var, get_members(GroupSchema)). \
             to_dict()
 
     def __make_group_instance_profile_dict(self, group_instance_profile_id: str) -> Callable[
@@ -232,9 +249,7 @@ class IdentityHCLGenerator(APIGenerator):
 
     @functools.lru_cache(maxsize=False)
     def _group_users_roles(self):
-        groups = self.__service.list_groups()
-        groups_data = groups["Resources"]
-        for group in groups_data:
+        for group in self.__groups_by_id.values():
             if group.get("displayName", None) == "users":
                 if group.get("roles", None) is None:
                     return []
@@ -246,7 +261,7 @@ class IdentityHCLGenerator(APIGenerator):
     def _does_group_have_profile(self, group_id, profile_arn) -> bool:
         if group_id is None:
             return False
-        group = self.__service.get_group_by_id(group_id)
+        group = self.__groups_by_id.get(group_id, None)
         if group is None:
             return False
         result = profile_arn in [role.get("value", None) for role in group.get("roles", [{}])]
@@ -433,39 +448,50 @@ class IdentityHCLGenerator(APIGenerator):
             GroupSchema.ALLOW_INSTANCE_POOL_CREATE: allow_instance_pool_create,
         }
 
-    async def _generate(self) -> Generator[APIData, None, None]:
-        # used to look up the users
-        user_lookup_dict = {}
-        service_principal_lookup_dict = {}
-        service = ScimService(self.api_client)
-
-        # requires upfront memory
-        users = service.list_users().get("Resources", [])
-        groups = service.list_groups().get("Resources", [])
+    @staticmethod
+    async def _list_service_principals(service: AsyncService):
         try:
-            service_principals = service.list_service_principals().get("Resources", [])
+            return await list_scim_resources(service.list_service_principals,
+                                             ScimService.SERVICE_PRINCIPAL_ATTRIBUTES)
         except requests.HTTPError as he:
             if he.response.status_code == 405 and "Method Not Allowed" in he.response.text:
                 log.error("Have to skip service principals due to being disabled in your deployment.")
-                service_principals = []
             else:
                 log.error("Service principals failed to be retrieved unknown reason. Please investigate.")
-                service_principals = []
+            return []
 
-        # Dictionary to create one hcl json file with foreach for groups and users
-        user_data = {}
-        groups_data = {}
-        service_principals_data = {}
+    async def _generate(self) -> Generator[APIData, None, None]:
+        # used to look up the users
+        user_lookup_dict = {}
+        service_principal_lookup_dict = {}
+        service = AsyncService(ScimService(self.api_client))
+
+        # requires upfront memory, the three listings are paginated and fetched concurrently
+        users, groups, service_principals = await asyncio.gather(
+            scim_users.get(self.api_client),
+            list_scim_resources(service.list_groups, ScimService.GROUP_ATTRIBUTES),
+            self._list_service_principals(service)
+        )
+        self.__groups_by_id = {group["id"]: group for group in groups}
 
-        user_for_each_var_id_name_pairs = []
-        sp_for_each_var_id_name_pairs = []
-        group_for_each_var_id_name_pairs = []
+        partition = self.__for_each_partition
+        # Dictionaries to create one hcl json file with foreach for groups and users per partition
+        user_data = {index: {} for index in partition.indexes()}
+        groups_data = {index: {} for index in partition.indexes()}
+        service_principals_data = {index: {} for index in partition.indexes()}
+
+        user_for_each_var_id_name_pairs = {index: [] for index in partition.indexes()}
+        sp_for_each_var_id_name_pairs = {index: [] for index in partition.indexes()}
+        group_for_each_var_id_name_pairs = {index: [] for index in partition.indexes()}
 
         for user in users:
             id_ = user['userName']
-            user_data[id_] = self.get_user_dict(user)
             user_lookup_dict[user["id"]] = user
-            user_for_each_var_id_name_pairs.append((user["id"], user["userName"]))
+            # Every user is kept in the lookup as group members of this shard can be owned by other shards
+            if self._is_shard_owned(user["id"]) is False:
+                continue
+            user_data[partition.index(id_)][id_] = self.get_user_dict(user)
+            user_for_each_var_id_name_pairs[partition.index(id_)].append((user["id"], user["userName"]))
 
             user_instance_profiles, errored_arns = self.get_user_instance_profiles(user)
             if user_instance_profiles is not None:
@@ -474,25 +500,43 @@ class IdentityHCLGenerator(APIGenerator):
             for errored_arn in errored_arns:
                 yield errored_arn
 
-        yield self.__create_user_data(user_data, lambda x: ForEachBaseIdentifierCatalog.USERS_BASE_IDENTIFIER,
-                                      for_each_var_id_name_pairs=user_for_each_var_id_name_pairs)
+        # Users are filtered by their patterns so there is nothing to export without any users (i.e. in a shard)
+        if any(users_data != {} for users_data in user_data.values()):
+            is_filtered = not any(self._match_patterns(d["user_name"]) for users_data in user_data.values()
+                                  for d in users_data.values())
+            # Every partition is created, even empty ones, as permissions depend on all of them
+            for index in partition.indexes():
+                identifier = partition.name(ForEachBaseIdentifierCatalog.USERS_BASE_IDENTIFIER, index)
+                yield self.__create_user_data(user_data[index], lambda x, identifier=identifier: identifier,
+                                              partition.name(self.USERS_FOREACH_VAR, index),
+                                              lambda: is_filtered,
+                                              for_each_var_id_name_pairs=user_for_each_var_id_name_pairs[index])
 
         for service_principal in service_principals:
             id_ = service_principal['applicationId']
-            service_principals_data[id_] = self.get_service_principal_dict(service_principal)
             service_principal_lookup_dict[service_principal["id"]] = service_principal
-            sp_for_each_var_id_name_pairs.append((service_principal["id"], service_principal['applicationId']))
-
-        yield self.__create_service_principal_data(service_principals_data,
-                                                   lambda
-                                                       x: ForEachBaseIdentifierCatalog.SERVICE_PRINCIPALS_BASE_IDENTIFIER,
-                                                   for_each_var_id_name_pairs=sp_for_each_var_id_name_pairs)
+            if self._is_shard_owned(service_principal["id"]) is False:
+                continue
+            service_principals_data[partition.index(id_)][id_] = self.get_service_principal_dict(service_principal)
+            sp_for_each_var_id_name_pairs[partition.index(id_)].append(
+                (service_principal["id"], service_principal['applicationId']))
+
+        if any(sps_data != {} for sps_data in service_principals_data.values()) or self._is_first_shard():
+            for index in partition.indexes():
+                identifier = partition.name(ForEachBaseIdentifierCatalog.SERVICE_PRINCIPALS_BASE_IDENTIFIER, index)
+                yield self.__create_service_principal_data(
+                    service_principals_data[index],
+                    lambda x, identifier=identifier: identifier,
+                    partition.name(self.SERVICE_PRINCIPALS_FOREACH_VAR, index),
+                    for_each_var_id_name_pairs=sp_for_each_var_id_name_pairs[index])
 
         for group in groups:
+            if self._is_shard_owned(group["id"]) is False:
+                continue
             id_ = normalize_identifier(group["displayName"])
             if id_ not in self.DEFAULTED_GROUPS:
-                groups_data[id_] = self.get_group_dict(group)
-                group_for_each_var_id_name_pairs.append((group["id"], group["displayName"]))
+                groups_data[partition.index(id_)][id_] = self.get_group_dict(group)
+                group_for_each_var_id_name_pairs[partition.index(id_)].append((group["id"], group["displayName"]))
 
             # generate instance profiles and members
             group_name = normalize_identifier(group['displayName'])
@@ -510,5 +554,9 @@ class IdentityHCLGenerator(APIGenerator):
                     yield members
 
         # return the groups
-        yield self.__create_group_data(groups_data, lambda x: ForEachBaseIdentifierCatalog.GROUPS_BASE_IDENTIFIER,
-                                       for_each_var_id_name_pairs=group_for_each_var_id_name_pairs)
+        if any(group_data != {} for group_data in groups_data.values()) or self._is_first_shard():
+            for index in partition.indexes():
+                identifier = partition.name(ForEachBaseIdentifierCatalog.GROUPS_BASE_IDENTIFIER, index)
+                yield self.__create_group_data(groups_data[index], lambda x, identifier=identifier: identifier,
+                                               partition.name(self.GROUPS_FOREACH_VAR, index),
+                                               for_each_var_id_name_pairs=group_for_each_var_id_name_pairs[index])
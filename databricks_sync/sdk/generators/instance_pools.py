@@ -8,6 +8,7 @@ from databricks_sync.sdk.generators.permissions import PermissionsHelper, NoDire
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import APIData
 from databricks_sync.sdk.pipeline import APIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService
 from databricks_sync.sdk.sync.constants import ResourceCatalog, CloudConstants, DrConstants, GeneratorCatalog
 
 
@@ -21,6 +22,7 @@ class InstancePoolHCLGenerator(APIGenerator):
                                    "dynamic.[*].disk_spec.content.disk_type.azure_disk_volume_type": None}
         self.__custom_map_vars = {**default_custom_map_vars, **(custom_map_vars or {})}
         self.__service = InstancePoolService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
         self.__perms = PermissionsHelper(self.api_client)
 
     @staticmethod
@@ -47,8 +49,10 @@ class InstancePoolHCLGenerator(APIGenerator):
         )
 
     async def _generate(self) -> Generator[APIData, None, None]:
-        instance_pools = self.__service.list_instance_pools().get("instance_pools", [])
+        instance_pools = (await self.__async_service.list_instance_pools()).get("instance_pools", [])
         for instance_pool in instance_pools:
+            if self._is_shard_owned(instance_pool["instance_pool_id"]) is False:
+                continue
             # due to Azure limitation we have to setup enable_elastic_disk to True
             #  see https://docs.microsoft.com/en-us/azure/databricks/dev-tools/api/latest/clusters
             instance_pool["enable_elastic_disk"] = True
@@ -57,8 +61,8 @@ class InstancePoolHCLGenerator(APIGenerator):
 
             yield instance_pools_data
             try:
-                yield self.__perms.create_permission_data(instance_pools_data, self.get_local_hcl_path,
-                                                          self.get_relative_hcl_path)
+                yield await self.__perms.create_permission_data_async(instance_pools_data, self.get_local_hcl_path,
+                                                                      self.get_relative_hcl_path)
             except NoDirectPermissionsError:
                 pass
 
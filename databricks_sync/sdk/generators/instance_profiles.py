@@ -6,6 +6,7 @@ from databricks_cli.sdk import ApiClient
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder
 from databricks_sync.sdk.message import APIData
 from databricks_sync.sdk.pipeline import APIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService
 from databricks_sync.sdk.service.instace_profiles import InstanceProfilesService
 from databricks_sync.sdk.sync.constants import CloudConstants, ForEachBaseIdentifierCatalog, \
     InstanceProfileSchema, get_members, GeneratorCatalog
@@ -20,6 +21,7 @@ class InstanceProfileHCLGenerator(APIGenerator):
         super().__init__(api_client, base_path, patterns=patterns)
         self.__custom_map_vars = custom_map_vars
         self.__service = InstanceProfilesService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
 
     def __create_instance_profile_data(self, instance_profile_data: Dict[str, Any],
                                        instance_profile_identifier: Callable[[Dict[str, str]], str],
@@ -39,19 +41,22 @@ class InstanceProfileHCLGenerator(APIGenerator):
         return ipd
 
     async def _generate(self) -> Generator[APIData, None, None]:
-        profiles = self.__service.list_instance_profiles()
+        profiles = await self.__async_service.list_instance_profiles()
         instance_profiles_data = {}
         instance_profiles_id_name_pairs = []
         for profile in profiles.get("instance_profiles", []):
             id_ = profile["instance_profile_arn"]
+            if self._is_shard_owned(id_) is False:
+                continue
             this_instance_profile_data = {
                 InstanceProfileSchema.INSTANCE_PROFILE_ARN: id_,
             }
             instance_profiles_data[id_] = this_instance_profile_data
             instance_profiles_id_name_pairs.append((id_, id_))
-        yield self.__create_instance_profile_data(instance_profiles_data, lambda x:
-                                                  ForEachBaseIdentifierCatalog.INSTANCE_PROFILES_BASE_IDENTIFIER,
-                                                  for_each_var_id_name_pairs=instance_profiles_id_name_pairs)
+        if instance_profiles_data != {} or self._is_first_shard():
+            yield self.__create_instance_profile_data(instance_profiles_data, lambda x:
+                                                      ForEachBaseIdentifierCatalog.INSTANCE_PROFILES_BASE_IDENTIFIER,
+                                                      for_each_var_id_name_pairs=instance_profiles_id_name_pairs)
 
     @property
     def folder_name(self) -> str:
@@ -1,15 +1,21 @@
+import asyncio
+import collections
 from pathlib import Path
 from typing import Generator, Dict, Any
 
+import requests
 from databricks_cli.sdk import ApiClient
 from databricks_cli.sdk import JobsService
 
+from databricks_sync import log
 from databricks_sync.sdk.generators import drop_all_but, LocalFilterBy
 from databricks_sync.sdk.generators.clusters import ClusterHCLGenerator
 from databricks_sync.sdk.generators.permissions import PermissionsHelper, NoDirectPermissionsError
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import APIData
 from databricks_sync.sdk.pipeline import APIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService
+from databricks_sync.sdk.service.jobs import Jobs21Service
 from databricks_sync.sdk.sync.constants import ResourceCatalog, CloudConstants, DrConstants, GeneratorCatalog
 from databricks_sync.sdk.utils import normalize_identifier
 
@@ -19,6 +25,8 @@ class JobWorkflowTaskCountError(Exception):
 
 
 class JobHCLGenerator(APIGenerator):
+    MAX_PREFETCH_PAGES = 4
+    MAX_RELISTS = 3
 
     def __init__(self, api_client: ApiClient, base_path: Path, patterns=None,
                  custom_map_vars=None, convert_existing_cluster_to_var=False,
@@ -31,6 +39,8 @@ class JobHCLGenerator(APIGenerator):
                                    "new_cluster.driver_node_type_id": None}
         self.__custom_map_vars = {**default_custom_map_vars, **(custom_map_vars or {})}
         self.__service = JobsService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
+        self.__async_jobs_21_service = AsyncService(Jobs21Service(self.api_client))
         self.__perms = PermissionsHelper(self.api_client)
         self.__convert_existing_cluster_to_var = convert_existing_cluster_to_var
         self.__convert_new_cluster_instance_pool_to_var = convert_new_cluster_instance_pool_to_var
@@ -76,17 +86,97 @@ class JobHCLGenerator(APIGenerator):
 
         return data
 
-    async def _generate(self) -> Generator[APIData, None, None]:
-        jobs = self.__service.list_jobs().get("jobs", [])
+    def __is_exported(self, job: Dict[str, Any]) -> bool:
+        # Jobs are filtered on the listing before any request is made for them
+        return self.__local_filter_by.is_in_criteria(job) and self._is_shard_owned(job["job_id"]) \
+            and self._match_patterns(self.__get_job_name(job) or "")
+
+    def __prefetch_permissions(self, jobs):
+        # Permissions of the listed jobs are fetched while the jobs before them are exported
+        for job in filter(self.__is_exported, jobs):
+            self.__perms.prefetch_permissions(ResourceCatalog.JOB_RESOURCE, self.__get_job_raw_id(job))
+
+    async def __list_expanded_job_pages(self):
+        # Pages are at fixed offsets so once there is more than one page the next pages are listed while the current
+        # one is exported. Every page starts with the last job of the page before it to tell if the offsets shifted.
+        offset = 0
+        prefetch_pages = 1
+        pages = collections.deque()
+        try:
+            while True:
+                while len(pages) < prefetch_pages:
+                    pages.append(asyncio.ensure_future(self.__async_jobs_21_service.list_jobs(
+                        offset=offset, limit=Jobs21Service.MAX_PAGE_SIZE, expand_tasks=True)))
+                    offset += Jobs21Service.MAX_PAGE_SIZE - 1
+                resp = await pages.popleft()
+                yield resp
+                if resp.get("has_more", False) is False:
+                    return
+                prefetch_pages = self.MAX_PREFETCH_PAGES
+        finally:
+            for page in pages:
+                page.cancel()
+
+    async def __list_expanded_jobs(self):
+        seen_job_ids = set()
+        relists = 0
+        while True:
+            shifted = False
+            last_job_id = None
+            pages = self.__list_expanded_job_pages()
+            try:
+                async for resp in pages:
+                    jobs = resp.get("jobs", [])
+                    # Jobs deleted while listing shift the next pages back and the jobs on the boundary are skipped
+                    if last_job_id is not None and (len(jobs) == 0 or jobs[0]["job_id"] != last_job_id):
+                        shifted = True
+                        break
+                    last_job_id = jobs[-1]["job_id"] if len(jobs) > 0 else None
+                    # Jobs created while listing shift the offsets of the next pages forward
+                    jobs = [job for job in jobs if job["job_id"] not in seen_job_ids]
+                    seen_job_ids.update(job["job_id"] for job in jobs)
+                    self.__prefetch_permissions(jobs)
+                    for job in jobs:
+                        yield job
+            finally:
+                await pages.aclose()
+            if shifted is False:
+                return
+            if relists >= self.MAX_RELISTS:
+                log.warning(f"Jobs keep changing while they are listed, jobs which moved between the pages of the "
+                            f"listing may be missing from the export after {relists} attempts to list them again")
+                return
+            relists += 1
+            log.warning("Jobs were deleted while they were listed, listing all the jobs again to find the jobs on the "
+                        "shifted pages")
+
+    async def __list_jobs(self):
+        try:
+            first_job = True
+            async for job in self.__list_expanded_jobs():
+                first_job = False
+                yield job
+            return
+        except requests.exceptions.HTTPError as e:
+            if first_job is False:
+                raise
+            log.info(f"Unable to list jobs with the 2.1 api, fetching every job with the 2.0 api instead. Error: {e}")
+        jobs = (await self.__async_service.list_jobs()).get("jobs", [])
+        for job in self.__perms.iter_prefetched(ResourceCatalog.JOB_RESOURCE, filter(self.__is_exported, jobs),
+                                                self.__get_job_raw_id):
+            # Patch for tasks feature to show up
+            yield await self.__async_service.get_job(job["job_id"])
 
+    async def _generate(self) -> Generator[APIData, None, None]:
         # TODO: This shouldnt be aws jobs, there is no gurantee that all jobs are aws.
-        for job in filter(self.__local_filter_by.is_in_criteria, jobs):
-            # Patch for tasks feature to show up
-            databricks_job = self.__service.get_job(job["job_id"])
+        async for databricks_job in self.__list_jobs():
+            if self.__is_exported(databricks_job) is False:
+                continue
             job_data = self.__create_job_data(databricks_job)
             yield job_data
             try:
-                yield self.__perms.create_permission_data(job_data, self.get_local_hcl_path, self.get_relative_hcl_path)
+                yield await self.__perms.create_permission_data_async(job_data, self.get_local_hcl_path,
+                                                                      self.get_relative_hcl_path)
             except NoDirectPermissionsError:
                 pass
 
@@ -1,8 +1,14 @@
-import functools
+import asyncio
+import collections
+import concurrent.futures
+import io
+import threading
+import zipfile
 from base64 import b64decode
 from pathlib import Path, PurePosixPath
-from typing import List, Generator, Dict, Any, Union, Optional
+from typing import List, Generator, Dict, Any, Union, Optional, Iterator, Awaitable, Set, Tuple
 
+import requests
 from databricks_cli.sdk import WorkspaceService, ApiClient
 from databricks_cli.workspace.api import WorkspaceFileInfo
 
@@ -12,26 +18,157 @@ from databricks_sync.sdk.generators.permissions import PermissionsHelper, NoDire
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import Artifact, APIData
 from databricks_sync.sdk.pipeline import DownloaderAPIGenerator
-from databricks_sync.sdk.service.scim import ScimService
+from databricks_sync.sdk.service.concurrency import AsyncService, ListingPrefetcher, download_budget
+from databricks_sync.sdk.service.scim import scim_users
 from databricks_sync.sdk.sync.constants import ResourceCatalog, GeneratorCatalog
 from databricks_sync.sdk.utils import normalize_identifier
 
+# A notebook in an exported directory archive
+ArchiveEntry = Tuple[zipfile.ZipFile, zipfile.ZipInfo]
+
+
+class NotebookArchives:
+    """
+    Exports whole directories of notebooks as source zip archives in one request each and serves the notebooks out of
+    them. A notebook is read from the archive of its shallowest parent directory below the exported base path which
+    can be exported. Directories which fail to export (i.e. above the export size limit of the api) are not tried
+    again and their sub directories are tried instead, notebooks which are in no exportable directory are exported one
+    by one. The notebooks are walked depth first so only the most recently used archives are kept in memory. Archives
+    are kept compressed and a notebook is only extracted once its size is reserved from the download budget.
+    """
+    MAX_CACHED_ARCHIVES = 4
+
+    def __init__(self, service: WorkspaceService, base_paths: List[str]):
+        self.__service = service
+        self.__base_paths = sorted([PurePosixPath(base_path) for base_path in base_paths],
+                                   key=lambda base_path: len(base_path.parts), reverse=True)
+        self.__archives: collections.OrderedDict = collections.OrderedDict()
+        self.__failed_directories = set()
+        self.__lock = threading.Lock()
+
+    def __get_directories(self, path: PurePosixPath) -> List[PurePosixPath]:
+        base_path = next((base_path for base_path in self.__base_paths
+                          if base_path == path or base_path in path.parents), None)
+        if base_path is None:
+            return []
+        # Archives of a base path would include what other processes, exclusions or the root owner export
+        return [parent for parent in reversed(path.parents) if base_path in parent.parents]
+
+    def __export_archive(self, directory: PurePosixPath) -> Optional[Dict[str, ArchiveEntry]]:
+        try:
+            data = self.__service.export_workspace(str(directory), format="SOURCE")
+            archive = zipfile.ZipFile(io.BytesIO(b64decode(data["content"])))
+            log.info(f"Exported notebook archive of directory: {directory}")
+        except (requests.exceptions.HTTPError, KeyError, zipfile.BadZipFile) as e:
+            log.info(f"Unable to export notebook archive of directory: {directory}, exporting its sub directories "
+                     f"instead. Error: {e}")
+            return None
+        # Archives are rooted at the exported directory and the notebooks carry the extension of their language
+        notebooks = {}
+        for info in archive.infolist():
+            if not info.is_dir():
+                notebooks[str(PurePosixPath(info.filename).with_suffix(""))] = (archive, info)
+        return notebooks
+
+    def __get_archive(self, directory: PurePosixPath) -> Optional[Dict[str, ArchiveEntry]]:
+        with self.__lock:
+            if directory in self.__failed_directories:
+                return None
+            archive = self.__archives.get(directory)
+            if archive is None:
+                archive = concurrent.futures.Future()
+                self.__archives[directory] = archive
+                exporting = True
+            else:
+                exporting = False
+            self.__archives.move_to_end(directory)
+            while len(self.__archives) > self.MAX_CACHED_ARCHIVES:
+                self.__archives.popitem(last=False)
+        if exporting is True:
+            try:
+                notebooks = self.__export_archive(directory)
+            except Exception as e:
+                # Threads waiting for the archive fail the same way, the next notebook tries to export it again
+                with self.__lock:
+                    self.__archives.pop(directory, None)
+                archive.set_exception(e)
+                raise
+            if notebooks is None:
+                with self.__lock:
+                    self.__failed_directories.add(directory)
+                    self.__archives.pop(directory, None)
+            archive.set_result(notebooks)
+        return archive.result()
+
+    def get_entry(self, notebook_path: str) -> Optional[ArchiveEntry]:
+        path = PurePosixPath(notebook_path)
+        for directory in self.__get_directories(path):
+            notebooks = self.__get_archive(directory)
+            if notebooks is None:
+                continue
+            relative_path = str(path.relative_to(directory))
+            entry = notebooks.get(relative_path, notebooks.get(f"{directory.name}/{relative_path}"))
+            if entry is not None:
+                return entry
+            # Notebooks created after the archive was exported
+            break
+        return None
+
+    def get_content(self, notebook_path: str) -> Optional[bytes]:
+        entry = self.get_entry(notebook_path)
+        if entry is None:
+            return None
+        archive, info = entry
+        return archive.read(info)
+
 
 class NotebookArtifact(Artifact):
 
-    def get_content(self):
+    def __init__(self, remote_path, local_path: Path, service, version: Optional[Dict[str, Any]] = None,
+                 archives: Optional[NotebookArchives] = None):
+        super().__init__(remote_path, local_path, service, version=version)
+        self.archives = archives
+
+    def __export(self) -> str:
         data = self.service.export_workspace(self.remote_path, format="SOURCE")
         if "content" not in data:
             log.error(f"Unable to find content for file {self.remote_path}")
             raise FileNotFoundError(f"Unable to find content for notebook in {self.remote_path}")
-        return b64decode(data["content"].encode("utf-8"))
+        return data["content"]
+
+    def __get_archived_content(self) -> Optional[bytes]:
+        if self.archives is None:
+            return None
+        return self.archives.get_content(self.remote_path)
+
+    def iter_content(self) -> Iterator[bytes]:
+        entry = self.archives.get_entry(self.remote_path) if self.archives is not None else None
+        if entry is not None:
+            archive, info = entry
+            # The archive knows the size of the notebook so it is reserved before the notebook is extracted
+            with download_budget.reserve(info.file_size):
+                yield archive.read(info)
+            return
+        # The encoded payload is held until it is written, it is decoded one chunk at a time
+        with download_budget.reserve(self.ESTIMATED_CONTENT_BYTES) as reservation:
+            content = self.__export()
+            reservation.resize(len(content))
+            yield from self.iter_b64decode(content)
+
+    def get_content(self):
+        archived_content = self.__get_archived_content()
+        if archived_content is not None:
+            return archived_content
+        return b64decode(self.__export().encode("utf-8"))
 
 
 class NotebookHCLGenerator(DownloaderAPIGenerator):
+    # Notebooks of the folder being walked whose permissions are requested ahead of their export
+    MAX_PREFETCH_PERMISSIONS = PermissionsHelper.MAX_PREFETCH_PERMISSIONS
 
     def __init__(self, api_client: ApiClient, base_path: Path, notebook_path: Union[str, List], patterns=None,
                  custom_map_vars=None, exclude_path: Optional[Union[str, List]] = None,
-                 exclude_deleted_users: bool = False):
+                 exclude_deleted_users: bool = False, bulk_export: bool = False):
         super().__init__(api_client, base_path, patterns=patterns)
 
         if isinstance(notebook_path, str):
@@ -41,13 +178,18 @@ class NotebookHCLGenerator(DownloaderAPIGenerator):
         self.__path_inclusion = PathInclusionParser(self.__notebook_path_patterns,
                                                     ResourceCatalog.NOTEBOOK_RESOURCE)
         self.__notebook_path = self.__path_inclusion.base_paths
-        self.__scim_service = ScimService(self.api_client)
         self.__service = WorkspaceService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
         self.__custom_map_vars = custom_map_vars or {}
         self.__perms = PermissionsHelper(self.api_client)
         self.__folder_set = {}
+        # Listings of the folders being walked and the folders to export permissions for, keyed by path
+        self.__listed_folders: Dict[str, Dict[str, Any]] = {}
+        self.__folders: Dict[str, asyncio.Future] = {}
         self.__path_exclusion = PathExclusionParser(exclude_path, ResourceCatalog.NOTEBOOK_RESOURCE)
         self.__exclude_deleted_users = exclude_deleted_users
+        self.__valid_user_paths: Optional[Set[str]] = None
+        self.__archives = NotebookArchives(self.__service, self.__notebook_path) if bulk_export is True else None
 
     @property
     def folder_name(self) -> str:
@@ -66,10 +208,12 @@ class NotebookHCLGenerator(DownloaderAPIGenerator):
             log.debug(f"Not processing folder: {path} due to being processed already")
             return True
 
-    @functools.lru_cache(maxsize=None)
-    def _get_valid_user_paths(self):
-        users = self.__scim_service.list_users().get("Resources", [])
-        return [f"/Users/{user['userName']}" for user in users]
+    async def _get_valid_user_paths(self) -> Set[str]:
+        # The users are shared with the identity export and loaded before any user folder is visited
+        if self.__valid_user_paths is None:
+            users = await scim_users.get(self.api_client)
+            self.__valid_user_paths = {f"/Users/{user['userName']}" for user in users}
+        return self.__valid_user_paths
 
     def _is_valid_user_path(self, path: str) -> bool:
         # Feature is disabled and move on
@@ -81,35 +225,114 @@ class NotebookHCLGenerator(DownloaderAPIGenerator):
         # if it is just /Users or /Users/ move on
         if path == "/Users" or path == "/Users/":
             return True
-        valid_user_paths = self._get_valid_user_paths()
-        if any([path.startswith(user_path) for user_path in valid_user_paths]):
-            return True
-
-        return False
-
-    def _get_notebooks_recursive(self, path: str):
-        resp = self.__service.list(path)
-        if self.__path_exclusion.is_path_excluded(path):
-            return [], []
+        # Only the home folder of the path, /Users/<name>, is looked up
+        user_path = "/".join(path.split("/", 3)[:3])
+        return user_path in self.__valid_user_paths
+
+    def __should_list(self, path: str) -> bool:
+        # Folders are pruned before they are queued so that nothing under them is listed
+        if self._should_visit_path(path) is False:
+            log.debug(f"[PathPartition]: {path} is exported by another process.")
+            return False
+        if self.__path_exclusion.is_path_excluded(path) or self.__path_exclusion.is_subtree_excluded(path):
+            return False
+        if self.__path_inclusion.is_subtree_included(path) is False:
+            return False
         if self._is_valid_user_path(path) is False:
             log.debug(f"[InvalidUserPath]: {path} is a user path for a user who is removed from the workspace.")
-            return [], []
-
+            return False
+        return True
+
+    def __is_exported_notebook(self, workspace_obj: WorkspaceFileInfo) -> bool:
+        return workspace_obj.is_notebook is True and not self.__path_exclusion.is_path_excluded(workspace_obj.path) \
+            and self._is_path_owned(workspace_obj.path) and self.__path_inclusion.is_path_included(workspace_obj.path)
+
+    def __prefetch_notebook_permissions(self, notebook: Dict[str, Any]):
+        if self._is_shard_owned(self.__notebook_raw_id(notebook)) is True:
+            self.__perms.prefetch_permissions(ResourceCatalog.NOTEBOOK_RESOURCE, self.__notebook_raw_id(notebook))
+
+    def __prefetch_folder_permissions(self, notebooks: List[Dict[str, Any]]):
+        # Permissions of the parent folders of the first notebook in a folder are requested as soon as the folder is
+        # listed, these are exactly the ones _generate exports once it reaches the folder
+        if len(notebooks) == 0:
+            return
+        folder_paths = [str(folder_path) for folder_path in self.__folder_iter(notebooks[0])
+                        if self._is_shard_owned(str(folder_path)) is True and str(folder_path) not in self.__folders]
+        if len(folder_paths) == 0:
+            return
+        # Direct grants of a folder are inherited by all of its notebooks so only the folders which the first notebook
+        # inherits permissions from need their permissions fetched
+        inherited_directories = self.__perms.fetch_inherited_directories(ResourceCatalog.NOTEBOOK_RESOURCE,
+                                                                         self.__notebook_raw_id(notebooks[0]))
+        for folder_path in folder_paths:
+            self.__folders[folder_path] = asyncio.ensure_future(
+                self.__fetch_folder(folder_path, self.__listed_folders.get(folder_path), inherited_directories))
+
+    async def __fetch_folder(self, folder_path: str, folder_obj: Optional[Dict[str, Any]],
+                             inherited_directories: Awaitable[Optional[Set[str]]]) -> Tuple[Dict[str, Any], bool]:
+        # Folders above the walked base path are not in any listing
+        if folder_obj is None:
+            folder_obj = await self.__async_service.get_status(folder_path)
+        directories = await inherited_directories
+        has_direct_grants = directories is None or f"/directories/{self.__notebook_raw_id(folder_obj)}" in directories
+        if has_direct_grants is True:
+            self.__perms.prefetch_permissions(ResourceCatalog.DIRECTORY_RESOURCE, self.__notebook_raw_id(folder_obj))
+        return folder_obj, has_direct_grants
+
+    async def _get_notebooks_recursive(self, path: str):
+        if self.__exclude_deleted_users is True:
+            await self._get_valid_user_paths()
+        if self.__should_list(path) is False:
+            return
+        prefetcher = ListingPrefetcher(self.__async_service.list)
+        try:
+            async for item in self.__walk_notebooks(prefetcher, path):
+                yield item
+        finally:
+            prefetcher.close()
+
+    async def __walk_notebooks(self, prefetcher: ListingPrefetcher, path: str):
+        resp = await prefetcher.get(path)
         log.info(f"Fetched all files & folders from path: {path}")
         if "objects" not in resp:
-            return [], []
+            return
         objects = resp["objects"]
+        workspace_objs = [WorkspaceFileInfo.from_json(obj) for obj in objects]
+        # Sibling folders are listed in parallel while the notebooks are walked depth first in the listed order
+        folders = {workspace_obj.path for workspace_obj in workspace_objs
+                   if workspace_obj.is_dir is True and self.__should_list(workspace_obj.path)}
+        prefetcher.queue([workspace_obj.path for workspace_obj in workspace_objs if workspace_obj.path in folders])
+        # Only the folders which are walked can be parents of exported notebooks
+        self.__listed_folders.update((workspace_obj.path, obj) for obj, workspace_obj in zip(objects, workspace_objs)
+                                     if workspace_obj.path in folders)
+        # Inclusion marks the paths as processed so it is only checked once per path
+        notebooks = {workspace_obj.path for workspace_obj in workspace_objs
+                     if self.__is_exported_notebook(workspace_obj)}
+        exported_notebooks = [obj for obj, workspace_obj in zip(objects, workspace_objs)
+                              if workspace_obj.path in notebooks]
+        # Notebook permissions are requested in a window ahead of the notebook being exported, like prefetch_ordered,
+        # so that large folders do not flood the request pool
+        for notebook in exported_notebooks[:self.MAX_PREFETCH_PERMISSIONS]:
+            self.__prefetch_notebook_permissions(notebook)
+        self.__prefetch_folder_permissions(exported_notebooks)
+        notebook_index = 0
         first_notebook = True
-        for obj in objects:
-            workspace_obj = WorkspaceFileInfo.from_json(obj)
+        for obj, workspace_obj in zip(objects, workspace_objs):
             if self.__path_exclusion.is_path_excluded(workspace_obj.path):
                 continue
-            if workspace_obj.is_notebook is True and self.__path_inclusion.is_path_included(workspace_obj.path):
+            if workspace_obj.path in notebooks:
+                if notebook_index + self.MAX_PREFETCH_PERMISSIONS < len(exported_notebooks):
+                    self.__prefetch_notebook_permissions(
+                        exported_notebooks[notebook_index + self.MAX_PREFETCH_PERMISSIONS])
+                notebook_index += 1
                 # we need object id for permissions so we cant use workspace file info object
                 yield obj, first_notebook
                 first_notebook = False
-            if workspace_obj.is_dir is True:
-                yield from self._get_notebooks_recursive(workspace_obj.path)
+            if workspace_obj.path in folders:
+                async for item in self.__walk_notebooks(prefetcher, workspace_obj.path):
+                    yield item
+                # Nothing under the folder is left to export once the walk leaves it
+                self.__listed_folders.pop(workspace_obj.path, None)
 
     def construct_artifacts(self, data: Dict[str, Any]) -> List[Artifact]:
         return [NotebookArtifact(remote_path=data['path'],
@@ -117,7 +340,17 @@ class NotebookHCLGenerator(DownloaderAPIGenerator):
                                      self.__notebook_file_name(data),
                                      self.__create_custom_folder_path(data)
                                  ),
-                                 service=self.__service)]
+                                 service=self.__service,
+                                 version=self.__notebook_version(data),
+                                 # Archives are shared by the download threads, dask workers export one by one
+                                 archives=self.__archives if self._is_dask_enabled is False else None)]
+
+    @staticmethod
+    def __notebook_version(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Without the modification time a changed notebook can not be told apart so it is always downloaded
+        if data.get("modified_at") is None:
+            return None
+        return {"object_id": data["object_id"], "modified_at": data["modified_at"]}
 
     def __notebook_file_name(self, data: Dict[str, Any]) -> str:
         extmap = {
@@ -218,9 +451,12 @@ class NotebookHCLGenerator(DownloaderAPIGenerator):
             elif str(parent) == "/Shared":
                 log.debug("Cannot modify or copy permissions for '/Shared' folder path!")
                 continue
+            elif self._is_path_owned(str(parent)) is False:
+                log.debug(f"Folder permissions for {parent} are exported by another process")
+                continue
             yield parent
 
-    def __handle_folder_permissions(self, folder_path, notebook_obj):
+    async def __handle_folder_permissions(self, folder_path, notebook_obj):
         # # Handle Folder permissions
         if self.__is_processed_folder(folder_path):
             return None
@@ -232,34 +468,48 @@ class NotebookHCLGenerator(DownloaderAPIGenerator):
             return None
         else:
             log.debug(f"Processing folder permissions: {folder_path}")
-            folder_obj = self.__service.get_status(folder_path)
+            folder = self.__folders.pop(str(folder_path), None)
+            if folder is not None:
+                folder_obj, has_direct_grants = await folder
+            else:
+                folder_obj, has_direct_grants = await self.__async_service.get_status(folder_path), True
+            if has_direct_grants is False:
+                self.__process_folder(folder_path)
+                log.debug(f"Skipping folder permissions for path {folder_path} which has no direct grants")
+                return None
             folder_data = self.__create_folder_data(folder_obj)
             depends_on = [Interpolate.depends_on(ResourceCatalog.NOTEBOOK_RESOURCE,
                                                  self.__notebook_identifier(notebook_obj))]
             try:
                 self.__process_folder(folder_path)
-                return self.__perms.create_permission_data(folder_data, self.get_local_hcl_path,
-                                                           self.get_relative_hcl_path, depends_on=depends_on)
+                return await self.__perms.create_permission_data_async(folder_data, self.get_local_hcl_path,
+                                                                       self.get_relative_hcl_path,
+                                                                       depends_on=depends_on)
             except NoDirectPermissionsError as e:
                 log.debug(f"Failed folder permissions for path {folder_path} with error {str(e)}")
                 return None
 
     async def _generate(self) -> Generator[APIData, None, None]:
         for p in self.__notebook_path:
-            for notebook, first_notebook in self._get_notebooks_recursive(p):
+            async for notebook, first_notebook in self._get_notebooks_recursive(p):
 
-                object_data = self.__create_notebook_data(notebook)
-                yield object_data
+                if self._is_shard_owned(self.__notebook_raw_id(notebook)) is True:
+                    object_data = self.__create_notebook_data(notebook)
+                    yield object_data
 
-                try:
-                    yield self.__perms.create_permission_data(object_data, self.get_local_hcl_path,
-                                                              self.get_relative_hcl_path)
-                except NoDirectPermissionsError:
-                    pass
+                    try:
+                        yield await self.__perms.create_permission_data_async(object_data, self.get_local_hcl_path,
+                                                                              self.get_relative_hcl_path)
+                    except NoDirectPermissionsError:
+                        pass
 
                 # Create permissions for folders
                 if first_notebook is True:
                     for folder_path in self.__folder_iter(notebook):
-                        folder_perms = self.__handle_folder_permissions(folder_path, notebook)
+                        # Every shard walks the whole tree so a folder depends on the same notebook in every shard
+                        if self._is_shard_owned(str(folder_path)) is False:
+                            self.__process_folder(folder_path)
+                            continue
+                        folder_perms = await self.__handle_folder_permissions(folder_path, notebook)
                         if folder_perms is not None:
                             yield folder_perms
@@ -1,7 +1,8 @@
+import asyncio
 import functools
 import json
 from pathlib import Path
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, Optional, Tuple, Any, Awaitable, Set, Iterable, Iterator
 
 import requests
 
@@ -10,9 +11,11 @@ from databricks_sync.sdk.config import export_config
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import APIData, HCLConvertData
 from databricks_sync.sdk.processor import MappedGrokVariableBasicAnnotationProcessor
+from databricks_sync.sdk.service.concurrency import request_pool
 from databricks_sync.sdk.service.permissions import PermissionService
 from databricks_sync.sdk.sync.constants import ResourceCatalog, GeneratorCatalog, ForEachBaseIdentifierCatalog, \
     MeConstants
+from databricks_sync.sdk.sync.partition import ForEachPartition
 from databricks_sync.sdk.utils import normalize
 
 
@@ -41,6 +44,8 @@ def is_acls_enabled(permissions_service: PermissionService):
 
 
 class PermissionsHelper:
+    # Objects whose permissions are requested ahead of the object being exported
+    MAX_PREFETCH_PERMISSIONS = 16
 
     def __init__(self, api_client):
         self.api_client = api_client
@@ -62,6 +67,8 @@ class PermissionsHelper:
                                                                   "job_id", "id")
 
         }
+        # Permissions requested as soon as the objects are discovered, keyed by resource name and raw id
+        self.__prefetched: Dict[Tuple[str, str], asyncio.Future] = {}
 
     @staticmethod
     @normalize
@@ -77,13 +84,16 @@ class PermissionsHelper:
 
         depends_on = additional_depends_on or []
         if export_config.contains(GeneratorCatalog.IDENTITY) is True:
+            partition = ForEachPartition.from_config()
             depends_on = depends_on + [
-                Interpolate.depends_on(ResourceCatalog.USER_RESOURCE,
-                                       ForEachBaseIdentifierCatalog.USERS_BASE_IDENTIFIER),
-                Interpolate.depends_on(ResourceCatalog.GROUP_RESOURCE,
-                                       ForEachBaseIdentifierCatalog.GROUPS_BASE_IDENTIFIER),
-                Interpolate.depends_on(ResourceCatalog.SERVICE_PRINCIPAL_RESOURCE,
-                                       ForEachBaseIdentifierCatalog.SERVICE_PRINCIPALS_BASE_IDENTIFIER),
+                Interpolate.depends_on(resource_type, identifier)
+                for resource_type, base_identifier in [
+                    (ResourceCatalog.USER_RESOURCE, ForEachBaseIdentifierCatalog.USERS_BASE_IDENTIFIER),
+                    (ResourceCatalog.GROUP_RESOURCE, ForEachBaseIdentifierCatalog.GROUPS_BASE_IDENTIFIER),
+                    (ResourceCatalog.SERVICE_PRINCIPAL_RESOURCE,
+                     ForEachBaseIdentifierCatalog.SERVICE_PRINCIPALS_BASE_IDENTIFIER),
+                ]
+                for identifier in partition.names(base_identifier)
             ]
         if len(depends_on) > 0:
             tdb.add_optional("depends_on", lambda: depends_on)
@@ -154,11 +164,106 @@ class PermissionsHelper:
         else:
             return perm_data["access_control_list"]
 
-    def create_permission_data(self, src_obj_data: HCLConvertData, path_func: Callable[[str, Optional[str]], Path],
-                               rel_path_func: Callable[[str, Optional[str]], str] = None, depends_on=None, ):
+    def __get_object_permissions(self, resource_name: str, raw_id):
+        return self._permissions_service.get_object_permissions(self.perm_mapping[resource_name].object_type, raw_id)
+
+    def __fetch_permissions(self, src_obj_data: HCLConvertData):
+        return self.__get_object_permissions(src_obj_data.resource_name, src_obj_data.raw_id)
+
+    def prefetch_permissions(self, resource_name: str, raw_id):
+        """
+        Requests the permissions of an object as soon as a generator discovers it so that the request overlaps with the
+        export of the objects before it. Requests for the same object are only made once and the result is handed to
+        create_permission_data_async, so generators should only prefetch the objects they export.
+        """
+        if is_acls_enabled(self._permissions_service) is False:
+            return
+        key = (resource_name, str(raw_id))
+        if key not in self.__prefetched:
+            self.__prefetched[key] = asyncio.ensure_future(
+                request_pool.run(self.__get_object_permissions, resource_name, raw_id))
+
+    def iter_prefetched(self, resource_name: str, objects: Iterable[Any], get_raw_id: Callable[[Any], Any],
+                        max_prefetch: int = MAX_PREFETCH_PERMISSIONS) -> Iterator[Any]:
+        """
+        Yields the objects in order while the permissions of up to max_prefetch of the objects after the yielded one
+        are requested, like prefetch_ordered, so that long listings do not flood the request pool and only a window of
+        the results is held until its objects are exported.
+        """
+        objects = list(objects)
+        for obj in objects[:max_prefetch]:
+            self.prefetch_permissions(resource_name, get_raw_id(obj))
+        for index, obj in enumerate(objects):
+            if index + max_prefetch < len(objects):
+                self.prefetch_permissions(resource_name, get_raw_id(objects[index + max_prefetch]))
+            yield obj
+
+    def fetch_inherited_directories(self, resource_name: str, raw_id) -> Awaitable[Optional[Set[str]]]:
+        """
+        Fetches the directories an object inherits permissions from, e.g. "/directories/123", reusing the prefetched
+        permissions of the object. Resolves to None when they can not be told apart.
+        """
+        perm_data = None
+        if is_acls_enabled(self._permissions_service) is True:
+            perm_data = self.__prefetched.get((resource_name, str(raw_id)), None) or asyncio.ensure_future(
+                request_pool.run(self.__get_object_permissions, resource_name, raw_id))
+        return asyncio.ensure_future(self.__inherited_directories_async(perm_data))
+
+    @staticmethod
+    async def __inherited_directories_async(perm_data: Optional[Awaitable[Dict[str, Any]]]) -> Optional[Set[str]]:
+        if perm_data is None:
+            return None
+        try:
+            return PermissionsHelper.get_inherited_directories(await perm_data)
+        except Exception as e:
+            log.debug(f"Unable to fetch inherited directories with error {str(e)}")
+            return None
+
+    @staticmethod
+    def get_inherited_directories(perm_data: Dict[str, Any]) -> Optional[Set[str]]:
+        directories = set()
+        for item in perm_data.get("access_control_list", []):
+            for perm in item.get("all_permissions", []):
+                if perm.get("inherited", False) is False:
+                    continue
+                # Without the source of an inherited permission any parent directory may have direct grants
+                if "inherited_from_object" not in perm:
+                    return None
+                directories.update(perm["inherited_from_object"])
+        return directories
+
+    def __fetch_permissions_async(self, src_obj_data: HCLConvertData) -> Awaitable[Dict[str, Any]]:
+        prefetched = self.__prefetched.pop((src_obj_data.resource_name, str(src_obj_data.raw_id)), None)
+        if prefetched is not None:
+            return prefetched
+        return request_pool.run(self.__fetch_permissions, src_obj_data)
+
+    def __check_acls_enabled(self):
         if is_acls_enabled(self._permissions_service) is False:
             raise NoDirectPermissionsError("ACLS are disabled no permissions available")
 
+    def create_permission_data(self, src_obj_data: HCLConvertData, path_func: Callable[[str, Optional[str]], Path],
+                               rel_path_func: Callable[[str, Optional[str]], str] = None, depends_on=None, ):
+        self.__check_acls_enabled()
+        try:
+            perm_data, fetch_err = self.__fetch_permissions(src_obj_data), None
+        except Exception as e:
+            perm_data, fetch_err = None, e
+        return self._make_permission_data(src_obj_data, perm_data, fetch_err, depends_on=depends_on)
+
+    async def create_permission_data_async(self, src_obj_data: HCLConvertData,
+                                           path_func: Callable[[str, Optional[str]], Path],
+                                           rel_path_func: Callable[[str, Optional[str]], str] = None,
+                                           depends_on=None, ):
+        self.__check_acls_enabled()
+        try:
+            perm_data, fetch_err = await self.__fetch_permissions_async(src_obj_data), None
+        except Exception as e:
+            perm_data, fetch_err = None, e
+        return self._make_permission_data(src_obj_data, perm_data, fetch_err, depends_on=depends_on)
+
+    def _make_permission_data(self, src_obj_data: HCLConvertData, perm_data, fetch_err: Optional[Exception] = None,
+                              depends_on=None):
         identifier = self._make_identifier(src_obj_data.resource_name, src_obj_data.raw_id)
         permissions_name = self.__make_name(src_obj_data)
         parent_local_path = src_obj_data.local_save_path.parent / (identifier + ".tf.json")
@@ -168,8 +273,8 @@ class PermissionsHelper:
         log.debug(f"Fetched relative parent path for {src_obj_data.resource_name} perms: {parent_rel_path}")
         err = None
         try:
-            perm_data = self._permissions_service.get_object_permissions(
-                self.perm_mapping[src_obj_data.resource_name].object_type, src_obj_data.raw_id)
+            if fetch_err is not None:
+                raise fetch_err
             permission_acls = self.__get_perm_acls(src_obj_data, perm_data)
             api_data = APIData(
                 identifier,
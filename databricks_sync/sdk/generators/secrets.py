@@ -1,3 +1,4 @@
+import asyncio
 from pathlib import Path
 from typing import Generator, Dict, Any, Callable, List, Tuple
 
@@ -7,12 +8,14 @@ from databricks_cli.sdk import SecretService
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformDictBuilder, Interpolate
 from databricks_sync.sdk.message import APIData
 from databricks_sync.sdk.pipeline import APIGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService, prefetch_ordered
 from databricks_sync.sdk.sync.constants import ResourceCatalog, SecretSchema, SecretScopeAclSchema, get_members, \
     SparkEnvConstants, GeneratorCatalog
 from databricks_sync.sdk.utils import normalize_identifier
 
 
 class SecretHCLGenerator(APIGenerator):
+    MAX_PREFETCH_SCOPES = 32
     SECRET_SCOPE_ACL_FOREACH_VAR_TEMPLATE = "databricks_secret_scope_{}_acls_for_each_var"
     SECRET_FOREACH_VAR_TEMPLATE = "databricks_secret_{}_for_each_var"
 
@@ -21,6 +24,7 @@ class SecretHCLGenerator(APIGenerator):
         super().__init__(api_client, base_path, patterns=patterns)
         self.__custom_map_vars = custom_map_vars or {}
         self.__service = SecretService(self.api_client)
+        self.__async_service = AsyncService(self.__service)
 
     def __create_secret_data(self, scope_name: str, secret_data: Dict[str, Any],
                              variables: List[str],
@@ -129,18 +133,26 @@ class SecretHCLGenerator(APIGenerator):
         else:
             return None
 
+    async def __fetch_scope(self, secret_scope: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        secret_scope_acls, secrets = await asyncio.gather(self.__async_service.list_acls(secret_scope.get("name")),
+                                                          self.__async_service.list_secrets(secret_scope["name"]))
+        return secret_scope_acls.get("items", []), secrets.get("secrets", [])
+
     async def _generate(self) -> Generator[APIData, None, None]:
-        secret_scopes = self.__service.list_scopes().get("scopes", [])
-        for secret_scope in secret_scopes:
+        secret_scopes = (await self.__async_service.list_scopes()).get("scopes", [])
+        owned_secret_scopes = [secret_scope for secret_scope in secret_scopes
+                               if self._is_shard_owned(secret_scope["name"]) is True]
+        # Acls and secrets of the next scopes are fetched while a scope is exported, scopes are still yielded in order
+        async for secret_scope, (secret_scope_acls, secrets) in prefetch_ordered(self.__fetch_scope,
+                                                                                 owned_secret_scopes,
+                                                                                 self.MAX_PREFETCH_SCOPES):
             secret_scope_data = self.__create_secret_scope_data(secret_scope)
             yield secret_scope_data
 
-            secret_scope_acls = self.__service.list_acls(secret_scope.get("name")).get("items", [])
             secret_acls = self.get_secret_scope_acls(secret_scope, secret_scope_acls)
             if secret_acls is not None:
                 yield secret_acls
 
-            secrets = self.__service.list_secrets(secret_scope["name"]).get("secrets", [])
             secrets_scope_secrets = self.get_secrets(secret_scope, secrets)
             if secrets_scope_secrets is not None:
                 yield secrets_scope_secrets
@@ -123,6 +123,10 @@ class RemoteGitHandler(GitHandler):
         super().__init__(base_path, delete_directory, branch, revision)
 
     def _get_repo(self, branch, revision=None) -> git.Repo:
+        if (self.base_path / ".git").exists():
+            # The working tree of an interrupted export is reused when it is resumed
+            log.info(f"Reusing the clone of {self.git_ssh_url} in {self.base_path}")
+            return git.Repo(self.base_path.absolute())
         repo = git.Repo.clone_from(self.git_ssh_url, self.base_path.absolute(),
                                branch=branch)
         if revision is not None:
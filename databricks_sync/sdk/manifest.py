@@ -0,0 +1,125 @@
+import hashlib
+import json
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Any, List
+
+from databricks_sync import log
+from databricks_sync.sdk.message import Artifact
+
+
+class ArtifactManifest:
+    """
+    Persistent record of the artifacts downloaded by a generator, kept next to the data folder of the generator in the
+    export repo. Every artifact is recorded with the version of the remote object (i.e. the object id and modification
+    time of a notebook or the size and modification time of a dbfs file), where it is stored and the hash of its
+    content. An incremental export keeps the artifacts whose remote version did not change in place rather than
+    downloading them again.
+    """
+    FILE_NAME = "artifact_manifest.json"
+    DATA_DIRECTORY = "data"
+    HASH_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, base_path: Path, folder_path: Path):
+        self.__base_path = Path(base_path)
+        self.__path = Path(folder_path) / self.FILE_NAME
+        self.__previous = self.read(self.__path)
+        self.__entries: Dict[str, Dict[str, Any]] = {}
+        # Artifacts are downloaded by the stage workers
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def read(path: Path) -> Dict[str, Dict[str, Any]]:
+        if not path.exists():
+            return {}
+        try:
+            with path.open("r") as f:
+                return json.load(f)
+        except ValueError:
+            log.warning(f"Unable to read the artifact manifest {path}, downloading all the artifacts again.")
+            return {}
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        sha256 = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(ArtifactManifest.HASH_BUFFER_SIZE), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def __relative_path(self, artifact: Artifact) -> str:
+        return Path(artifact.local_path).relative_to(self.__base_path).as_posix()
+
+    def __add(self, artifact: Artifact, content_hash: str):
+        with self.__lock:
+            self.__entries[artifact.remote_path] = {
+                "local_path": self.__relative_path(artifact),
+                "version": artifact.version,
+                "sha256": content_hash,
+            }
+
+    def restore(self, artifact: Artifact) -> bool:
+        # The local copy is only kept when the remote object and the local file are both unchanged
+        entry = self.__previous.get(artifact.remote_path)
+        if artifact.version is None or entry is None or entry.get("version") != artifact.version \
+                or entry.get("local_path") != self.__relative_path(artifact):
+            return False
+        local_path = Path(artifact.local_path)
+        if not local_path.exists() or self.hash_file(local_path) != entry.get("sha256"):
+            return False
+        log.debug(f"Keeping unchanged artifact {artifact.remote_path} in {local_path}")
+        self.__add(artifact, entry["sha256"])
+        return True
+
+    def add(self, artifact: Artifact, content: bytes):
+        self.__add(artifact, self.hash_content(content))
+
+    def add_hash(self, artifact: Artifact, content_hash: str):
+        # Streamed artifacts are hashed while they are written
+        self.__add(artifact, content_hash)
+
+    def write(self):
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        with self.__path.open("w+") as f:
+            f.write(json.dumps(self.__entries, indent=4, sort_keys=True))
+
+    @staticmethod
+    def prepare(exports_path: Path, folder_names: List[str]):
+        # Replaces deleting the whole exports folder, artifacts and manifests of the exported objects stay for reuse
+        if not exports_path.exists():
+            return
+        for path in exports_path.iterdir():
+            if path.is_dir() and path.name in folder_names:
+                for child in path.iterdir():
+                    if child.name in [ArtifactManifest.DATA_DIRECTORY, ArtifactManifest.FILE_NAME]:
+                        continue
+                    ArtifactManifest.__remove(child)
+            else:
+                ArtifactManifest.__remove(path)
+
+    @staticmethod
+    def prune(exports_path: Path, base_path: Path):
+        # Artifacts which were neither kept nor downloaded again are gone from the workspace or failed to download
+        for manifest_path in sorted(exports_path.glob(f"*/{ArtifactManifest.FILE_NAME}")):
+            data_path = manifest_path.parent / ArtifactManifest.DATA_DIRECTORY
+            if not data_path.exists():
+                continue
+            kept = {entry["local_path"] for entry in ArtifactManifest.read(manifest_path).values()}
+            for path in sorted(data_path.rglob("*"), reverse=True):
+                if path.is_file() and path.relative_to(base_path).as_posix() not in kept:
+                    log.debug(f"Removing stale artifact {path}")
+                    path.unlink()
+                elif path.is_dir() and not any(path.iterdir()):
+                    path.rmdir()
+
+    @staticmethod
+    def __remove(path: Path):
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
@@ -1,39 +1,74 @@
 import abc
 import functools
 import json
+import sys
 import traceback
+from base64 import b64decode
 from pathlib import Path
-from typing import List, Optional, Any, Dict, Tuple
+from typing import List, Optional, Any, Dict, Tuple, Iterator
 
 from databricks_sync import log
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformJsonBuilder, \
     TerraformDictBuilder
+from databricks_sync.sdk.service.concurrency import download_budget
 
 
 class Artifact(abc.ABC):
-    def __init__(self, remote_path, local_path: Path, service):
+    # Multiple of 4 base64 characters, decoded into 3 MiB chunks
+    B64_DECODE_CHUNK_SIZE = 4 * 1024 * 1024
+    # Reserved from the download budget before fetching content whose size is unknown until it is fetched
+    ESTIMATED_CONTENT_BYTES = 1024 * 1024
+
+    def __init__(self, remote_path, local_path: Path, service, version: Optional[Dict[str, Any]] = None):
         self.local_path = local_path
         self.remote_path = remote_path
         self.service = service
+        # Identifies the state of the remote object, artifacts without a version are always downloaded
+        self.version = version
 
     @abc.abstractmethod
     def get_content(self):
         pass
 
+    def iter_content(self) -> Iterator[bytes]:
+        """
+        Yields the content in the chunks in which it is written to disk. Artifacts which can be fetched in parts
+        override this so they are never held in memory as a whole, the default falls back to get_content. The bytes of
+        every chunk are reserved from the download budget before it is fetched until the chunk is written.
+        """
+        with download_budget.reserve(self.ESTIMATED_CONTENT_BYTES) as reservation:
+            content = self.get_content()
+            reservation.resize(len(content))
+            yield content
+
+    @staticmethod
+    def iter_b64decode(data: str, chunk_size: int = B64_DECODE_CHUNK_SIZE) -> Iterator[bytes]:
+        # Api payloads are base64 without line breaks so slices aligned to 4 characters decode on their own
+        for start in range(0, len(data), chunk_size):
+            yield b64decode(data[start:start + chunk_size])
+
+
+def intern_str(value):
+    # Strings repeated across every message (workspace urls, resource names, ids shared by several resources) are
+    # interned so that all the messages reference a single copy of them
+    return sys.intern(value) if type(value) is str else value
+
 
 class APIData:
+    __slots__ = ("__relative_save_path", "__workspace_url", "__raw_identifier", "__human_readable_name",
+                 "__local_save_path", "__data", "__hcl_resource_identifier", "__artifacts")
 
     def __init__(self, raw_identifier, workspace_url,
                  hcl_resource_identifier, data, local_save_path: Path, relative_save_path: str = None,
                  artifacts: Optional[List[Any]] = None, human_readable_name=None):
         self.__relative_save_path = relative_save_path
-        self.__workspace_url = workspace_url
+        self.__workspace_url = intern_str(workspace_url)
         self.__raw_identifier = raw_identifier
         self.__human_readable_name = human_readable_name if human_readable_name is not None else raw_identifier
         self.__local_save_path = local_save_path
         self.__data = data
         self.__hcl_resource_identifier = hcl_resource_identifier
-        self.__artifacts: List[Artifact] = artifacts or []
+        self.__artifacts: Optional[List[Artifact]] = artifacts or None
 
     def clone_with(self, **kwargs):
         return APIData(**{**self.to_dict(), **kwargs})
@@ -56,7 +91,7 @@ class APIData:
 
     @property
     def artifacts(self) -> List[Artifact]:
-        return self.__artifacts
+        return self.__artifacts or []
 
     @property
     def workspace_url(self):
@@ -84,15 +119,20 @@ class APIData:
 
 
 class Variable:
+    __slots__ = ("default", "variable_name")
+
     def __init__(self, variable_name, default=None):
         self.default = default
-        self.variable_name = variable_name
+        self.variable_name = intern_str(variable_name)
+
+    def _fields(self) -> Dict[str, Any]:
+        return {"default": self.default, "variable_name": self.variable_name}
 
     def __eq__(self, obj):
-        return isinstance(obj, Variable) and obj.__dict__ == self.__dict__
+        return isinstance(obj, Variable) and obj._fields() == self._fields()
 
     def __repr__(self):
-        return json.dumps(self.__dict__)
+        return json.dumps(self._fields())
 
     def to_dict(self):
         if self.default is None:
@@ -111,25 +151,34 @@ class Variable:
 
 
 class LocalVariable(Variable):
+    __slots__ = ("data",)
 
     def __init__(self, variable_name, data: Dict[str, Any]):
         super().__init__(variable_name)
         self.data = data
 
+    def _fields(self) -> Dict[str, Any]:
+        return {**super()._fields(), "data": self.data}
+
     def to_dict(self):
         return {**self.data}
 
 
 class ErrorMixin:
+    __slots__ = ("__errors",)
+
     def __init__(self):
-        self.__errors = []
+        # Containers are only created on the first add as most messages never have errors
+        self.__errors = None
 
     def add_error(self, error):
+        if self.__errors is None:
+            self.__errors = []
         self.__errors.append(error)
 
     @property
     def errors(self):
-        return self.__errors
+        return self.__errors if self.__errors is not None else []
 
     @staticmethod
     def manage_error(func) -> Any:
@@ -161,19 +210,29 @@ class ErrorMixin:
         return wrapper
 
 
+class LineagePolicy:
+    # Keep every intermediate version of the resource, useful when debugging processors
+    FULL = "full"
+    # Keep only the version returned by the api and the latest processed version
+    FIRST_AND_LATEST = "first_and_latest"
+
+
 class HCLConvertData(ErrorMixin):
+    __slots__ = ("__raw_api_data", "__resource_name", "__processors", "__lineage", "__mapped_variables",
+                 "__resource_variables", "__local_variables", "__for_each_var_id_name_pairs")
+    lineage_policy = LineagePolicy.FIRST_AND_LATEST
 
     def __init__(self, resource_name, raw_api_data: APIData, processors: List['Processor'] = None):
         super().__init__()
         self.__raw_api_data = raw_api_data
-        self.__resource_name = resource_name
-        self.__processors = processors or []
-        self.__lineage = []
-        self.__lineage.append(raw_api_data.data)
-        self.__mapped_variables = []
-        self.__resource_variables = []
-        self.__local_variables = {}
-        self.__for_each_var_id_name_pairs = []
+        self.__resource_name = intern_str(resource_name)
+        self.__processors = processors or None
+        self.__lineage = [raw_api_data.data]
+        # Containers are only created on the first add as most messages only use a few of them
+        self.__mapped_variables = None
+        self.__resource_variables = None
+        self.__local_variables = None
+        self.__for_each_var_id_name_pairs = None
 
     @property
     def workspace_url(self):
@@ -205,7 +264,7 @@ class HCLConvertData(ErrorMixin):
 
     @property
     def processors(self):
-        return self.__processors
+        return self.__processors or []
 
     @property
     def hcl_resource_identifier(self):
@@ -221,35 +280,60 @@ class HCLConvertData(ErrorMixin):
 
     @property
     def mapped_variables(self) -> List[Variable]:
-        return self.__mapped_variables
+        return self.__mapped_variables if self.__mapped_variables is not None else []
 
     @property
     def resource_variables(self) -> List[Variable]:
-        return self.__resource_variables
+        return self.__resource_variables if self.__resource_variables is not None else []
 
     @property
     def local_variables(self) -> List[LocalVariable]:
-        return list(self.__local_variables.values())
+        return list(self.__local_variables.values()) if self.__local_variables is not None else []
 
     @property
     def for_each_var_id_name_pairs(self):
-        return self.__for_each_var_id_name_pairs
+        return self.__for_each_var_id_name_pairs if self.__for_each_var_id_name_pairs is not None else []
 
     def modify_json(self, value):
-        self.__lineage.append(value)
+        if self.lineage_policy == LineagePolicy.FIRST_AND_LATEST and len(self.__lineage) > 1:
+            self.__lineage[-1] = value
+        else:
+            self.__lineage.append(value)
 
     def add_mapped_variable(self, variable_name, variable_default_value):
+        self.__mapped_variables = self.mapped_variables
         self.__mapped_variables.append(Variable(variable_name, variable_default_value))
 
     def add_resource_variable(self, variable_name, variable_default_value=None):
+        self.__resource_variables = self.resource_variables
         self.__resource_variables.append(Variable(variable_name, variable_default_value))
 
     def upsert_local_variable(self, local_var_name, local_var_value):
+        if self.__local_variables is None:
+            self.__local_variables = {}
         self.__local_variables[local_var_name] = LocalVariable(local_var_name, local_var_value)
 
+    def copy(self) -> 'HCLConvertData':
+        """
+        Returns a new version of this data without cloning its content. The versions in the lineage, the variables and
+        the artifacts are shared with the copy and only the containers are new so that processors can append versions
+        and variables to the copy. This relies on versions never being mutated in place, new versions are added through
+        modify_json and upsert_local_variable.
+        """
+        new_data = HCLConvertData(self.__resource_name, self.__raw_api_data, processors=self.__processors)
+        new_data.__lineage = list(self.__lineage)
+        new_data.__mapped_variables = list(self.mapped_variables) or None
+        new_data.__resource_variables = list(self.resource_variables) or None
+        new_data.__local_variables = dict(self.__local_variables) if self.__local_variables is not None else None
+        new_data.__for_each_var_id_name_pairs = list(self.for_each_var_id_name_pairs) or None
+        for err in self.errors:
+            new_data.add_error(err)
+        return new_data
+
     def add_for_each_var_name_pairs(self, pairs: List[Tuple[str, str]]):
         if pairs is not None:
-            self.__for_each_var_id_name_pairs += pairs
+            self.__for_each_var_id_name_pairs = self.for_each_var_id_name_pairs
+            self.__for_each_var_id_name_pairs += [(intern_str(id_), intern_str(name)) for id_, name in pairs]
 
     def to_hcl(self, debug: bool):
         tjb = TerraformJsonBuilder()
@@ -1,22 +1,28 @@
 import abc
 import asyncio
-import copy
 import fnmatch
+import hashlib
 import json
+import os
+import re
 import traceback
 from functools import reduce, singledispatch
 from pathlib import Path
-from typing import List, Callable, Generator, Any, Dict, Union, Tuple, Optional
+from typing import List, Callable, Generator, Any, Dict, Union, Tuple, Optional, Iterable
 
 from databricks_cli.sdk import ApiClient
 from streamz import Stream
 from tenacity import wait_fixed, retry
 
 from databricks_sync import log
+from databricks_sync.sdk.engine import PipelineEngine
 from databricks_sync.sdk.hcl.json_to_hcl import TerraformJsonBuilder
+from databricks_sync.sdk.manifest import ArtifactManifest
 from databricks_sync.sdk.message import HCLConvertData, APIData, Artifact
 from databricks_sync.sdk.processor import Processor, MappedGrokVariableBasicAnnotationProcessor
-from databricks_sync.sdk.report.model import event_manager, EventManager, run_id, Session, ReportConstants
+from databricks_sync.sdk.report.model import event_manager, EventManager, Session, ReportConstants
+from databricks_sync.sdk.service.concurrency import StageExecutor
+from databricks_sync.sdk.service.rate_limit import rate_limiter
 from databricks_sync.sdk.sync.constants import ResourceCatalog, SparkEnvConstants
 from databricks_sync.sdk.utils import normalize
 
@@ -27,19 +33,48 @@ class APIGenerator(abc.ABC):
                  patterns=None,
                  ):
         self._patterns = patterns or []
+        self.__compiled_patterns = [re.compile(fnmatch.translate(pattern)) for pattern in self._patterns]
         self._base_path = base_path
         self.__api_client = api_client
         self._is_dask_enabled = False
         self._buffer = 8
+        self._path_partition = None
+        self._shard = None
+        self._resume = None
         self.source = Stream(stream_name=self.folder_name)
 
     def set_dask_conf(self, is_dask_enabled=True, buffer=8):
         self._is_dask_enabled = is_dask_enabled
         self._buffer = buffer
 
+    def set_path_partition(self, path_partition):
+        # Only generators which crawl paths (notebooks, dbfs) restrict themselves to the paths owned by the partition
+        self._path_partition = path_partition
+
+    def _is_path_owned(self, path: str) -> bool:
+        return self._path_partition is None or self._path_partition.is_owned(path)
+
+    def _should_visit_path(self, dir_path: str) -> bool:
+        return self._path_partition is None or self._path_partition.should_visit(dir_path)
+
+    def set_shard(self, shard):
+        # Objects owned by other shards are skipped right after listing before any of their details are fetched
+        self._shard = shard
+
+    def _is_shard_owned(self, object_id) -> bool:
+        return self._shard is None or self._shard.owns(object_id)
+
+    def set_resume(self, resume):
+        # Objects which a resumed run already exported are skipped before anything is downloaded or written
+        self._resume = resume
+
+    def _is_first_shard(self) -> bool:
+        # Resources which are always written (even without any objects) are only written by the first shard
+        return self._shard is None or self._shard.index == 1
+
     def _match_patterns(self, key):
         # TODO: determine if this should be any or all (and clause/or clause)
-        matched = all([fnmatch.fnmatch(key, pattern) for pattern in self._patterns])
+        matched = all(pattern.match(key) is not None for pattern in self.__compiled_patterns)
         log.debug(f"Attempt to match {key} to patterns: {self._patterns} yielded in {matched}")
         return matched
 
@@ -83,6 +118,11 @@ class APIGenerator(abc.ABC):
     def create_stream(self):
         return self.source
 
+    @property
+    def stages(self) -> List[Callable[[HCLConvertData], HCLConvertData]]:
+        # Functions applied to every item of this generator before it is merged with the other generators
+        return []
+
     async def trigger(self):
         async for item in self.generate():
             self.source.emit(item)
@@ -91,6 +131,10 @@ class APIGenerator(abc.ABC):
         try:
             async for item in self._generate():
                 item: HCLConvertData
+                if self._resume is not None and self._resume.should_export(item) is False:
+                    log.info(f"Skipping: {item.resource_name} with id: {item.raw_id} as it was already exported")
+                    self._resume.skip(item)
+                    continue
                 if len(item.for_each_var_id_name_pairs) > 0:
                     for id_name_pairs in item.for_each_var_id_name_pairs:
                         log.info(
@@ -220,6 +264,7 @@ def _(data, path: Path):
 
 class ExportFileUtils:
     BASE_DIRECTORY = "exports"
+    PARTIAL_SUFFIX = ".partial"
 
     @staticmethod
     def __ensure_parent_dirs(dir_path):
@@ -271,18 +316,58 @@ class ExportFileUtils:
         log.info(f"Writing to path {str(local_path)}")
         write_file(data, path=local_path)
 
+    @staticmethod
+    def add_file_chunks(local_path: Path, chunks: Iterable[bytes], digest=None) -> int:
+        # Chunks are written to a partial file which only replaces the local path once the content is complete
+        log.info(f"Writing to path {str(local_path)}")
+        partial_path = local_path.with_name(local_path.name + ExportFileUtils.PARTIAL_SUFFIX)
+        length = 0
+        try:
+            with partial_path.open("wb+") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    length += len(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+            os.replace(partial_path, local_path)
+        finally:
+            if partial_path.exists():
+                partial_path.unlink()
+        return length
+
 
 class DownloaderAPIGenerator(APIGenerator, abc.ABC):
 
+    def __init__(self, api_client: ApiClient, base_path: Path, patterns=None):
+        super().__init__(api_client, base_path, patterns=patterns)
+        self._manifest: Optional[ArtifactManifest] = None
+
+    def set_incremental(self, incremental: bool):
+        # Artifacts are only downloaded again when their remote object changed since the previous export
+        self._manifest = ArtifactManifest(self._base_path,
+                                          Path(self._base_path) / ExportFileUtils.BASE_DIRECTORY / self.folder_name) \
+            if incremental is True else None
+
+    def write_manifest(self):
+        if self._manifest is not None:
+            self._manifest.write()
+
     @staticmethod
-    @HCLConvertData.manage_error
-    def _download(hcl_convert_data: HCLConvertData) -> HCLConvertData:
-        for artifact in hcl_convert_data.artifacts:
-            content = artifact.get_content()
-            log.info("Content fetched :-) for " + artifact.remote_path + " with length " +
-                     str(len(content)))
-            ExportFileUtils.add_file(artifact.local_path, content)
-        return hcl_convert_data
+    def make_download_handler(manifest: Optional[ArtifactManifest] = None):
+        @HCLConvertData.manage_error
+        def _download(hcl_convert_data: HCLConvertData) -> HCLConvertData:
+            for artifact in hcl_convert_data.artifacts:
+                if manifest is not None and manifest.restore(artifact):
+                    continue
+                digest = hashlib.sha256() if manifest is not None else None
+                length = ExportFileUtils.add_file_chunks(Path(artifact.local_path), artifact.iter_content(),
+                                                         digest=digest)
+                log.info("Content fetched :-) for " + artifact.remote_path + " with length " + str(length))
+                if manifest is not None:
+                    manifest.add_hash(artifact, digest.hexdigest())
+            return hcl_convert_data
+
+        return _download
 
     def get_local_download_path(self, file_name, custom_folder_path: str = None) -> Path:
         return ExportFileUtils.make_local_data_path(
@@ -293,11 +378,16 @@ class DownloaderAPIGenerator(APIGenerator, abc.ABC):
         )
 
     def _create_stream(self):
-        return StreamUtils.apply_map(self._download, super().create_stream(), self._is_dask_enabled, self._buffer)
+        return StreamUtils.apply_map(self.make_download_handler(self._manifest), super().create_stream(),
+                                     self._is_dask_enabled, self._buffer)
 
     def create_stream(self):
         return self._create_stream()
 
+    @property
+    def stages(self) -> List[Callable[[HCLConvertData], HCLConvertData]]:
+        return [self.make_download_handler(self._manifest)]
+
     @abc.abstractmethod
     def construct_artifacts(self, data: Dict[str, Any]) -> List[Artifact]:
         pass
@@ -318,7 +408,8 @@ class PipelineResults:
         self.summary = {}
         try:
             self._session = Session()
-            self._event_manager = EventManager(run_id=run_id, session=self._session)
+            self._event_manager = EventManager(run_id=event_manager.run_id, session=self._session,
+                                               resumed=event_manager.resumed)
         except Exception:
             log.warn("Failed to initialize a session for SQLite to store results")
 
@@ -336,18 +427,22 @@ class PipelineResults:
                 self._event_manager.make_end_record(hcl_convert_data.workspace_url,
                                                     id_name_pair[0],
                                                     hcl_convert_data.resource_name,
-                                                    "FAILED",
+                                                    ReportConstants.OBJECT_EXPORT_FAILED,
                                                     errors=hcl_convert_data.errors
                                                     )
         else:
             self._event_manager.make_end_record(hcl_convert_data.workspace_url,
                                                 hcl_convert_data.hcl_resource_identifier,
                                                 hcl_convert_data.resource_name,
-                                                "FAILED",
+                                                ReportConstants.OBJECT_EXPORT_FAILED,
                                                 errors=hcl_convert_data.errors
                                                 )
 
     def __handle_passed_events(self, hcl_convert_data: HCLConvertData):
+        self._event_manager.make_checkpoint_record(hcl_convert_data.workspace_url,
+                                                   hcl_convert_data.hcl_resource_identifier,
+                                                   hcl_convert_data.resource_name,
+                                                   Pipeline.get_checkpoint_variables(hcl_convert_data))
         if len(hcl_convert_data.for_each_var_id_name_pairs) > 0:
             for id_name_pair in hcl_convert_data.for_each_var_id_name_pairs:
                 self._event_manager.make_end_record(hcl_convert_data.workspace_url,
@@ -375,9 +470,16 @@ class PipelineResults:
 class Pipeline:
 
     def __init__(self, generators: List[APIGenerator], base_path: str, sinks=None,
-                 dask_client=None, debug_mode=False, ):
+                 dask_client=None, debug_mode=False, stage_executor: StageExecutor = None, resume=None):
         self._base_path = base_path
+        self.__resume = resume
         self.__dask_client = dask_client
+        self.__engine: Optional[PipelineEngine] = None
+        self.__mapped_variables = TerraformJsonBuilder()
+        self.__tfvars = set()
+        self.__spark_envs = set()
+        # Dask takes precedence over the thread pool stages when both are provided
+        self.__stage_executor = stage_executor if dask_client is None else None
         self.__debug_mode = debug_mode
         self.__sinks = sinks
         self.__collectors = []
@@ -391,7 +493,7 @@ class Pipeline:
     @staticmethod
     @HCLConvertData.manage_error
     def apply_processors(terraform_model: HCLConvertData):
-        tf_model = copy.deepcopy(terraform_model)
+        tf_model = terraform_model.copy()
         if terraform_model.processors is None:
             return tf_model
         for processor in terraform_model.processors:
@@ -468,31 +570,88 @@ class Pipeline:
             log.debug(f"spark_envs-{spark_envs}")
         return spark_envs
 
+    @staticmethod
+    def get_checkpoint_variables(hcl_convert_data: HCLConvertData) -> Dict[str, Any]:
+        # Everything the collectors take from an object so that a resumed run can collect it without exporting it
+        mapped_variables = {}
+        if Pipeline.filter_mapped_variables(hcl_convert_data):
+            mapped_variables = {mapped_var.variable_name: mapped_var.to_dict()
+                                for mapped_var in reversed(hcl_convert_data.mapped_variables)}
+        return {
+            "mapped_variables": mapped_variables,
+            "tfvars": Pipeline.map_tfvars(hcl_convert_data) if Pipeline.filter_tfvars(hcl_convert_data) else [],
+            "spark_envs": Pipeline.map_databricks_secrets_spark_env(hcl_convert_data),
+        }
+
     @staticmethod
     def make_mapped_variables_handler(base_path):
         @HCLConvertData.manage_error
         def _save_mapped_variables(hcl_convert_data_list: List[HCLConvertData]):
             tjb = TerraformJsonBuilder()
             for hcl_convert_data in hcl_convert_data_list:
-                for mapped_var in hcl_convert_data.mapped_variables:
-                    try:
-                        tjb.add_variable(mapped_var.variable_name, mapped_var.to_dict())
-                    except ValueError as e:
-                        log.debug(f"Attempting to add another instance of {mapped_var} so skipping.")
-                    # tjb.add_variable(mapped_var.variable_name, mapped_var.to_dict())
-            mapped_variables_json = tjb.to_json()
-            with ExportFileUtils.make_mapped_vars_path(base_path).open("w+") as f:
-                f.write(mapped_variables_json)
-                f.flush()
+                Pipeline.add_mapped_variables(tjb, hcl_convert_data)
+            Pipeline.write_mapped_variables(base_path, tjb)
             return hcl_convert_data_list
 
         return _save_mapped_variables
 
+    @staticmethod
+    def add_mapped_variables(tjb: TerraformJsonBuilder, hcl_convert_data: HCLConvertData):
+        for mapped_var in hcl_convert_data.mapped_variables:
+            try:
+                tjb.add_variable(mapped_var.variable_name, mapped_var.to_dict())
+            except ValueError as e:
+                log.debug(f"Attempting to add another instance of {mapped_var} so skipping.")
+
+    @staticmethod
+    def write_mapped_variables(base_path, tjb: TerraformJsonBuilder):
+        mapped_variables_json = tjb.to_json()
+        with ExportFileUtils.make_mapped_vars_path(base_path).open("w+") as f:
+            f.write(mapped_variables_json)
+            f.flush()
+
+    @staticmethod
+    def make_mapped_variables_collector(tjb: TerraformJsonBuilder):
+        # Only the variables are kept and not the data so memory does not grow with the number of exported objects
+        @HCLConvertData.manage_error
+        def _collect_mapped_variables(hcl_convert_data: HCLConvertData):
+            if Pipeline.filter_mapped_variables(hcl_convert_data):
+                Pipeline.add_mapped_variables(tjb, hcl_convert_data)
+            return hcl_convert_data
+
+        return _collect_mapped_variables
+
+    @staticmethod
+    def make_tfvars_collector(tfvars: set):
+        @HCLConvertData.manage_error
+        def _collect_tfvars(hcl_convert_data: HCLConvertData):
+            if Pipeline.filter_tfvars(hcl_convert_data) and len(hcl_convert_data.errors) == 0:
+                tfvars.update(Pipeline.map_tfvars(hcl_convert_data))
+            return hcl_convert_data
+
+        return _collect_tfvars
+
+    @staticmethod
+    def make_spark_env_collector(spark_envs: set):
+        @HCLConvertData.manage_error
+        def _collect_spark_envs(hcl_convert_data: HCLConvertData):
+            if len(hcl_convert_data.errors) == 0 \
+                    and hcl_convert_data.resource_name == ResourceCatalog.SECRET_RESOURCE:
+                spark_envs.update(Pipeline.map_databricks_secrets_spark_env(hcl_convert_data))
+            return hcl_convert_data
+
+        return _collect_spark_envs
+
+    @staticmethod
+    def _sort_vars(vars: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        # Generators run concurrently so the arrival order of variables is not stable between runs
+        return sorted(vars, key=lambda var: (var[0], str(var[1])))
+
     @staticmethod
     def make_spark_env_handler(base_path):
         def _save_spark_env_conf(vars: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
             with ExportFileUtils.make_databricks_spark_env(base_path).open("w+") as f:
-                for var in vars:
+                for var in Pipeline._sort_vars(vars):
                     key = var[0]
                     val = var[1]
                     env_var = f'{key}={val}'
@@ -507,12 +666,12 @@ class Pipeline:
     def make_tfvars_handler(base_path):
         def _save_tfvars(vars: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
             with ExportFileUtils.make_tfvars(base_path).open("w+") as f:
-                for var in vars:
+                for var in Pipeline._sort_vars(vars):
                     val = var[1] if var[1] is not None else ''
                     f.write(f'{var[0]}="{val}"\n')
                     f.flush()
             with ExportFileUtils.make_tfvars_env_file(base_path).open("w+") as f:
-                for var in vars:
+                for var in Pipeline._sort_vars(vars):
                     val = var[1] if var[1] is not None else ''
                     f.write(f'export TF_VAR_{var[0]}="{val}"\n')
                     f.flush()
@@ -520,9 +679,63 @@ class Pipeline:
 
         return _save_tfvars
 
+    def __wire_engine(self, debug: bool) -> PipelineEngine:
+        engine = PipelineEngine()
+        stage_executor = self.__stage_executor
+        # Generator specific stages (i.e. downloading artifacts) run before merging into the processors, stages are
+        # added in topological order so that the engine can drain them upstream first
+        generator_stages = [(g, [engine.add_stage(f"{g.folder_name}.{func.__name__}", func,
+                                                  stage_executor=stage_executor) for func in g.stages])
+                            for g in self.__generators]
+        processed = engine.add_stage("apply_processors", Pipeline.apply_processors, stage_executor=stage_executor)
+        for g, stages in generator_stages:
+            chain = stages + [processed]
+            engine.add_source(g, chain[0])
+            for upstream, downstream in zip(chain, chain[1:]):
+                upstream.to(downstream)
+
+        resource_files = engine.add_stage("save_hcl", Pipeline.make_resource_files_handler(debug),
+                                          stage_executor=stage_executor)
+        results = engine.add_stage("pipeline_results", self.__pipeline_results.add_hcl_data, verify_error=False)
+        processed.to(
+            resource_files,
+            engine.add_stage("mapped_variables", Pipeline.make_mapped_variables_collector(self.__mapped_variables)),
+            engine.add_stage("tfvars", Pipeline.make_tfvars_collector(self.__tfvars)),
+            engine.add_stage("spark_env", Pipeline.make_spark_env_collector(self.__spark_envs)),
+        )
+        resource_files.to(results)
+        return engine
+
+    def __collect_skipped_variables(self):
+        # Objects skipped by a resumed run are not exported again but their variables still belong to the export
+        for variables in self.__resume.skipped_variables:
+            for variable_name, variable in variables["mapped_variables"].items():
+                try:
+                    self.__mapped_variables.add_variable(variable_name, variable)
+                except ValueError:
+                    log.debug(f"Attempting to add another instance of {variable_name} so skipping.")
+            self.__tfvars.update(tuple(var) for var in variables["tfvars"])
+            self.__spark_envs.update(tuple(var) for var in variables["spark_envs"])
+
+    def __write_manifests(self):
+        for generator in self.__generators:
+            if isinstance(generator, DownloaderAPIGenerator):
+                generator.write_manifest()
+
+    def __write_collected_variables(self):
+        if self.__resume is not None:
+            self.__collect_skipped_variables()
+        Pipeline.write_mapped_variables(self._base_path, self.__mapped_variables)
+        Pipeline.make_tfvars_handler(self._base_path)(list(self.__tfvars))
+        Pipeline.make_spark_env_handler(self._base_path)(list(self.__spark_envs))
+
     def wire(self):
         debug = False
 
+        if not self.has_dask_client:
+            self.__engine = self.__wire_engine(debug)
+            return
+
         for g in self.__generators:
             g.set_dask_conf(self.has_dask_client, buffer=8)
 
@@ -592,6 +805,13 @@ class Pipeline:
             self.__wait_for_all_dask_futures()
 
     def run(self):
-        self.__generate_all()
-        self.__flush_map_var_collectors()
+        if self.__engine is not None:
+            asyncio.get_event_loop().run_until_complete(self.__engine.run())
+            self.__write_collected_variables()
+            self.__write_manifests()
+            self.__pipeline_results.summary["pipeline_stages"] = self.__engine.stats()
+        else:
+            self.__generate_all()
+            self.__flush_map_var_collectors()
+        self.__pipeline_results.summary["api_requests"] = rate_limiter.summary()
         log.info(self.__pipeline_results)
@@ -94,11 +94,24 @@ class MappedGrokVariableBasicAnnotationProcessor(Processor):
                 # key not found in this array slot lets go to next one
                 idx += 1
 
+    @staticmethod
+    def _copy_on_write_set(data: Dict[str, Any], dot_path: str, value: Any) -> Dict[str, Any]:
+        # Only the dicts and lists along the dot path are copied, every untouched sub tree is shared with the source.
+        # The path is split by Dotty itself so that escaped dots (i.e. spark_conf.spark\.foo) stay in their key.
+        def set_to(node, parts):
+            part = int(parts[0]) if isinstance(node, list) and parts[0].isdigit() else parts[0]
+            new_node = copy.copy(node)
+            new_node[part] = value if len(parts) == 1 else set_to(node[part], parts[1:])
+            return new_node
+
+        return set_to(data, Dotty(data)._split(dot_path))
+
     def __process_map_var_in_dict(self, data: Dict[str, Any],
                                   map_var_dot_path: str,
                                   terraform_model: Union[List[Tuple[str]], HCLConvertData]):
-        # Deep copy to avoid mutating the source dictionary
-        dotty_data = Dotty(copy.deepcopy(data))
+        # The source dictionary is never mutated, modified values are written to a copy on write version of it
+        dotty_data = Dotty(data)
+        processed_data = data
         for key, raw_value in self._generate_keys_and_value(map_var_dot_path, dotty_data):
             final_lines = []
             for line in str(raw_value).split("\n"):
@@ -113,8 +126,8 @@ class MappedGrokVariableBasicAnnotationProcessor(Processor):
                 if isinstance(terraform_model, list):
                     terraform_model.append((variable_name, groked_value))
                 final_lines.append(final_value)
-            dotty_data[key] = "\n".join(final_lines)
-        return dotty_data.to_dict()
+            processed_data = self._copy_on_write_set(processed_data, key, "\n".join(final_lines))
+        return processed_data
 
     def __process_latest_version(self, map_var_dot_path, terraform_model: HCLConvertData):
         processed_dictionary = self.__process_map_var_in_dict(terraform_model.latest_version,
@@ -133,7 +146,7 @@ class MappedGrokVariableBasicAnnotationProcessor(Processor):
 
     def process_dict(self, json_dict: Dict[str, Any]):
         list_of_vars = []
-        processed_dictionary = copy.deepcopy(json_dict)
+        processed_dictionary = json_dict
         for map_var_dot_path in self.__dot_paths:
             processed_dictionary = self.__process_map_var_in_dict(processed_dictionary,
                                                                   map_var_dot_path,
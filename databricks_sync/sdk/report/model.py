@@ -1,10 +1,11 @@
 import base64
 import datetime
+import json
 import os
 import traceback
 import uuid
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Tuple
 
 import pandas as pd
 from sqlalchemy import create_engine, Column, String, DateTime, UniqueConstraint, and_, update, text
@@ -60,16 +61,55 @@ class ReportRecord(Base):
         return "test"
 
 
+class CheckpointRecord(Base):
+    # The variables collected from a successfully exported object so a resumed run can skip exporting it again
+    __tablename__ = 'checkpoint_records'
+
+    id = Column(String, primary_key=True)
+    run_id = Column(String)
+    workspace_url = Column(String)
+    object_id = Column(String)
+    object_type = Column(String)
+    variables = Column(String)
+
+
 class DBManager:
 
-    def __init__(self, run_id, session):
+    def __init__(self, run_id, session, resumed=False):
         self._session = session
         self.__run_id = run_id
+        self.__resumed = resumed
 
     @property
     def run_id(self):
         return self.__run_id
 
+    @property
+    def resumed(self):
+        return self.__resumed
+
+    def resume_run(self, run_id):
+        # Records of a resumed run already exist so they are updated rather than added
+        self.__run_id = run_id
+        self.__resumed = True
+
+    def _save(self, record):
+        if self.__resumed is True:
+            self._session.merge(record)
+        else:
+            self._session.add(record)
+
+    @staticmethod
+    def _make_file_session(db_path: Path):
+        file_engine = create_engine(f"{driver}:///{db_path}")
+        Base.metadata.create_all(file_engine)
+        return sessionmaker(bind=file_engine)()
+
+    @staticmethod
+    def _copy_record(record: 'ReportRecord', **overrides) -> 'ReportRecord':
+        values = {column.name: getattr(record, column.name) for column in ReportRecord.__table__.columns}
+        return ReportRecord(**{**values, **overrides})
+
 
 class EventManager(DBManager):
 
@@ -86,10 +126,34 @@ class EventManager(DBManager):
             api_object_id=api_object_id,
             object_name=human_readable_name,
             object_type=object_type,
-            status="STARTED")
-        self._session.add(record)
+            status=ReportConstants.OBJECT_EXPORT_STARTED,
+            end_ts=None,
+            file_path=None,
+            error_msg=None,
+            error_traceback=None,
+            validation_msg=None,
+            validation_traceback=None)
+        self._save(record)
         self._session.commit()
 
+    def make_checkpoint_record(self, workspace_url, object_id, object_type, variables: Dict[str, Any]):
+        # Committed along with the end record of the object
+        self._save(CheckpointRecord(
+            id=self.get_record_id(workspace_url, object_id, object_type),
+            run_id=self.run_id,
+            workspace_url=workspace_url,
+            object_id=object_id,
+            object_type=object_type,
+            variables=json.dumps(variables)))
+
+    def get_run_statuses(self, run_id) -> Dict[Tuple[str, str], str]:
+        return {(record.object_type, record.object_id): record.status for record in
+                self._session.query(ReportRecord).filter(ReportRecord.run_id == run_id).all()}
+
+    def get_run_checkpoints(self, run_id) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        return {(record.object_type, record.object_id): json.loads(record.variables) for record in
+                self._session.query(CheckpointRecord).filter(CheckpointRecord.run_id == run_id).all()}
+
     def make_end_record(self, workspace_url, object_id, object_type, status, errors: Optional[List[Exception]] = None,
                         file_path=None):
         for record in self._session.query(ReportRecord) \
@@ -106,6 +170,28 @@ class EventManager(DBManager):
             record.file_path = file_path
             self._session.commit()
 
+    def load_run(self, db_path: Path) -> List[str]:
+        # Records of a shard are added to this run so the report covers all the shards
+        file_session = self._make_file_session(db_path)
+        workspace_urls = set()
+        try:
+            for record in file_session.query(ReportRecord).order_by(ReportRecord.id).all():
+                workspace_urls.add(record.workspace_url)
+                self._session.merge(self._copy_record(
+                    record,
+                    id=self.get_record_id(record.workspace_url, record.object_id, record.object_type),
+                    run_id=self.run_id))
+            self._session.commit()
+        finally:
+            file_session.close()
+        return sorted(workspace_urls)
+
+    def clear_validation_records(self):
+        # The export of a resumed run is validated again as a whole
+        self._session.query(ReportRecord).filter(ReportRecord.run_id == self.run_id) \
+            .update({ReportRecord.validation_msg: None, ReportRecord.validation_traceback: None})
+        self._session.commit()
+
     def make_validation_records(self, workspace_url, paths: List[str], validation_msg_list: List[str],
                                 validation_traceback_list: List[str]):
         for path, validation_msg, validation_tb in zip(paths, validation_msg_list, validation_traceback_list):
@@ -135,7 +221,9 @@ class EventManager(DBManager):
 
 
 class ReportConstants:
+    OBJECT_EXPORT_STARTED = "STARTED"
     OBJECT_EXPORT_SUCCEEDED = "SUCCEEDED"
+    OBJECT_EXPORT_FAILED = "FAILED"
     OBJECT_EXPORT_ERROR = "EXPORT ERROR"
     OBJECT_VALIDATION_ERROR = "VALIDATION ERROR"
     OBJECT_VALIDATION_PASSED = "PASSED"
@@ -143,13 +231,25 @@ class ReportConstants:
 
 class ReportManager(DBManager):
 
-    def __init__(self, run_id, session):
-        super().__init__(run_id, session)
+    def __init__(self, run_id, session, resumed=False):
+        super().__init__(run_id, session, resumed=resumed)
         self.run_summary: Optional[pd.DataFrame] = None
         self.run_errors: Optional[pd.DataFrame] = None
         self.run_results: Optional[pd.DataFrame] = None
         self.run_errors_summary: Optional[pd.DataFrame] = None
 
+    def save_run(self, db_path: Path):
+        # Writes the records of this run into a standalone db which travels with the exported files of a shard
+        if db_path.exists():
+            db_path.unlink()
+        file_session = self._make_file_session(db_path)
+        try:
+            for record in self._session.query(ReportRecord).filter(ReportRecord.run_id == self.run_id).all():
+                file_session.add(self._copy_record(record))
+            file_session.commit()
+        finally:
+            file_session.close()
+
     def fetch_and_gather_results(self, workspace_url):
         self.run_summary = self.__get_run_summary_df(workspace_url)
         self.run_errors = self.__get_run_errors_df(workspace_url)
@@ -292,6 +392,8 @@ Session = sessionmaker(bind=engine)
 
 # create a Session
 session = Session()
-run_id = str(uuid.uuid4())
+# Export processes spawned by the same export share the run id of the coordinator
+RUN_ID_ENV_VAR = "DATABRICKS_SYNC_RUN_ID"
+run_id = os.environ.get(RUN_ID_ENV_VAR) or str(uuid.uuid4())
 event_manager = EventManager(run_id=run_id, session=session)
 report_manager = ReportManager(run_id=run_id, session=session)
@@ -0,0 +1,302 @@
+import asyncio
+import collections
+import functools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Any, Optional, Awaitable, Dict, List, Iterable, AsyncIterator, Tuple, Iterator
+
+from databricks_sync import log
+
+
+class RequestPool:
+    """
+    The RequestPool is a process wide bounded pool of worker threads that performs the blocking api calls made by the
+    services. Generators await the calls through the pool so that their round trips overlap on the event loop while
+    never having more than max_concurrent_requests requests in flight against the workspace.
+    """
+    DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+
+    def __init__(self, max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS):
+        self.__max_concurrent_requests = max_concurrent_requests
+        self.__executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def max_concurrent_requests(self) -> int:
+        return self.__max_concurrent_requests
+
+    def configure(self, max_concurrent_requests: int):
+        if max_concurrent_requests is None or max_concurrent_requests < 1:
+            raise ValueError(f"max concurrent requests should be a positive integer but got: "
+                             f"{max_concurrent_requests}")
+        # Executor is lazily recreated with the new size on the next submitted request
+        self.shutdown()
+        self.__max_concurrent_requests = max_concurrent_requests
+        log.info(f"Configured request pool with {max_concurrent_requests} concurrent requests.")
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__max_concurrent_requests,
+                                                 thread_name_prefix="databricks-sync-request")
+        return self.__executor
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        return self.__get_executor().submit(func, *args, **kwargs)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+
+class AsyncService:
+    """
+    Wraps any service (databricks_cli services or the ones in databricks_sync.sdk.service) so that every method call
+    returns an awaitable which is executed on the request pool.
+    """
+
+    def __init__(self, service, pool: 'RequestPool' = None):
+        self._service = service
+        self._pool = pool or request_pool
+
+    @property
+    def service(self):
+        return self._service
+
+    def __getattr__(self, name):
+        attr = getattr(self._service, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self._pool.run(attr, *args, **kwargs)
+
+        return wrapper
+
+
+request_pool = RequestPool()
+
+
+class ListingPrefetcher:
+    """
+    Lists the folders of a tree ahead of a depth first walk over it. The walk queues the sub folders of every folder it
+    enters and up to max_prefetch queued folders are listed concurrently while the walk consumes the listings in its
+    own order, so the walk still yields in the order of a sequential one. Sub folders of the folder being walked are
+    needed before anything queued earlier so they are listed first.
+    """
+    DEFAULT_MAX_PREFETCH = 32
+
+    def __init__(self, list_func: Callable[[str], Awaitable[Any]], max_prefetch: int = DEFAULT_MAX_PREFETCH):
+        if max_prefetch is None or max_prefetch < 1:
+            raise ValueError(f"max prefetch should be a positive integer but got: {max_prefetch}")
+        self.__list_func = list_func
+        self.__max_prefetch = max_prefetch
+        self.__queued = collections.deque()
+        self.__listings: Dict[str, asyncio.Future] = {}
+        self.__consumed = set()
+
+    def queue(self, paths: List[str]):
+        self.__queued.extendleft(reversed(paths))
+        self.__schedule()
+
+    def __schedule(self):
+        while len(self.__listings) < self.__max_prefetch and len(self.__queued) > 0:
+            path = self.__queued.popleft()
+            if path not in self.__consumed and path not in self.__listings:
+                self.__listings[path] = asyncio.ensure_future(self.__list_func(path))
+
+    async def get(self, path: str) -> Any:
+        self.__consumed.add(path)
+        listing = self.__listings.pop(path, None)
+        if listing is None:
+            # Not listed ahead yet (i.e. the root or more queued folders than max_prefetch)
+            listing = asyncio.ensure_future(self.__list_func(path))
+        self.__schedule()
+        return await listing
+
+    def close(self):
+        # Listings ahead of a walk which stopped early are not needed anymore
+        for listing in self.__listings.values():
+            if listing.done() and not listing.cancelled():
+                listing.exception()
+            listing.cancel()
+        self.__listings.clear()
+        self.__queued.clear()
+
+
+async def prefetch_ordered(func: Callable[[Any], Awaitable[Any]], items: Iterable[Any],
+                           max_prefetch: int) -> AsyncIterator[Tuple[Any, Any]]:
+    """
+    Awaits func for every item with up to max_prefetch of them in flight and yields the items with their results in the
+    order of the items, so the output of a generator does not depend on which request finishes first.
+    """
+    if max_prefetch is None or max_prefetch < 1:
+        raise ValueError(f"max prefetch should be a positive integer but got: {max_prefetch}")
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append((item, asyncio.ensure_future(func(item))))
+            if len(pending) >= max_prefetch:
+                next_item, result = pending.popleft()
+                yield next_item, await result
+        while len(pending) > 0:
+            next_item, result = pending.popleft()
+            yield next_item, await result
+    finally:
+        # Results ahead of a consumer which stopped early are not needed anymore
+        for _, result in pending:
+            result.cancel()
+
+
+class ByteBudget:
+    """
+    The ByteBudget is a process wide limit of the artifact bytes which downloads hold in memory, from the moment they
+    are fetched until they are written to disk. Downloads reserve the bytes of a chunk before fetching it and wait
+    while the budget is used up so that concurrent downloads can not exhaust the memory. A chunk larger than the whole
+    budget is still allowed once nothing else is held, otherwise it would wait forever. Downloads whose size is only
+    known once they are fetched reserve an estimate (or their maximum size) and resize the reservation afterwards, they
+    only exceed the budget by the difference while they are held.
+    """
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.__max_bytes = max_bytes
+        self.__in_flight = 0
+        self.__condition = threading.Condition()
+
+    @property
+    def max_bytes(self) -> int:
+        return self.__max_bytes
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    def configure(self, max_bytes: int):
+        if max_bytes is None or max_bytes < 1:
+            raise ValueError(f"max download bytes should be a positive integer but got: {max_bytes}")
+        with self.__condition:
+            self.__max_bytes = max_bytes
+            self.__condition.notify_all()
+        log.info(f"Configured download budget with {max_bytes} bytes in flight.")
+
+    def __fits(self, size: int) -> bool:
+        return self.__in_flight == 0 or self.__in_flight + size <= self.__max_bytes
+
+    def try_acquire(self, size: int) -> bool:
+        with self.__condition:
+            if not self.__fits(size):
+                return False
+            self.__in_flight += size
+            return True
+
+    def acquire(self, size: int):
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__fits(size))
+            self.__in_flight += size
+
+    def release(self, size: int):
+        with self.__condition:
+            self.__in_flight -= size
+            self.__condition.notify_all()
+
+    def adjust(self, size: int):
+        # Bytes which are already held are added without waiting, negative sizes give the bytes back
+        if size < 0:
+            self.release(-size)
+        else:
+            with self.__condition:
+                self.__in_flight += size
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator['ByteReservation']:
+        self.acquire(size)
+        reservation = ByteReservation(self, size)
+        try:
+            yield reservation
+        finally:
+            self.release(reservation.size)
+
+
+class ByteReservation:
+    """
+    The bytes reserved from a ByteBudget by one download, resized once the actual size of the download is known.
+    """
+
+    def __init__(self, budget: ByteBudget, size: int):
+        self.__budget = budget
+        self.size = size
+
+    def resize(self, size: int):
+        self.__budget.adjust(size - self.size)
+        self.size = size
+
+
+download_budget = ByteBudget()
+
+
+class OrderedTurns:
+    """
+    Lets coroutines which finish out of order take turns in the order they started, e.g. the workers of a pipeline
+    stage handing their results downstream in the order the items were submitted. A ticket is taken when the work
+    starts, its turn is awaited once the work is done and the turn is passed on with done (also when the work failed).
+    """
+
+    def __init__(self):
+        self.__next_ticket = 0
+        self.__turn = 0
+        # Created on first use so that it belongs to the running event loop
+        self.__condition: Optional[asyncio.Condition] = None
+
+    def __get_condition(self) -> asyncio.Condition:
+        if self.__condition is None:
+            self.__condition = asyncio.Condition()
+        return self.__condition
+
+    def take(self) -> int:
+        ticket = self.__next_ticket
+        self.__next_ticket += 1
+        return ticket
+
+    async def wait(self, ticket: int):
+        condition = self.__get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.__turn == ticket)
+
+    async def done(self, ticket: int):
+        condition = self.__get_condition()
+        async with condition:
+            self.__turn = ticket + 1
+            condition.notify_all()
+
+
+class StageExecutor:
+    """
+    The StageExecutor runs the cpu light, io heavy pipeline stages (downloads, processors and writing the resource
+    files) on a bounded thread pool. It is a lightweight alternative to the dask mode which avoids the cluster start
+    up and the pickling of every message. The results finish in any order, stages put them back in submission order
+    with OrderedTurns.
+    """
+
+    def __init__(self, workers: int):
+        if workers is None or workers < 1:
+            raise ValueError(f"workers should be a positive integer but got: {workers}")
+        self.__workers = workers
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="databricks-sync-stage")
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        return self.__executor.submit(func, *args, **kwargs)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True)
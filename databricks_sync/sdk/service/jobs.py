@@ -0,0 +1,31 @@
+import copy
+import re
+
+from databricks_sync.sdk.service.rate_limit import RateLimitedApiClient
+
+
+def with_api_version(client, api_version: str):
+    # The databricks cli client is bound to the url of one api version, a copy of it shares its session and limits
+    if isinstance(client, RateLimitedApiClient):
+        return RateLimitedApiClient(with_api_version(client.api_client, api_version), limiter=client.limiter)
+    versioned_client = copy.copy(client)
+    versioned_client.url = re.sub(r"/api/[0-9.]+/?$", f"/api/{api_version}", client.url)
+    return versioned_client
+
+
+class Jobs21Service(object):
+    API_VERSION = "2.1"
+    MAX_PAGE_SIZE = 25
+
+    def __init__(self, client):
+        self.client = with_api_version(client, self.API_VERSION)
+
+    def list_jobs(self, offset=None, limit=None, expand_tasks=None, headers=None):
+        _data = {}
+        if offset is not None:
+            _data['offset'] = offset
+        if limit is not None:
+            _data['limit'] = limit
+        if expand_tasks is not None:
+            _data['expand_tasks'] = expand_tasks
+        return self.client.perform_query('GET', '/jobs/list', data=_data, headers=headers)
@@ -0,0 +1,249 @@
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Callable, Any
+
+import requests
+
+from databricks_sync import log
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket which refills at rate tokens per second and holds at most burst tokens.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        if rate is None or rate <= 0:
+            raise ValueError(f"rate should be a positive number but got: {rate}")
+        self.__rate = float(rate)
+        self.__burst = float(burst or max(rate, 1))
+        self.__tokens = self.__burst
+        self.__last_refill = time.monotonic()
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    def __refill(self, now: float):
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__last_refill) * self.__rate)
+        self.__last_refill = now
+
+    def acquire(self):
+        while True:
+            with self.__lock:
+                self.__refill(time.monotonic())
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.__rate
+            time.sleep(wait)
+
+
+class EndpointFamilyLimiter:
+    """
+    Limits the requests of a single endpoint family (scim, permissions, workspace, etc). The request rate is bound
+    by a token bucket and the number of requests in flight by an AIMD window: every successful request grows the
+    window additively by one request per window and every throttled request halves it. A Retry-After sent by the
+    workspace pauses the whole family until it passes.
+    """
+
+    def __init__(self, name: str, rate: float, max_concurrency: int):
+        self.name = name
+        self.__bucket = TokenBucket(rate)
+        self.__max_concurrency = max_concurrency
+        self.__window = float(max_concurrency)
+        self.__in_flight = 0
+        self.__paused_until = 0.0
+        self.__condition = threading.Condition()
+
+    @property
+    def window(self) -> float:
+        return self.__window
+
+    def acquire(self):
+        with self.__condition:
+            while self.__in_flight >= int(self.__window):
+                self.__condition.wait()
+            self.__in_flight += 1
+        pause = self.__paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        self.__bucket.acquire()
+
+    def release(self, throttled: bool, retry_after: Optional[float] = None):
+        with self.__condition:
+            self.__in_flight -= 1
+            if throttled:
+                self.__window = max(1.0, self.__window / 2)
+                if retry_after is not None:
+                    self.__paused_until = max(self.__paused_until, time.monotonic() + retry_after)
+                log.debug(f"Throttled on {self.name} reducing concurrency window to {int(self.__window)}")
+            else:
+                self.__window = min(float(self.__max_concurrency), self.__window + 1 / self.__window)
+            self.__condition.notify_all()
+
+
+class RateLimiter:
+    """
+    Process wide adaptive rate limiter which every api request is routed through. Requests are grouped into endpoint
+    families based on their path and each family has its own limits. Requests that are throttled by the workspace
+    (429 or 503) are retried honouring the Retry-After header or with an exponential backoff.
+    """
+    DEFAULT_FAMILY = "default"
+    DEFAULT_REQUESTS_PER_SECOND = 30.0
+    DEFAULT_MAX_CONCURRENCY = 16
+    DEFAULT_MAX_RETRIES = 6
+    MAX_BACKOFF_SECONDS = 60.0
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(self, family_rates: Dict[str, float] = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_seconds: float = 1.0):
+        self.__lock = threading.Lock()
+        self.__family_rates: Dict[str, float] = {}
+        self.__max_concurrency = max_concurrency
+        self.__max_retries = max_retries
+        self.__backoff_seconds = backoff_seconds
+        self.__families: Dict[str, EndpointFamilyLimiter] = {}
+        self.__throttle_counts: Dict[str, int] = defaultdict(int)
+        self.__request_counts: Dict[str, int] = defaultdict(int)
+        self.configure(family_rates or {})
+
+    def configure(self, family_rates: Dict[str, float], max_concurrency: int = None):
+        for family, rate in family_rates.items():
+            if rate is None or rate <= 0:
+                raise ValueError(f"rate limit for {family} should be a positive number but got: {rate}")
+        with self.__lock:
+            self.__family_rates = {self.DEFAULT_FAMILY: self.DEFAULT_REQUESTS_PER_SECOND, **family_rates}
+            self.__max_concurrency = max_concurrency or self.__max_concurrency
+            self.__families = {}
+            self.__throttle_counts.clear()
+            self.__request_counts.clear()
+
+    @staticmethod
+    def get_family(path: str) -> str:
+        # /preview/scim/v2/Users -> scim, /workspace/list -> workspace
+        parts = [part for part in path.split("?")[0].split("/") if part != ""]
+        if len(parts) > 0 and parts[0] == "preview":
+            parts = parts[1:]
+        return parts[0] if len(parts) > 0 else RateLimiter.DEFAULT_FAMILY
+
+    def __get_family_limiter(self, family: str) -> EndpointFamilyLimiter:
+        with self.__lock:
+            if family not in self.__families:
+                rate = self.__family_rates.get(family, self.__family_rates[self.DEFAULT_FAMILY])
+                self.__families[family] = EndpointFamilyLimiter(family, rate, self.__max_concurrency)
+            return self.__families[family]
+
+    @staticmethod
+    def get_retry_after(response) -> Optional[float]:
+        value = getattr(response, "headers", {}).get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def __is_throttled(self, err: requests.HTTPError) -> bool:
+        return err.response is not None and err.response.status_code in self.THROTTLE_STATUS_CODES
+
+    def call(self, path: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        family = self.get_family(path)
+        limiter = self.__get_family_limiter(family)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            with self.__lock:
+                self.__request_counts[family] += 1
+            try:
+                resp = func(*args, **kwargs)
+            except requests.HTTPError as he:
+                if not self.__is_throttled(he):
+                    limiter.release(throttled=False)
+                    raise
+                retry_after = self.get_retry_after(he.response)
+                limiter.release(throttled=True, retry_after=retry_after)
+                with self.__lock:
+                    self.__throttle_counts[family] += 1
+                if attempt >= self.__max_retries:
+                    log.error(f"Giving up on {path} after being throttled {attempt + 1} times.")
+                    raise
+                wait = retry_after if retry_after is not None \
+                    else min(self.MAX_BACKOFF_SECONDS, self.__backoff_seconds * 2 ** attempt)
+                log.info(f"Throttled with status {he.response.status_code} on {path} retrying in {wait} seconds.")
+                attempt += 1
+                time.sleep(wait)
+                continue
+            except Exception:
+                limiter.release(throttled=False)
+                raise
+            limiter.release(throttled=False)
+            return resp
+
+    def summary(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {
+                "requests": dict(sorted(self.__request_counts.items())),
+                "throttled": dict(sorted(self.__throttle_counts.items())),
+                "concurrency_windows": {family: int(limiter.window)
+                                        for family, limiter in sorted(self.__families.items())},
+            }
+
+
+class RateLimitedApiClient:
+    """
+    Drop in replacement for the databricks_cli ApiClient which routes perform_query through the rate limiter so that
+    every service built on top of it (databricks_cli services, ScimService, PermissionService, PolicyService,
+    GlobalInitScriptsService, etc) shares the same limits.
+    """
+
+    def __init__(self, api_client, limiter: RateLimiter = None):
+        self.__api_client = api_client
+        self.__limiter = limiter
+
+    @property
+    def api_client(self):
+        return self.__api_client
+
+    @property
+    def session(self):
+        return self.__api_client.session
+
+    @session.setter
+    def session(self, session):
+        # The session is used by the wrapped client so it has to be replaced there
+        self.__api_client.session = session
+
+    @property
+    def limiter(self) -> RateLimiter:
+        return self.__limiter or rate_limiter
+
+    def perform_query(self, method, path, data={}, headers=None):
+        return self.limiter.call(path, self.__api_client.perform_query, method, path, data=data, headers=headers)
+
+    def __getattr__(self, name):
+        if name.startswith("_RateLimitedApiClient__"):
+            raise AttributeError(name)
+        return getattr(self.__api_client, name)
+
+    def __deepcopy__(self, memo):
+        # The client and its limits are shared by every message so there is nothing to copy
+        return self
+
+    def __getstate__(self):
+        # Locks can not be pickled (dask mode), the process wide limiter is used after unpickling
+        return {"api_client": self.__api_client}
+
+    def __setstate__(self, state):
+        self.__api_client = state["api_client"]
+        self.__limiter = None
+
+
+rate_limiter = RateLimiter()
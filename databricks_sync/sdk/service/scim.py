@@ -1,9 +1,22 @@
-import functools
+import asyncio
+import concurrent.futures
+import threading
+import weakref
+from typing import Callable, Awaitable, Dict, Any, List, AsyncIterator, Tuple
 
 from databricks_sync import log
+from databricks_sync.sdk.service.concurrency import AsyncService, prefetch_ordered
 
 
 class ScimService(object):
+    PAGE_SIZE = 500
+    MAX_PREFETCH_PAGES = 4
+    MAX_RELISTS = 3
+    # Only the attributes which are read by the identity export and the user path validation are listed
+    USER_ATTRIBUTES = ["id", "userName", "displayName", "active", "entitlements", "roles", "groups"]
+    GROUP_ATTRIBUTES = ["id", "displayName", "members", "roles", "entitlements"]
+    SERVICE_PRINCIPAL_ATTRIBUTES = ["id", "applicationId", "displayName", "active", "entitlements"]
+
     def __init__(self, client):
         self.client = client
 
@@ -12,10 +25,20 @@ class ScimService(object):
         return self.client.perform_query('GET', f"/preview/scim/v2/Me", data=_data,
                                          headers=headers)
 
-    @functools.lru_cache(maxsize=None)
-    def list_users(self, headers=None):
+    @staticmethod
+    def __page_data(start_index=None, count=None, attributes=None):
         _data = {}
-        log.info("Fetching all of the users in the workspace.")
+        if start_index is not None:
+            _data['startIndex'] = start_index
+        if count is not None:
+            _data['count'] = count
+        if attributes is not None:
+            _data['attributes'] = ",".join(attributes)
+        return _data
+
+    def list_users(self, start_index=None, count=None, attributes=None, headers=None):
+        _data = self.__page_data(start_index, count, attributes)
+        log.info(f"Fetching the users in the workspace starting at: {start_index or 1}.")
         return self.client.perform_query('GET', f"/preview/scim/v2/Users", data=_data,
                                          headers=headers)
 
@@ -24,22 +47,20 @@ class ScimService(object):
         return self.client.perform_query('GET', f"/preview/scim/v2/Users/{id_}", data=_data,
                                          headers=headers)
 
-    @functools.lru_cache(maxsize=None)
-    def list_groups(self, headers=None):
-        _data = {}
-        log.info("Fetching all of the groups in the workspace.")
+    def list_groups(self, start_index=None, count=None, attributes=None, headers=None):
+        _data = self.__page_data(start_index, count, attributes)
+        log.info(f"Fetching the groups in the workspace starting at: {start_index or 1}.")
         return self.client.perform_query('GET', f"/preview/scim/v2/Groups", data=_data,
                                          headers=headers)
 
-    @functools.lru_cache(maxsize=None)
     def get_group_by_id(self, id, headers=None):
         _data = {}
         return self.client.perform_query('GET', f"/preview/scim/v2/Groups/{id}", data=_data,
                                          headers=headers)
 
-    def list_service_principals(self, headers=None):
-        _data = {}
-        log.info("Fetching all of the service principals in the workspace.")
+    def list_service_principals(self, start_index=None, count=None, attributes=None, headers=None):
+        _data = self.__page_data(start_index, count, attributes)
+        log.info(f"Fetching the service principals in the workspace starting at: {start_index or 1}.")
         return self.client.perform_query('GET', f"/preview/scim/v2/ServicePrincipals", data=_data,
                                          headers=headers)
 
@@ -47,3 +68,106 @@ class ScimService(object):
         _data = {}
         return self.client.perform_query('GET', f"/preview/scim/v2/ServicePrincipals/{id_}", data=_data,
                                          headers=headers)
+
+
+async def _iter_scim_pages(list_func: Callable[..., Awaitable[Dict[str, Any]]], attributes: List[str],
+                           page_size: int, max_prefetch: int) -> AsyncIterator[Tuple[bool, List[Dict[str, Any]]]]:
+    # Yields the resources of every page and whether the page starts with the last resource of the page before it
+    first_page = await list_func(start_index=1, count=page_size, attributes=attributes)
+    resources = first_page.get("Resources", [])
+    yield False, resources
+    total = first_page.get("totalResults", None)
+    # Listings which are not paginated return everything at once
+    if total is None or len(resources) == 0 or len(resources) > page_size or len(resources) >= total:
+        return
+    # The workspace may serve smaller pages than requested. Pages overlap by one resource to tell if the start indexes
+    # shifted, unless a single resource is served per page.
+    page_size = len(resources)
+    overlaps = page_size > 1
+    step = page_size - 1 if overlaps is True else page_size
+    last_start_index = total - 1 if overlaps is True else total
+
+    def list_page(start_index):
+        return list_func(start_index=start_index, count=page_size, attributes=attributes)
+
+    async for _, page in prefetch_ordered(list_page, range(1 + step, last_start_index + 1, step), max_prefetch):
+        yield overlaps, page.get("Resources", [])
+
+
+async def iter_scim_resources(list_func: Callable[..., Awaitable[Dict[str, Any]]], attributes: List[str] = None,
+                              page_size: int = ScimService.PAGE_SIZE,
+                              max_prefetch: int = ScimService.MAX_PREFETCH_PAGES,
+                              max_relists: int = ScimService.MAX_RELISTS) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterates over a SCIM listing, e.g. AsyncService(ScimService(client)).list_users, one page at a time. Once the first
+    page reports the total the next pages are listed concurrently and their resources are yielded in order. When the
+    pages shift while they are listed the listing starts again and only the resources which were not yielded yet are
+    yielded.
+    """
+    seen_ids = set()
+    relists = 0
+    while True:
+        shifted = False
+        last_id = None
+        pages = _iter_scim_pages(list_func, attributes, page_size, max_prefetch)
+        try:
+            async for overlaps, resources in pages:
+                # Resources deleted while listing shift the next pages back and the resources on the boundary are
+                # skipped
+                if overlaps is True and (len(resources) == 0 or resources[0].get("id") != last_id):
+                    shifted = True
+                    break
+                last_id = resources[-1].get("id") if len(resources) > 0 else None
+                for resource in resources:
+                    # Resources created while listing shift the next pages forward
+                    resource_id = resource.get("id", None)
+                    if resource_id is None or resource_id not in seen_ids:
+                        seen_ids.add(resource_id)
+                        yield resource
+        finally:
+            await pages.aclose()
+        if shifted is False:
+            return
+        if relists >= max_relists:
+            log.warning(f"SCIM resources keep changing while they are listed, resources which moved between the pages "
+                        f"of the listing may be missing from the export after {relists} attempts to list them again")
+            return
+        relists += 1
+        log.warning("SCIM resources were deleted while they were listed, listing all of them again to find the "
+                    "resources on the shifted pages")
+
+
+async def list_scim_resources(list_func: Callable[..., Awaitable[Dict[str, Any]]],
+                              attributes: List[str] = None) -> List[Dict[str, Any]]:
+    return [resource async for resource in iter_scim_resources(list_func, attributes)]
+
+
+class ScimUsers:
+    """
+    Lists the users once per client and shares them with every generator which needs them, e.g. the notebook export
+    validating user folders and the identity export.
+    """
+
+    def __init__(self):
+        self.__users = weakref.WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
+    async def get(self, client) -> List[Dict[str, Any]]:
+        with self.__lock:
+            users = self.__users.get(client, None)
+            is_listing = users is None
+            if is_listing is True:
+                users = self.__users[client] = concurrent.futures.Future()
+        if is_listing is True:
+            try:
+                users.set_result(await list_scim_resources(AsyncService(ScimService(client)).list_users,
+                                                           ScimService.USER_ATTRIBUTES))
+            except BaseException as e:
+                # Failed listings are not shared so that they can be tried again
+                with self.__lock:
+                    self.__users.pop(client, None)
+                users.set_exception(e)
+        return await asyncio.wrap_future(users)
+
+
+scim_users = ScimUsers()
@@ -0,0 +1,39 @@
+import requests
+from databricks_cli.sdk.api_client import TlsV1HttpAdapter
+
+from databricks_sync import log
+
+
+class HttpTransport:
+    """
+    A single keep-alive http session with a connection pool sized to the configured concurrency. It is bound to the
+    api client handed to every generator so that all the services reuse the same tls connections instead of every
+    request over the pool size opening and discarding its own connection.
+    """
+    DEFAULT_POOL_SIZE = 10
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        if pool_size is None or pool_size < 1:
+            raise ValueError(f"pool size should be a positive integer but got: {pool_size}")
+        self.__pool_size = pool_size
+        self.__session = requests.Session()
+        self.__session.mount("https://", TlsV1HttpAdapter(pool_maxsize=pool_size))
+        self.__session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+
+    @property
+    def pool_size(self) -> int:
+        return self.__pool_size
+
+    @property
+    def session(self) -> requests.Session:
+        return self.__session
+
+    def bind(self, api_client):
+        if getattr(api_client, "session", None) is not self.__session:
+            log.debug(f"Binding api client for {api_client.url} to the shared http session with pool size "
+                      f"{self.__pool_size}")
+            api_client.session = self.__session
+        return api_client
+
+    def close(self):
+        self.__session.close()
@@ -1,109 +1,355 @@
+import multiprocessing
+import os
+import shutil
 import tempfile
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Dict, Any, List
 
 from databricks_cli.sdk import ApiClient
 
 from databricks_sync import log
 from databricks_sync.cmds.config import SUPPORTED_IMPORTS
-from databricks_sync.sdk.config import export_config
+from databricks_sync.sdk.config import export_config, ExportConfig
 from databricks_sync.sdk.generators.factory import GeneratorFactory
 from databricks_sync.sdk.git_handler import GitHandler, LocalGitHandler, RemoteGitHandler
-from databricks_sync.sdk.pipeline import ExportFileUtils, Pipeline
-from databricks_sync.sdk.report.model import event_manager, report_manager
+from databricks_sync.sdk.manifest import ArtifactManifest
+from databricks_sync.sdk.message import HCLConvertData, LineagePolicy
+from databricks_sync.sdk.pipeline import ExportFileUtils, Pipeline, DownloaderAPIGenerator
+from databricks_sync.sdk.report.model import event_manager, report_manager, RUN_ID_ENV_VAR
 from databricks_sync.sdk.report.parsers import get_error_paths_and_content
+from databricks_sync.sdk.service.concurrency import request_pool, RequestPool, StageExecutor, ByteBudget, \
+    download_budget
+from databricks_sync.sdk.service.rate_limit import rate_limiter, RateLimitedApiClient, RateLimiter
+from databricks_sync.sdk.service.transport import HttpTransport
 from databricks_sync.sdk.sync import validate_dict
 from databricks_sync.sdk.sync.import_ import TerraformExecution
+from databricks_sync.sdk.sync.merge import ExportMerger
+from databricks_sync.sdk.sync.partition import ExportPartitioner, ExportPartition, ExportShard
+from databricks_sync.sdk.sync.resume import ExportResume
 from databricks_sync.sdk.terraform import TerraformCommandError
 
 
 class ExportCoordinator:
+    SHARD_REPORT_DB = "shard_report.db"
+    # Remote repositories are cloned into a working tree per run which is kept until the export is committed
+    RUNS_PATH = Path.home() / ".databricks_sync" / "runs"
 
     @staticmethod
-    def get_git_handler(local_git_path: Optional[str], git_ssh_url: Optional[str], tmp_dir: tempfile.TemporaryDirectory,
-                        branch="master") \
+    def get_git_handler(local_git_path: Optional[str], git_ssh_url: Optional[str], working_path: Path,
+                        branch="master", delete_exports=True) \
             -> (GitHandler, Path):
         assert any([local_git_path, git_ssh_url]) is True, "atleast local git path or git ssh url should be provided " \
                                                            "otherwise if both are provided it will use local git path"
-        # Local Git is prioritized and if it is used then no tmpdir needed
+        # Resumed runs keep the exports written so far
+        delete_directory = Path(ExportFileUtils.BASE_DIRECTORY) if delete_exports is True else None
+        # Local Git is prioritized and if it is used then no working path is needed
         if local_git_path is not None:
-            return LocalGitHandler(Path(local_git_path), delete_directory=Path(ExportFileUtils.BASE_DIRECTORY)), \
+            return LocalGitHandler(Path(local_git_path), delete_directory=delete_directory), \
                    Path(local_git_path)
         else:
-            return RemoteGitHandler(git_ssh_url, Path(tmp_dir.name),
-                                    delete_directory=Path(ExportFileUtils.BASE_DIRECTORY), branch=branch), Path(
-                tmp_dir.name)
+            return RemoteGitHandler(git_ssh_url, working_path,
+                                    delete_directory=delete_directory, branch=branch), working_path
+
+    @staticmethod
+    def get_run_path(run_id: str) -> Path:
+        ExportCoordinator.RUNS_PATH.mkdir(parents=True, exist_ok=True)
+        return ExportCoordinator.RUNS_PATH / run_id
+
+    @staticmethod
+    def resume_run(resume_run_id: str, retry_failed: bool) -> ExportResume:
+        resume = ExportResume.from_run(event_manager, resume_run_id, retry_failed=retry_failed)
+        event_manager.resume_run(resume_run_id)
+        report_manager.resume_run(resume_run_id)
+        event_manager.clear_validation_records()
+        return resume
+
+    @staticmethod
+    def configure_requests(max_concurrent_requests: int, workers: Optional[int],
+                           rate_limits: Optional[Dict[str, float]],
+                           max_download_bytes: int = ByteBudget.DEFAULT_MAX_BYTES) -> HttpTransport:
+        request_pool.configure(max_concurrent_requests)
+        download_budget.configure(max_download_bytes)
+        max_concurrency = max(max_concurrent_requests, workers or 0)
+        rate_limiter.configure(rate_limits or {}, max_concurrency=max_concurrency)
+        # Request pool threads and the stage workers both issue requests, size the connection pool for all of them
+        return HttpTransport(pool_size=max_concurrent_requests + (workers or 0))
+
+    @staticmethod
+    def make_pipeline(api_client, base_path: Path, export_objects: Dict[str, Any], dask_client=None,
+                      stage_executor: StageExecutor = None, http_transport: HttpTransport = None,
+                      export_partition: ExportPartition = None, shard: ExportShard = None,
+                      resume: ExportResume = None, incremental: bool = False) -> Pipeline:
+        generator_defaults = {
+            "api_client": api_client,
+            "base_path": base_path
+        }
+        generator_factory = GeneratorFactory.factory()
+        generators = []
+        for object_name, object_data in export_objects.items():
+            generator = generator_factory.make_generator(object_name, {**generator_defaults, **object_data},
+                                                         http_transport=http_transport)
+            if export_partition is not None:
+                generator.set_path_partition(export_partition.path_partitions.get(object_name))
+            generator.set_shard(shard)
+            generator.set_resume(resume)
+            if isinstance(generator, DownloaderAPIGenerator):
+                generator.set_incremental(incremental)
+            generators.append(generator)
+
+        exp = Pipeline(generators,
+                       base_path=base_path,
+                       dask_client=dask_client,
+                       stage_executor=stage_executor,
+                       resume=resume)
+        exp.wire()
+        return exp
+
+    @staticmethod
+    def get_process_rate_limits(rate_limits: Optional[Dict[str, float]], processes: int) -> Dict[str, float]:
+        # The workspace limits apply to all the processes together so each process gets its share
+        all_rate_limits = {RateLimiter.DEFAULT_FAMILY: RateLimiter.DEFAULT_REQUESTS_PER_SECOND, **(rate_limits or {})}
+        return {family: rate / processes for family, rate in all_rate_limits.items()}
+
+    @staticmethod
+    def export_partition(api_client: ApiClient, config: Dict[str, Any], export_partition: ExportPartition,
+                         staging_path: str, max_concurrent_requests: int, workers: Optional[int],
+                         rate_limits: Dict[str, float], shard: ExportShard = None,
+                         max_download_bytes: int = ByteBudget.DEFAULT_MAX_BYTES,
+                         lineage_policy: str = LineagePolicy.FIRST_AND_LATEST):
+        # Entrypoint of the export processes, everything process wide has to be configured again after spawning
+        log.info(f"Exporting partition {export_partition.index} into {staging_path}")
+        HCLConvertData.lineage_policy = lineage_policy
+        # Generators reference the other exported objects (i.e. identities, dbfs files) so the whole config is kept
+        export_config.set_from_dict(config)
+        http_transport = ExportCoordinator.configure_requests(max_concurrent_requests, workers, rate_limits,
+                                                              max_download_bytes=max_download_bytes)
+        stage_executor = StageExecutor(workers) if workers is not None else None
+        try:
+            exp = ExportCoordinator.make_pipeline(RateLimitedApiClient(api_client), Path(staging_path),
+                                                  export_partition.objects,
+                                                  stage_executor=stage_executor,
+                                                  http_transport=http_transport,
+                                                  export_partition=export_partition,
+                                                  shard=shard)
+            exp.run()
+        finally:
+            request_pool.shutdown()
+            http_transport.close()
+            if stage_executor is not None:
+                stage_executor.shutdown()
+        return export_partition.index
+
+    @staticmethod
+    def export_processes(api_client: ApiClient, config: Dict[str, Any], base_path: Path, processes: int,
+                         max_concurrent_requests: int, workers: Optional[int], rate_limits: Dict[str, float],
+                         shard: ExportShard = None, max_download_bytes: int = ByteBudget.DEFAULT_MAX_BYTES):
+        partitions = ExportPartitioner(RateLimitedApiClient(api_client), processes).plan(config["objects"])
+        process_rate_limits = ExportCoordinator.get_process_rate_limits(rate_limits, len(partitions))
+        # Processes report into the same run so that the report covers the whole export, the run id is only kept in
+        # the environment while they are spawned so that later exports in this interpreter start their own run
+        previous_run_id = os.environ.get(RUN_ID_ENV_VAR, None)
+        os.environ[RUN_ID_ENV_VAR] = event_manager.run_id
+        try:
+            with tempfile.TemporaryDirectory() as staging_dir:
+                staging_paths = [str(Path(staging_dir) / f"partition-{p.index}") for p in partitions]
+                with ProcessPoolExecutor(max_workers=len(partitions),
+                                         mp_context=multiprocessing.get_context("spawn")) as executor:
+                    futures = [executor.submit(ExportCoordinator.export_partition, api_client, config, partition,
+                                               staging_path, max_concurrent_requests, workers, process_rate_limits,
+                                               shard, max_download_bytes, HCLConvertData.lineage_policy)
+                               for partition, staging_path in zip(partitions, staging_paths)]
+                    errors: List[BaseException] = [error for error in (future.exception() for future in futures)
+                                                   if error is not None]
+                if len(errors) > 0:
+                    raise errors[0]
+                ExportMerger(base_path).merge([Path(staging_path) for staging_path in staging_paths])
+        finally:
+            if previous_run_id is None:
+                os.environ.pop(RUN_ID_ENV_VAR, None)
+            else:
+                os.environ[RUN_ID_ENV_VAR] = previous_run_id
+
+    @staticmethod
+    def prepare_shard_path(local_git_path: Optional[str]) -> Path:
+        # A shard is only a part of the export, it is written as is and committed once all the shards are merged
+        assert local_git_path is not None, "local git path should be provided to write the shard to"
+        shard_path = Path(local_git_path)
+        exports_path = shard_path / ExportFileUtils.BASE_DIRECTORY
+        if exports_path.exists():
+            shutil.rmtree(exports_path)
+        return shard_path
+
+    @staticmethod
+    def commit_changes(geh: GitHandler):
+        geh.stage_changes()
+        changes = [
+            geh.get_changes("exports"),
+            geh.get_changes("terraform.tfvars"),
+            geh.get_changes("variables_env.sh"),
+            geh.get_changes("databricks_spark_env.sh"),
+        ]
+        if any([change is not None for change in changes]):
+            geh.commit_and_push()
+        else:
+            log.info("No changes found.")
+
+    @staticmethod
+    def validate_export(api_client: ApiClient, base_path: Path, branch: str) -> Optional[Exception]:
+        te = TerraformExecution(
+            SUPPORTED_IMPORTS,
+            refresh=False,
+            plan=False,
+            apply=False,
+            destroy=False,
+            local_git_path=base_path,
+            api_client=api_client,
+            branch=branch,
+        )
+        try:
+            te.execute()
+        except TerraformCommandError as tce:
+            f_validation_files, f_validation_msgs, f_validation_tbs = get_error_paths_and_content(tce.err)
+            event_manager.make_validation_records(api_client.url, f_validation_files, f_validation_msgs,
+                                                  f_validation_tbs)
+            return tce
+        return None
+
+    @staticmethod
+    def print_report(workspace_url: str, excel_report: bool):
+        report_manager_results = report_manager.fetch_and_gather_results(workspace_url)
+        report_manager_results.print_to_console()
+        if excel_report is True:
+            report_manager_results.print_to_xlsx()
 
     @staticmethod
     def export(api_client: ApiClient, yaml_file_path: Path, dask_mode: bool = False, dry_run: bool = False,
-               git_ssh_url: str = None, local_git_path=None, branch="master", excel_report=False):
+               git_ssh_url: str = None, local_git_path=None, branch="master", excel_report=False,
+               max_concurrent_requests: int = RequestPool.DEFAULT_MAX_CONCURRENT_REQUESTS, workers: int = None,
+               rate_limits: Dict[str, float] = None, processes: int = None, shard: ExportShard = None,
+               resume_run_id: str = None, retry_failed: bool = False, incremental: bool = False,
+               max_download_bytes: int = ByteBudget.DEFAULT_MAX_BYTES):
         err = None
+        # set to true once the export is committed, until then the working tree is kept to resume the run
+        completed = False
         client = None
+        stage_executor = None
+        http_transport = ExportCoordinator.configure_requests(max_concurrent_requests, workers, rate_limits,
+                                                              max_download_bytes=max_download_bytes)
+        # Every service built by the generators shares the limits of the process wide rate limiter
+        limited_api_client = RateLimitedApiClient(api_client)
         # set to false to not print the output anymore
         pre_run_error = True
         if dask_mode is True:
             from distributed import Client
             client = Client(processes=True)
-        tmp_dir = tempfile.TemporaryDirectory()
+        elif workers is not None and processes is None:
+            stage_executor = StageExecutor(workers)
+        resume = None
+        run_path = None
         try:
-            geh, base_path = ExportCoordinator.get_git_handler(local_git_path, git_ssh_url, tmp_dir, branch=branch)
-            export_config.set_from_yaml(
-                yaml_file_path)
+            if resume_run_id is not None:
+                resume = ExportCoordinator.resume_run(resume_run_id, retry_failed)
+            log.info(f"Exporting with run id: {event_manager.run_id}")
+            if shard is None:
+                run_path = ExportCoordinator.get_run_path(event_manager.run_id)
+                # Incremental exports only remove what they do not reuse once the export objects are known
+                geh, base_path = ExportCoordinator.get_git_handler(local_git_path, git_ssh_url, run_path,
+                                                                   branch=branch,
+                                                                   delete_exports=resume is None and not incremental)
+            else:
+                log.info(f"Exporting shard {shard} into {local_git_path}")
+                geh, base_path = None, ExportCoordinator.prepare_shard_path(local_git_path)
+            config = ExportConfig.read_yaml(yaml_file_path)
+            export_config.set_from_dict(config)
 
-            generator_defaults = {
-                "api_client": api_client,
-                "base_path": base_path
-            }
-
-            validate_dict(api_client)
+            validate_dict(limited_api_client)
 
             export_objects = export_config.objects
+            # Resumed runs already reuse everything in the exports folder
+            prune_artifacts = incremental is True and resume is None and export_objects is not None
+            if prune_artifacts is True:
+                ArtifactManifest.prepare(base_path / ExportFileUtils.BASE_DIRECTORY, list(export_objects.keys()))
 
-            if export_objects is not None:
-                generator_factory = GeneratorFactory.factory()
-                generators = [generator_factory.make_generator(object_name, {**generator_defaults, **object_data})
-                              for object_name, object_data in export_objects.items()]
-
-                exp = Pipeline(generators,
-                               base_path=base_path,
-                               dask_client=client)
-                exp.wire()
+            if export_objects is not None and processes is not None:
+                # set to false to start printing report output
+                pre_run_error = False
+                ExportCoordinator.export_processes(api_client, config, base_path, processes,
+                                                   max_concurrent_requests, workers, rate_limits, shard=shard,
+                                                   max_download_bytes=max_download_bytes)
+            elif export_objects is not None:
+                exp = ExportCoordinator.make_pipeline(limited_api_client, base_path, export_objects,
+                                                      dask_client=client,
+                                                      stage_executor=stage_executor,
+                                                      http_transport=http_transport,
+                                                      shard=shard,
+                                                      resume=resume,
+                                                      incremental=incremental)
                 # set to false to start printing report output
                 pre_run_error = False
                 exp.run()
+                if prune_artifacts is True:
+                    ArtifactManifest.prune(base_path / ExportFileUtils.BASE_DIRECTORY, base_path)
 
-            if dry_run is False:
-                geh.stage_changes()
-                changes = [
-                    geh.get_changes("exports"),
-                    geh.get_changes("terraform.tfvars"),
-                    geh.get_changes("variables_env.sh"),
-                    geh.get_changes("databricks_spark_env.sh"),
-                ]
-                if any([change is not None for change in changes]):
-                    geh.commit_and_push()
+            if shard is not None:
+                # Shards are validated and committed by the merge as they reference objects of the other shards
+                report_manager.save_run(base_path / ExportCoordinator.SHARD_REPORT_DB)
+            else:
+                if dry_run is False:
+                    ExportCoordinator.commit_changes(geh)
+                completed = True
+
+                # We should run validate in either case
+                err = ExportCoordinator.validate_export(api_client, base_path, branch)
+        except Exception as e:
+            err = e
+            traceback.print_exc()
+        finally:
+            if shard is None:
+                event_manager.make_validation_records(api_client.url, [], [],
+                                                      [])
+            if pre_run_error is False:
+                ExportCoordinator.print_report(api_client.url, excel_report)
+
+            request_pool.shutdown()
+            # The coordinator owns the shared http session, it is only closed once the export is validated
+            http_transport.close()
+            if stage_executor is not None:
+                stage_executor.shutdown()
+            if run_path is not None and run_path.exists():
+                if completed is True:
+                    shutil.rmtree(run_path)
                 else:
-                    log.info("No changes found.")
-
-            # We should run validate in either case
-            te = TerraformExecution(
-                SUPPORTED_IMPORTS,
-                refresh=False,
-                plan=False,
-                apply=False,
-                destroy=False,
-                local_git_path=base_path,
-                api_client=api_client,
-                branch=branch,
-            )
-            try:
-                te.execute()
-            except TerraformCommandError as tce:
-                err = tce
-                f_validation_files, f_validation_msgs, f_validation_tbs = get_error_paths_and_content(tce.err)
-                event_manager.make_validation_records(api_client.url, f_validation_files, f_validation_msgs,
-                                                      f_validation_tbs)
+                    log.warning(f"Keeping the working tree of run {event_manager.run_id} in {run_path}, the export "
+                                f"can be resumed with --resume {event_manager.run_id}")
+
+        return err
+
+    @staticmethod
+    def merge(api_client: ApiClient, shard_paths: List[Path], dry_run: bool = False, git_ssh_url: str = None,
+              local_git_path=None, branch="master", excel_report=False):
+        err = None
+        # set to false to not print the output anymore
+        pre_run_error = True
+        tmp_dir = tempfile.TemporaryDirectory()
+        try:
+            geh, base_path = ExportCoordinator.get_git_handler(local_git_path, git_ssh_url, Path(tmp_dir.name),
+                                                               branch=branch)
+            ExportMerger(base_path, move_files=False).merge(shard_paths)
+            for shard_path in sorted(Path(shard_path) for shard_path in shard_paths):
+                shard_report_db = shard_path / ExportCoordinator.SHARD_REPORT_DB
+                if shard_report_db.exists():
+                    event_manager.load_run(shard_report_db)
+                else:
+                    log.warning(f"Unable to find the report of the shard in {shard_path}")
+            # set to false to start printing report output
+            pre_run_error = False
+
+            if dry_run is False:
+                ExportCoordinator.commit_changes(geh)
+
+            err = ExportCoordinator.validate_export(api_client, base_path, branch)
         except Exception as e:
             err = e
             traceback.print_exc()
@@ -111,11 +357,7 @@ class ExportCoordinator:
             event_manager.make_validation_records(api_client.url, [], [],
                                                   [])
             if pre_run_error is False:
-                report_manager_results = report_manager.fetch_and_gather_results(api_client.url)
-                report_manager_results.print_to_console()
-                if excel_report is True:
-                    report_manager_results.print_to_xlsx()
-
+                ExportCoordinator.print_report(api_client.url, excel_report)
             tmp_dir.cleanup()
 
         return err
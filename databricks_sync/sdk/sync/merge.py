@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+
+from databricks_sync import log
+from databricks_sync.sdk.pipeline import ExportFileUtils, Pipeline
+
+
+class ExportMerger:
+    """
+    Merges export trees written by separate processes into one tree. Files which only exist in one tree are moved (or
+    copied) as is. Terraform json files which are written by more than one process (mapped variables and the for_each
+    locals of dbfs files) are deep merged and written in the same format as the TerraformJsonBuilder so the result does
+    not depend on the order of the trees. The tfvars and spark env files are unioned and rewritten by the pipeline
+    handlers. Trees are merged in sorted order so the merged tree is the same as the tree of a single export.
+    """
+    TF_JSON_SUFFIX = ".tf.json"
+
+    def __init__(self, base_path: Path, move_files: bool = True):
+        self.__base_path = Path(base_path)
+        # Staging trees of export processes are throw away, shard trees are kept as they are
+        self.__move_files = move_files
+
+    def __transfer(self, source: Path, target: Path):
+        if self.__move_files is True:
+            shutil.move(str(source), str(target))
+        else:
+            shutil.copyfile(str(source), str(target))
+
+    @staticmethod
+    def merge_dicts(target: Dict[str, Any], source: Dict[str, Any], path: str = "") -> Dict[str, Any]:
+        for key, value in source.items():
+            if isinstance(target.get(key), dict) and isinstance(value, dict):
+                ExportMerger.merge_dicts(target[key], value, path=f"{path}.{key}")
+            else:
+                if key in target and target[key] != value:
+                    log.warning(f"Conflicting values for {path}.{key} while merging exports, keeping the latest.")
+                target[key] = value
+        return target
+
+    @staticmethod
+    def __read_json(path: Path) -> Dict[str, Any]:
+        with path.open("r") as f:
+            return json.load(f)
+
+    def __merge_file(self, source: Path, target: Path):
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            self.__transfer(source, target)
+            return
+        if source.name.endswith(self.TF_JSON_SUFFIX):
+            merged = self.merge_dicts(self.__read_json(target), self.__read_json(source), path=source.name)
+            with target.open("w+") as f:
+                f.write(json.dumps(merged, indent=4, sort_keys=True))
+            return
+        if source.read_bytes() != target.read_bytes():
+            log.warning(f"Conflicting content for {target} while merging exports, keeping the latest.")
+            self.__transfer(source, target)
+
+    def __merge_exports(self, source_path: Path):
+        source_exports = source_path / ExportFileUtils.BASE_DIRECTORY
+        if not source_exports.exists():
+            return
+        for root, _, files in sorted(os.walk(source_exports)):
+            for file_name in sorted(files):
+                source = Path(root) / file_name
+                self.__merge_file(source, self.__base_path / source.relative_to(source_path))
+
+    @staticmethod
+    def parse_vars(path: Path, quoted: bool) -> List[Tuple[str, Optional[str]]]:
+        if not path.exists():
+            return []
+        parsed = []
+        with path.open("r") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if "=" not in line:
+                    continue
+                key, val = line.split("=", 1)
+                if quoted is True:
+                    val = val[1:-1]
+                parsed.append((key, val))
+        return parsed
+
+    def __merge_vars(self, source_paths: List[Path]):
+        tfvars = set()
+        spark_envs = set()
+        for source_path in source_paths:
+            tfvars.update(self.parse_vars(ExportFileUtils.make_tfvars(source_path), quoted=True))
+            spark_envs.update(self.parse_vars(ExportFileUtils.make_databricks_spark_env(source_path), quoted=False))
+        Pipeline.make_tfvars_handler(self.__base_path)(list(tfvars))
+        Pipeline.make_spark_env_handler(self.__base_path)(list(spark_envs))
+
+    def merge(self, source_paths: List[Path]):
+        source_paths = sorted(Path(source_path) for source_path in source_paths)
+        for source_path in source_paths:
+            log.info(f"Merging exported files from {source_path} into {self.__base_path}")
+            self.__merge_exports(source_path)
+        self.__merge_vars(source_paths)
@@ -0,0 +1,221 @@
+import zlib
+from pathlib import PurePosixPath
+from typing import List, Dict, Any, Optional, Iterable
+
+import requests
+from databricks_cli.sdk import WorkspaceService, DbfsService, ApiClient
+
+from databricks_sync import log
+from databricks_sync.sdk.config import export_config, SingletonNotSetError
+from databricks_sync.sdk.generators import PathInclusionParser
+from databricks_sync.sdk.sync.constants import GeneratorCatalog, ResourceCatalog
+
+
+class PathPartition:
+    """
+    Ownership of a slice of the workspace or dbfs trees exported by a notebook or dbfs generator. The trees under the
+    base paths are split by the directories directly under the base paths (the prefixes). Everything under an owned
+    prefix belongs to this partition and everything outside of the prefixes (the base paths themselves, the objects
+    directly under them and their parent folders) belongs to the partition which owns the root.
+    """
+    DBFS_SCHEME = "dbfs:"
+
+    def __init__(self, prefixes: Iterable[str], owned_prefixes: Iterable[str], owns_root: bool):
+        self.__prefixes = {self.normalize(prefix) for prefix in prefixes}
+        self.__owned_prefixes = {self.normalize(prefix) for prefix in owned_prefixes}
+        self.__owns_root = owns_root
+        # Directories above the owned prefixes have to be listed to reach the prefixes
+        self.__owned_ancestors = {str(parent) for prefix in self.__owned_prefixes
+                                  for parent in PurePosixPath(prefix).parents}
+
+    @property
+    def owned_prefixes(self) -> List[str]:
+        return sorted(self.__owned_prefixes)
+
+    @property
+    def owns_root(self) -> bool:
+        return self.__owns_root
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        if path.startswith(PathPartition.DBFS_SCHEME):
+            path = path[len(PathPartition.DBFS_SCHEME):]
+        return str(PurePosixPath("/") / path)
+
+    def __get_prefix(self, path: str) -> Optional[str]:
+        # The deepest prefix wins in case base paths are nested
+        pure_path = PurePosixPath(path)
+        for candidate in [pure_path, *pure_path.parents]:
+            if str(candidate) in self.__prefixes:
+                return str(candidate)
+        return None
+
+    def is_owned(self, path: str) -> bool:
+        prefix = self.__get_prefix(self.normalize(path))
+        if prefix is None:
+            return self.__owns_root
+        return prefix in self.__owned_prefixes
+
+    def should_visit(self, dir_path: str) -> bool:
+        return self.normalize(dir_path) in self.__owned_ancestors or self.is_owned(dir_path)
+
+    def __repr__(self):
+        return f"PathPartition(owned_prefixes={self.owned_prefixes}, owns_root={self.owns_root})"
+
+
+class ExportShard:
+    """
+    A stable hash partition of the exported objects so that an export can be split across machines with --shard i/N.
+    The hash only depends on the object id so every shard of every run agrees on the owner of an object.
+    """
+
+    def __init__(self, index: int, count: int):
+        if count is None or count < 1 or index is None or not 1 <= index <= count:
+            raise ValueError(f"shard should be in the form of i/N with 1 <= i <= N but got: {index}/{count}")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, value: str) -> 'ExportShard':
+        index, _, count = value.partition("/")
+        try:
+            return cls(int(index), int(count))
+        except ValueError:
+            raise ValueError(f"shard should be in the form of i/N with 1 <= i <= N but got: {value}")
+
+    def owns(self, object_id: Any) -> bool:
+        return zlib.crc32(str(object_id).encode("utf-8")) % self.count == self.index - 1
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+class ForEachPartition:
+    """
+    A stable hash partition of a for_each collection, e.g. all the users, into separate resources, local variables and
+    files so that terraform parses them in parallel and a change to one object only rewrites the file of its partition.
+    The names of partition i are suffixed with _i and every partition is written, even when empty, so that they can be
+    depended on. Without a count the collection is written as a single resource like before.
+    """
+
+    def __init__(self, count: Optional[int] = None):
+        if count is not None and (not isinstance(count, int) or count < 1):
+            raise ValueError(f"for_each_shards should be a positive integer but got: {count}")
+        self.count = count
+
+    @classmethod
+    def from_config(cls) -> 'ForEachPartition':
+        try:
+            return cls(export_config.for_each_shards)
+        except SingletonNotSetError:
+            return cls()
+
+    def indexes(self) -> List[Optional[int]]:
+        return [None] if self.count is None else list(range(self.count))
+
+    def index(self, key: Any) -> Optional[int]:
+        return None if self.count is None else zlib.crc32(str(key).encode("utf-8")) % self.count
+
+    @staticmethod
+    def name(base_name: str, index: Optional[int]) -> str:
+        return base_name if index is None else f"{base_name}_{index}"
+
+    def names(self, base_name: str) -> List[str]:
+        return [self.name(base_name, index) for index in self.indexes()]
+
+    def key_name(self, base_name: str, key: Any) -> str:
+        return self.name(base_name, self.index(key))
+
+
+class ExportPartition:
+    """
+    The objects from the export configuration which are exported by a single process along with the slices of the
+    notebook and dbfs trees it owns.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.path_partitions: Dict[str, PathPartition] = {}
+
+    def __repr__(self):
+        return f"ExportPartition(index={self.index}, objects={list(self.objects.keys())}, " \
+               f"path_partitions={self.path_partitions})"
+
+
+class ExportPartitioner:
+    """
+    Plans the split of an export across processes. Every object in the export configuration is a unit of work except
+    for notebooks and dbfs files which are split into one unit per directory directly under their base paths plus one
+    unit for everything else. Units are handed out round robin so large trees end up spread across the processes.
+    """
+    PATH_PARTITIONED_OBJECTS = {
+        GeneratorCatalog.NOTEBOOK: ("notebook_path", ResourceCatalog.NOTEBOOK_RESOURCE),
+        GeneratorCatalog.DBFS_FILE: ("dbfs_path", ResourceCatalog.DBFS_FILE_RESOURCE),
+    }
+    ROOT_UNIT = None
+
+    def __init__(self, api_client: ApiClient, processes: int):
+        if processes is None or processes < 1:
+            raise ValueError(f"processes should be a positive integer but got: {processes}")
+        self.__api_client = api_client
+        self.__processes = processes
+
+    def __list_directories(self, object_name: str, path: str) -> List[str]:
+        if object_name == GeneratorCatalog.NOTEBOOK:
+            objects = WorkspaceService(self.__api_client).list(path).get("objects", [])
+            return [obj["path"] for obj in objects if obj.get("object_type") == "DIRECTORY"]
+        files = DbfsService(self.__api_client).list(path).get("files", [])
+        return [file["path"] for file in files if file.get("is_dir") is True]
+
+    def get_prefixes(self, object_name: str, object_data: Dict[str, Any]) -> Optional[List[str]]:
+        path_key, resource_type = self.PATH_PARTITIONED_OBJECTS[object_name]
+        path_patterns = object_data.get(path_key)
+        if path_patterns is None:
+            return None
+        if isinstance(path_patterns, str):
+            path_patterns = [path_patterns]
+        prefixes = set()
+        for base_path in PathInclusionParser(path_patterns, resource_type).base_paths:
+            try:
+                prefixes.update(PathPartition.normalize(path) for path in self.__list_directories(object_name,
+                                                                                                  base_path))
+            except requests.exceptions.HTTPError as he:
+                log.warning(f"Unable to list {base_path} to partition {object_name}, exporting it in one process: "
+                            f"{he}")
+                return None
+        return sorted(prefixes)
+
+    def plan(self, export_objects: Dict[str, Dict[str, Any]]) -> List[ExportPartition]:
+        units = []
+        prefixes_by_object = {}
+        for object_name, object_data in export_objects.items():
+            prefixes = None
+            if object_name in self.PATH_PARTITIONED_OBJECTS:
+                prefixes = self.get_prefixes(object_name, object_data or {})
+            if prefixes is None:
+                units.append((object_name, self.ROOT_UNIT))
+                continue
+            prefixes_by_object[object_name] = prefixes
+            units.append((object_name, self.ROOT_UNIT))
+            units.extend((object_name, prefix) for prefix in prefixes)
+
+        partitions = [ExportPartition(index) for index in range(self.__processes)]
+        owned_units: List[Dict[str, List[Optional[str]]]] = [{} for _ in range(self.__processes)]
+        for unit_index, (object_name, prefix) in enumerate(units):
+            partition_index = unit_index % self.__processes
+            partitions[partition_index].objects[object_name] = export_objects[object_name]
+            owned_units[partition_index].setdefault(object_name, []).append(prefix)
+
+        for partition, owned in zip(partitions, owned_units):
+            for object_name, object_prefixes in owned.items():
+                if object_name not in prefixes_by_object:
+                    continue
+                partition.path_partitions[object_name] = PathPartition(
+                    prefixes_by_object[object_name],
+                    [prefix for prefix in object_prefixes if prefix is not self.ROOT_UNIT],
+                    self.ROOT_UNIT in object_prefixes)
+
+        planned = [partition for partition in partitions if len(partition.objects) > 0]
+        log.info(f"Planned export across {len(planned)} processes: {planned}")
+        return planned
@@ -0,0 +1,54 @@
+from typing import Dict, Any, Tuple, List, Optional
+
+from databricks_sync import log
+from databricks_sync.sdk.message import HCLConvertData
+from databricks_sync.sdk.report.model import EventManager, ReportConstants
+
+
+class ExportResume:
+    """
+    Decides which objects a resumed run exports again based on the report records of the run. With --resume every
+    object which did not succeed (failed, only started or never reached) is exported again, with --retry-failed only
+    the objects which started or failed are. Objects are only skipped when their variables were checkpointed so that
+    the tfvars, spark env and mapped variables files can still be written for the whole export.
+    """
+
+    def __init__(self, statuses: Dict[Tuple[str, str], str], checkpoints: Dict[Tuple[str, str], Dict[str, Any]],
+                 retry_failed: bool = False):
+        self.__statuses = statuses
+        self.__checkpoints = checkpoints
+        self.__retry_failed = retry_failed
+        self.skipped_variables: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_run(cls, manager: EventManager, run_id: str, retry_failed: bool = False) -> 'ExportResume':
+        statuses = manager.get_run_statuses(run_id)
+        if len(statuses) == 0:
+            raise ValueError(f"unable to find any records of run: {run_id} to resume")
+        checkpoints = manager.get_run_checkpoints(run_id)
+        log.info(f"Resuming run {run_id} with {len(statuses)} recorded objects and {len(checkpoints)} checkpoints")
+        return cls(statuses, checkpoints, retry_failed=retry_failed)
+
+    @staticmethod
+    def __get_record_keys(item: HCLConvertData) -> List[Tuple[str, str]]:
+        # Keyed the same way as the report records which are one per object of a for_each resource
+        if len(item.for_each_var_id_name_pairs) > 0:
+            return [(item.resource_name, id_name_pair[0]) for id_name_pair in item.for_each_var_id_name_pairs]
+        return [(item.resource_name, item.hcl_resource_identifier)]
+
+    def __get_checkpoint(self, item: HCLConvertData) -> Optional[Dict[str, Any]]:
+        return self.__checkpoints.get((item.resource_name, item.hcl_resource_identifier))
+
+    def should_export(self, item: HCLConvertData) -> bool:
+        statuses = [self.__statuses.get(key) for key in self.__get_record_keys(item)]
+        if all(status == ReportConstants.OBJECT_EXPORT_SUCCEEDED for status in statuses):
+            return self.__get_checkpoint(item) is None
+        if self.__retry_failed is True:
+            # Objects which were not part of the run are not retried
+            return any(status is not None for status in statuses)
+        return True
+
+    def skip(self, item: HCLConvertData):
+        checkpoint = self.__get_checkpoint(item)
+        if checkpoint is not None:
+            self.skipped_variables.append(checkpoint)
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+import requests
+
+from databricks_sync.sdk.generators.clusters import ClusterHCLGenerator
+
+CLUSTERS = [{"cluster_id": f"c-{i}", "cluster_name": f"cluster {i}", "spark_version": "9.1",
+             "node_type_id": "i3.xlarge", "num_workers": 1, "cluster_source": "UI"} for i in range(3)] + \
+           [{"cluster_id": "c-job", "cluster_name": "job cluster", "spark_version": "9.1",
+             "node_type_id": "i3.xlarge", "cluster_source": "JOB"}]
+
+
+def library_statuses(cluster_id):
+    return [{"library": {"pypi": {"package": f"pkg-{cluster_id}"}}, "status": "INSTALLED"}]
+
+
+class MockApiClient:
+    url = "https://test.cloud.databricks.com/api/2.0"
+
+    def __init__(self, supports_all_cluster_statuses=True):
+        self.supports_all_cluster_statuses = supports_all_cluster_statuses
+        self.calls = []
+
+    def perform_query(self, method, path, data=None, headers=None):
+        self.calls.append(path)
+        if path == "/clusters/list":
+            return {"clusters": CLUSTERS}
+        if path == "/libraries/all-cluster-statuses":
+            if self.supports_all_cluster_statuses is False:
+                raise requests.exceptions.HTTPError("ENDPOINT_NOT_FOUND")
+            # Clusters without libraries have no status
+            return {"statuses": [{"cluster_id": cluster["cluster_id"],
+                                  "library_statuses": library_statuses(cluster["cluster_id"])}
+                                 for cluster in CLUSTERS if cluster["cluster_id"] != "c-1"]}
+        if path == "/libraries/cluster-status":
+            return {"cluster_id": data["cluster_id"],
+                    "library_statuses": library_statuses(data["cluster_id"]) if data["cluster_id"] != "c-1" else []}
+        if path.startswith("/preview/permissions/"):
+            return {"access_control_list": []}
+        raise ValueError(path)
+
+
+class TestClusterHCLGenerator:
+
+    @staticmethod
+    async def generate(client):
+        generator = ClusterHCLGenerator(client, "/tmp", by={"cluster_id": "c-[0-9]"})
+        return [item.raw_id async for item in generator._generate()
+                if item is not None and item.resource_name == "databricks_cluster"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("supports_all_cluster_statuses, library_requests", [
+        (True, ["/libraries/all-cluster-statuses"]),
+        (False, ["/libraries/all-cluster-statuses"] + ["/libraries/cluster-status"] * 3),
+    ])
+    async def test_library_statuses(self, supports_all_cluster_statuses, library_requests):
+        client = MockApiClient(supports_all_cluster_statuses=supports_all_cluster_statuses)
+        # The job cluster is never looked up
+        assert await self.generate(client) == ["c-0", "c-1", "c-2"]
+        assert [path for path in client.calls if path.startswith("/libraries/")] == library_requests
+
+    @pytest.mark.asyncio
+    async def test_prefetches_permissions(self):
+        client = MockApiClient()
+        generator = ClusterHCLGenerator(client, "/tmp", by={"cluster_id": "c-[0-9]"})
+        items = generator._generate()
+        assert (await items.__anext__()).raw_id == "c-0"
+        # The permissions of every exported cluster are requested before the first one is handed back
+        for _ in range(100):
+            if len([path for path in client.calls if path.startswith("/preview/permissions/clusters/")]) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert sorted(path for path in client.calls if path.startswith("/preview/permissions/clusters/")) == \
+               [f"/preview/permissions/clusters/c-{i}" for i in range(3)]
+        assert [item.raw_id async for item in items if item is not None and
+                item.resource_name == "databricks_cluster"] == ["c-1", "c-2"]
+        # Prefetched permissions are handed back instead of being requested again
+        assert len([path for path in client.calls if path.startswith("/preview/permissions/clusters/")]) == 3
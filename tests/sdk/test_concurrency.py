@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from databricks_sync.sdk.engine import PipelineEngine
+from databricks_sync.sdk.message import HCLConvertData
+from databricks_sync.sdk.service.concurrency import RequestPool, AsyncService, StageExecutor, ListingPrefetcher, \
+    ByteBudget, prefetch_ordered, OrderedTurns
+
+
+class MockService:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def list(self, path):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return {"path": path}
+
+
+class MockGenerator:
+
+    def __init__(self, count):
+        self.count = count
+
+    async def generate(self):
+        for i in range(self.count):
+            yield i
+
+
+class TestRequestPool:
+
+    @pytest.mark.asyncio
+    async def test_requests_overlap_up_to_limit(self):
+        pool = RequestPool(max_concurrent_requests=3)
+        service = MockService()
+        async_service = AsyncService(service, pool=pool)
+        results = await asyncio.gather(*[async_service.list(f"/path/{i}") for i in range(9)])
+        pool.shutdown()
+        assert [r["path"] for r in results] == [f"/path/{i}" for i in range(9)]
+        assert service.max_in_flight == 3
+
+    def test_configure_rejects_invalid_size(self):
+        pool = RequestPool()
+        with pytest.raises(ValueError):
+            pool.configure(0)
+
+
+class TestStageExecutor:
+
+    @pytest.mark.asyncio
+    async def test_runs_on_workers(self):
+        stage_executor = StageExecutor(4)
+        service = MockService()
+        results = await asyncio.gather(*[stage_executor.run(service.list, f"/path/{i}") for i in range(8)])
+        stage_executor.shutdown()
+        assert [r["path"] for r in results] == [f"/path/{i}" for i in range(8)]
+        assert service.max_in_flight == 4
+
+    @pytest.mark.asyncio
+    async def test_results_are_emitted_in_order(self):
+        @HCLConvertData.manage_error
+        def slow_double(x):
+            time.sleep(0.01 * (5 - x % 5))
+            return x * 2
+
+        results = []
+
+        @HCLConvertData.manage_error
+        def sink(x):
+            results.append(x)
+
+        stage_executor = StageExecutor(4)
+        engine = PipelineEngine(queue_size=8)
+        doubled = engine.add_stage("slow_double", slow_double, stage_executor=stage_executor)
+        doubled.to(engine.add_stage("sink", sink))
+        engine.add_source(MockGenerator(20), doubled)
+        await engine.run()
+        stage_executor.shutdown()
+        assert results == [i * 2 for i in range(20)]
+
+    def test_invalid_workers(self):
+        with pytest.raises(ValueError):
+            StageExecutor(0)
+
+
+class TestOrderedTurns:
+
+    @pytest.mark.asyncio
+    async def test_turns_are_taken_in_ticket_order(self):
+        turns = OrderedTurns()
+        finished, emitted = [], []
+
+        async def work(x):
+            ticket = turns.take()
+            await asyncio.sleep(0.01 * (5 - x % 5))
+            finished.append(x)
+            await turns.wait(ticket)
+            emitted.append(x)
+            await turns.done(ticket)
+
+        await asyncio.gather(*[work(i) for i in range(20)])
+        assert finished != list(range(20))
+        assert emitted == list(range(20))
+
+
+class TestPrefetchOrdered:
+
+    @pytest.mark.asyncio
+    async def test_yields_in_order_up_to_limit(self):
+        in_flight = []
+        max_in_flight = []
+
+        async def fetch(item):
+            in_flight.append(item)
+            max_in_flight.append(len(in_flight))
+            # Later items finish first
+            await asyncio.sleep(0.01 * (10 - item))
+            in_flight.remove(item)
+            return item * 2
+
+        results = [pair async for pair in prefetch_ordered(fetch, range(10), 4)]
+        assert results == [(item, item * 2) for item in range(10)]
+        assert max(max_in_flight) == 4
+
+
+class TestByteBudget:
+
+    def test_waits_for_released_bytes(self):
+        budget = ByteBudget(max_bytes=10)
+        budget.acquire(6)
+        assert budget.try_acquire(6) is False
+        # Chunks larger than the budget are allowed once nothing else is held
+        released = threading.Timer(0.05, budget.release, args=(6,))
+        released.start()
+        with budget.reserve(20):
+            assert budget.in_flight == 20
+        released.join()
+        assert budget.in_flight == 0
+
+    def test_reservation_is_resized_to_the_fetched_size(self):
+        budget = ByteBudget(max_bytes=10)
+        with budget.reserve(4) as reservation:
+            # The estimate is held before the fetch, the actual size once it is known
+            assert budget.in_flight == 4
+            reservation.resize(12)
+            assert budget.in_flight == 12
+            assert budget.try_acquire(1) is False
+            reservation.resize(2)
+            assert budget.try_acquire(8) is True
+        assert budget.in_flight == 8
+
+    def test_configure_rejects_invalid_size(self):
+        with pytest.raises(ValueError):
+            ByteBudget().configure(0)
+
+
+class TestListingPrefetcher:
+    tree = {"/": ["/a", "/b", "/c"], "/a": ["/a/x", "/a/y"], "/b": [], "/c": ["/c/z"], "/a/x": [], "/a/y": [],
+            "/c/z": []}
+
+    async def walk(self, prefetcher, path):
+        children = await prefetcher.get(path)
+        prefetcher.queue(children)
+        visited = [path]
+        for child in children:
+            visited.extend(await self.walk(prefetcher, child))
+        return visited
+
+    @pytest.mark.asyncio
+    async def test_walk_keeps_depth_first_order(self):
+        pool = RequestPool(max_concurrent_requests=4)
+        service = MockService()
+        async_service = AsyncService(service, pool=pool)
+
+        async def list_func(path):
+            await async_service.list(path)
+            return self.tree[path]
+
+        prefetcher = ListingPrefetcher(list_func, max_prefetch=2)
+        visited = await self.walk(prefetcher, "/")
+        prefetcher.close()
+        pool.shutdown()
+        assert visited == ["/", "/a", "/a/x", "/a/y", "/b", "/c", "/c/z"]
+        assert 1 < service.max_in_flight <= 3
+
+    def test_invalid_max_prefetch(self):
+        with pytest.raises(ValueError):
+            ListingPrefetcher(None, max_prefetch=0)
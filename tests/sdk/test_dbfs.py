@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from base64 import b64encode
+
+import pytest
+from databricks_cli.dbfs.api import BUFFER_SIZE_BYTES
+
+from databricks_sync.sdk.generators.dbfs import DbfsFileHCLGenerator, DbfsFile
+from databricks_sync.sdk.pipeline import ExportFileUtils
+from databricks_sync.sdk.service.concurrency import download_budget
+from databricks_sync.sdk.sync.partition import ForEachPartition
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+class MockApiClient:
+    url = "https://test.cloud.databricks.com"
+
+    def __init__(self):
+        now = int(time.time() * 1000)
+        self.listed = []
+        self.listings = {
+            "dbfs:/tests": [{"path": "/tests/b", "is_dir": True},
+                            {"path": "/tests/tmp", "is_dir": True},
+                            {"path": "/tests/big.jar", "is_dir": False, "file_size": 2048,
+                             "modification_time": now},
+                            {"path": "/tests/old.txt", "is_dir": False, "file_size": 10,
+                             "modification_time": now - 30 * DAY_MS},
+                            {"path": "/tests/a.txt", "is_dir": False, "file_size": 10, "modification_time": now}],
+            "/tests/b": [{"path": "/tests/b/c.txt", "is_dir": False, "file_size": 10, "modification_time": now},
+                         {"path": "/tests/b/d.txt", "is_dir": False}],
+        }
+
+    def perform_query(self, method, path, data=None, headers=None):
+        if path == "/dbfs/list":
+            self.listed.append(data["path"])
+            return {"files": self.listings[data["path"]]}
+        raise ValueError(path)
+
+
+class TestDbfsFileHCLGenerator:
+
+    @staticmethod
+    async def generate(generator):
+        return [pair[0] for item in [item async for item in generator._generate()]
+                for pair in item.for_each_var_id_name_pairs]
+
+    @pytest.mark.asyncio
+    async def test_crawl_keeps_listing_order(self, tmp_path):
+        client = MockApiClient()
+        generator = DbfsFileHCLGenerator(client, tmp_path, "dbfs:/tests", exclude_path="/tests/tmp**")
+        assert await self.generate(generator) == ["/tests/b/c.txt", "/tests/b/d.txt", "/tests/big.jar",
+                                                  "/tests/old.txt", "/tests/a.txt"]
+        # Excluded folders are never listed
+        assert sorted(client.listed) == ["/tests/b", "dbfs:/tests"]
+
+    @pytest.mark.asyncio
+    async def test_listing_metadata_filters(self, tmp_path):
+        client = MockApiClient()
+        generator = DbfsFileHCLGenerator(client, tmp_path, "dbfs:/tests", exclude_path="/tests/tmp**",
+                                         max_file_size=1024, max_file_age_days=7)
+        # Files without a size or modification time in the listing are kept
+        assert await self.generate(generator) == ["/tests/b/c.txt", "/tests/b/d.txt", "/tests/a.txt"]
+
+    @pytest.mark.asyncio
+    async def test_for_each_partitions(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ForEachPartition, "from_config", classmethod(lambda cls: cls(3)))
+        generator = DbfsFileHCLGenerator(MockApiClient(), tmp_path, "dbfs:/tests", exclude_path="/tests/tmp**")
+        items = [item async for item in generator._generate()]
+        # Every partition is created even if it is empty
+        assert [item.hcl_resource_identifier for item in items] == [f"databricks_dbfs_files_{i}" for i in range(3)]
+        assert sorted(pair[0] for item in items for pair in item.for_each_var_id_name_pairs) == \
+               ["/tests/a.txt", "/tests/b/c.txt", "/tests/b/d.txt", "/tests/big.jar", "/tests/old.txt"]
+        for index, item in enumerate(items):
+            assert [variable.variable_name for variable in item.local_variables] == \
+                   [f"databricks_dbfs_file_for_each_var_{index}"]
+            assert all(ForEachPartition(3).index(path) == index for path in item.local_variables[0].data)
+
+
+class MockDbfsService:
+    # Reads return at most half of the requested length like a throttled api
+    def __init__(self, content):
+        self.content = content
+
+    def get_status(self, path):
+        return {"path": path.replace("dbfs:", ""), "is_dir": False, "file_size": len(self.content)}
+
+    def read(self, path, offset, length):
+        data = self.content[offset:offset + max(length // 2, 1)]
+        return {"bytes_read": len(data), "data": b64encode(data).decode()}
+
+
+class TestDbfsFile:
+
+    def test_streams_ranges_in_order(self, tmp_path):
+        content = bytes(range(256)) * (BUFFER_SIZE_BYTES * 5 // 256 + 3)
+        artifact = DbfsFile(remote_path="/tests/big.bin", local_path=tmp_path / "big.bin",
+                            service=MockDbfsService(content))
+        chunks = list(artifact.iter_content())
+        assert max(len(chunk) for chunk in chunks) == BUFFER_SIZE_BYTES
+        assert b"".join(chunks) == content
+
+        digest = hashlib.sha256()
+        assert ExportFileUtils.add_file_chunks(artifact.local_path, artifact.iter_content(), digest=digest) == \
+            len(content)
+        assert artifact.local_path.read_bytes() == content
+        assert digest.hexdigest() == hashlib.sha256(content).hexdigest()
+
+    def test_downloads_share_the_budget(self, tmp_path):
+        content = b"x" * (BUFFER_SIZE_BYTES * 6)
+        artifacts = [DbfsFile(remote_path=f"/tests/{i}.bin", local_path=tmp_path / f"{i}.bin",
+                              service=MockDbfsService(content)) for i in range(3)]
+        max_in_flight = []
+
+        def download(artifact):
+            for chunk in artifact.iter_content():
+                max_in_flight.append(download_budget.in_flight)
+                time.sleep(0.01)
+
+        download_budget.configure(BUFFER_SIZE_BYTES * 2)
+        try:
+            threads = [threading.Thread(target=download, args=(artifact,)) for artifact in artifacts]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=30)
+            assert not any(thread.is_alive() for thread in threads)
+        finally:
+            download_budget.configure(download_budget.DEFAULT_MAX_BYTES)
+        assert len(max_in_flight) == 18
+        assert max(max_in_flight) <= BUFFER_SIZE_BYTES * 2
+        assert download_budget.in_flight == 0
+
+    def test_failed_download_leaves_no_file(self, tmp_path):
+        def chunks():
+            yield b"partial"
+            raise IOError("connection reset")
+
+        with pytest.raises(IOError):
+            ExportFileUtils.add_file_chunks(tmp_path / "f.txt", chunks())
+        assert list(tmp_path.iterdir()) == []
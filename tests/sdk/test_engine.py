@@ -0,0 +1,101 @@
+import pytest
+
+from databricks_sync.sdk.engine import PipelineEngine
+from databricks_sync.sdk.message import HCLConvertData, APIData
+from databricks_sync.sdk.service.concurrency import StageExecutor
+
+
+class MockGenerator:
+
+    def __init__(self, count):
+        self.count = count
+        self.generated = 0
+
+    async def generate(self):
+        for i in range(self.count):
+            self.generated += 1
+            yield i
+
+
+@HCLConvertData.manage_error
+def double(x):
+    return x * 2
+
+
+def make_slow_sink(results):
+    @HCLConvertData.manage_error
+    def slow_sink(x):
+        results.append(x)
+
+    return slow_sink
+
+
+class MockMessageGenerator:
+
+    def __init__(self, count):
+        self.count = count
+
+    async def generate(self):
+        for i in range(self.count):
+            yield HCLConvertData("databricks_notebook", APIData(str(i), "www.workspace-url.com", f"hcl-{i}", {}, None))
+
+
+class TestPipelineEngine:
+
+    @pytest.mark.asyncio
+    async def test_fan_out_and_drain(self):
+        left, right = [], []
+        engine = PipelineEngine(queue_size=4)
+        doubled = engine.add_stage("double", double)
+        doubled.to(engine.add_stage("left", make_slow_sink(left)), engine.add_stage("right", make_slow_sink(right)))
+        engine.add_source(MockGenerator(100), doubled)
+        await engine.run()
+        assert sorted(left) == sorted(right) == [i * 2 for i in range(100)]
+        stats = engine.stats()
+        assert stats["double"]["processed"] == 100
+        assert all(stage["max_queue_depth"] <= 4 for stage in stats.values())
+
+    @pytest.mark.asyncio
+    async def test_backpressure_reaches_generator(self):
+        generator = MockGenerator(100)
+        observed = []
+
+        @HCLConvertData.manage_error
+        def observe(x):
+            # The generator can only be a bounded number of items ahead of the slowest stage
+            observed.append(generator.generated - x)
+            return x
+
+        engine = PipelineEngine(queue_size=2)
+        stage_executor = StageExecutor(2)
+        engine.add_source(generator, engine.add_stage("observe", observe, stage_executor=stage_executor))
+        await engine.run()
+        stage_executor.shutdown()
+        assert len(observed) == 100
+        assert max(observed) <= 5
+
+    @pytest.mark.asyncio
+    async def test_failed_messages_reach_the_results(self):
+        results = []
+
+        def broken(message):
+            # Errors escaping the managed error handling, i.e. a bug in the stage itself
+            if message.raw_id == "1":
+                raise ValueError("broken stage")
+            return message
+
+        engine = PipelineEngine(queue_size=2)
+        stage = engine.add_stage("broken", broken, verify_error=False)
+        # Like the pipeline results, the sink sees every message including the failed ones
+        stage.to(engine.add_stage("results", results.append, verify_error=False))
+        engine.add_source(MockMessageGenerator(3), stage)
+        await engine.run()
+        # The failed message is forwarded with its error so that it is reported as failed
+        assert [message.raw_id for message in results] == ["0", "1", "2"]
+        assert [len(message.errors) for message in results] == [0, 1, 0]
+        assert engine.stats()["broken"]["failed"] == 1
+
+    def test_stage_requires_managed_error(self):
+        engine = PipelineEngine()
+        with pytest.raises(ValueError):
+            engine.add_stage("unmanaged", lambda x: x)
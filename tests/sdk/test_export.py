@@ -0,0 +1,68 @@
+import concurrent.futures
+import os
+
+from databricks_sync.sdk.message import HCLConvertData, LineagePolicy
+from databricks_sync.sdk.report.model import event_manager, RUN_ID_ENV_VAR
+from databricks_sync.sdk.sync import export
+from databricks_sync.sdk.sync.export import ExportCoordinator
+
+
+class MockApiClient:
+
+    def perform_query(self, method, path, data=None, headers=None):
+        raise ValueError(path)
+
+
+class InlineExecutor:
+    # Runs the partitions in this process instead of spawning them
+
+    def __init__(self, max_workers=None, mp_context=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    @staticmethod
+    def submit(func, *args):
+        future = concurrent.futures.Future()
+        future.set_result(func(*args))
+        return future
+
+
+class TestExportProcesses:
+
+    @staticmethod
+    def export_processes(monkeypatch, tmp_path):
+        environments = []
+
+        def export_partition(api_client, config, export_partition, *args):
+            environments.append((dict(os.environ), args))
+            return export_partition.index
+
+        monkeypatch.setattr(export, "ProcessPoolExecutor", InlineExecutor)
+        monkeypatch.setattr(export.ExportMerger, "merge", lambda self, paths: None)
+        monkeypatch.setattr(ExportCoordinator, "export_partition", staticmethod(export_partition))
+        ExportCoordinator.export_processes(MockApiClient(), {"objects": {"cluster": {"patterns": ["*"]}}}, tmp_path,
+                                           2, 1, None, {})
+        return environments
+
+    def test_processes_share_the_run_id(self, monkeypatch, tmp_path):
+        monkeypatch.delenv(RUN_ID_ENV_VAR, raising=False)
+        environments = self.export_processes(monkeypatch, tmp_path)
+        assert [environment[RUN_ID_ENV_VAR] for environment, _ in environments] == [event_manager.run_id]
+        # Later exports in this interpreter start their own run
+        assert RUN_ID_ENV_VAR not in os.environ
+
+    def test_previous_run_id_is_restored(self, monkeypatch, tmp_path):
+        monkeypatch.setenv(RUN_ID_ENV_VAR, "previous")
+        self.export_processes(monkeypatch, tmp_path)
+        assert os.environ[RUN_ID_ENV_VAR] == "previous"
+
+    def test_processes_get_the_lineage_policy(self, monkeypatch, tmp_path):
+        # Spawned processes do not inherit the class attribute so it is passed to them
+        monkeypatch.setattr(HCLConvertData, "lineage_policy", LineagePolicy.FULL)
+        environments = self.export_processes(monkeypatch, tmp_path)
+        assert [args[-1] for _, args in environments] == [LineagePolicy.FULL]
@@ -0,0 +1,56 @@
+import fnmatch
+
+import pytest
+
+from databricks_sync.sdk.generators import PathPatternMatcher, PathExclusionParser, PathInclusionParser
+
+PATTERNS = ["/Users/**", "/tmp/*.whl", "/Shared/team?/nb", "/Repos/[ab]*/**", "/exact/path"]
+
+
+class TestPathPatternMatcher:
+
+    @pytest.mark.parametrize("path", ["/Users/a/nb", "/tmp/lib.whl", "/tmp/lib.jar", "/Shared/team1/nb",
+                                      "/Shared/team12/nb", "/Repos/alpha/x", "/Repos/charlie/x", "/exact/path",
+                                      "/exact/path/nb"])
+    def test_matches_like_fnmatch(self, path):
+        matcher = PathPatternMatcher(PATTERNS)
+        assert matcher.matches(path) is any(fnmatch.fnmatch(path, pattern) for pattern in PATTERNS)
+        assert matcher.matched_patterns(path) == [pattern for pattern in PATTERNS if fnmatch.fnmatch(path, pattern)]
+
+    @pytest.mark.parametrize("dir_path, can_match", [
+        ("/", True),
+        ("/Users/a", True),
+        ("/Shared", True),
+        ("/Shared/other", False),
+        ("/exact", True),
+        ("/exact/path", False),
+        ("/databricks", False),
+    ])
+    def test_can_match_under(self, dir_path, can_match):
+        assert PathPatternMatcher(PATTERNS).can_match_under(dir_path) is can_match
+
+    @pytest.mark.parametrize("dir_path, matches_all", [
+        ("/Users", True),
+        ("/Users/a/b", True),
+        ("/tmp", False),
+        ("/Repos/alpha", False),
+    ])
+    def test_matches_all_under(self, dir_path, matches_all):
+        assert PathPatternMatcher(PATTERNS).matches_all_under(dir_path) is matches_all
+
+    def test_no_patterns(self):
+        matcher = PathPatternMatcher([])
+        assert matcher.matches("/Users") is False
+        assert matcher.can_match_under("/") is False
+
+
+class TestPathParsers:
+
+    def test_subtrees(self):
+        inclusion = PathInclusionParser(["dbfs:/databricks/init_scripts"], "databricks_dbfs_file")
+        assert inclusion.is_subtree_included("dbfs:/databricks") is True
+        assert inclusion.is_subtree_included("dbfs:/databricks/jars") is False
+        exclusion = PathExclusionParser(["dbfs:/tmp**"], "databricks_dbfs_file")
+        assert exclusion.is_subtree_excluded("dbfs:/tmp") is True
+        assert exclusion.is_subtree_excluded("dbfs:/tests") is False
+        assert PathExclusionParser(None, "databricks_dbfs_file").is_subtree_excluded("dbfs:/tmp") is False
@@ -0,0 +1,77 @@
+import copy
+
+import pytest
+import requests
+
+from databricks_sync.sdk.generators.jobs import JobHCLGenerator
+from databricks_sync.sdk.service.jobs import with_api_version
+
+JOBS = [{"job_id": job_id, "settings": {"name": f"{'etl' if job_id % 2 == 0 else 'ml'} job {job_id}",
+                                        "max_concurrent_runs": 1,
+                                        "tasks": [{"task_key": "t", "notebook_task": {"notebook_path": "/nb"},
+                                                   "existing_cluster_id": "c1"}]}}
+        for job_id in range(60)]
+
+
+class MockApiClient:
+
+    def __init__(self, supports_jobs_21=True, deleted_after_first_page=()):
+        self.url = "https://test.cloud.databricks.com/api/2.0"
+        self.supports_jobs_21 = supports_jobs_21
+        self.deleted_after_first_page = deleted_after_first_page
+        self.jobs = list(JOBS)
+        self.calls = []
+
+    def perform_query(self, method, path, data=None, headers=None):
+        self.calls.append((self.url.rsplit("/", 1)[-1], path))
+        if path == "/jobs/list" and self.url.endswith("/2.1"):
+            if self.supports_jobs_21 is False:
+                raise requests.exceptions.HTTPError("ENDPOINT_NOT_FOUND")
+            page = self.jobs[data["offset"]:data["offset"] + data["limit"]]
+            has_more = data["offset"] + data["limit"] < len(self.jobs)
+            if data["offset"] == 0:
+                self.jobs = [job for job in self.jobs if job["job_id"] not in self.deleted_after_first_page]
+            return {"jobs": copy.deepcopy(page), "has_more": has_more}
+        if path == "/jobs/list":
+            return {"jobs": [{"job_id": job["job_id"], "settings": {"name": job["settings"]["name"]}}
+                             for job in JOBS]}
+        if path == "/jobs/get":
+            return copy.deepcopy(JOBS[data["job_id"]])
+        if path.startswith("/preview/permissions/"):
+            return {"access_control_list": []}
+        raise ValueError(path)
+
+
+class TestJobHCLGenerator:
+
+    @staticmethod
+    async def generate(client):
+        generator = JobHCLGenerator(client, "/tmp", patterns=["etl*"])
+        return [item.raw_id async for item in generator._generate()
+                if item is not None and item.resource_name == "databricks_job"]
+
+    def test_with_api_version(self):
+        client = MockApiClient()
+        assert with_api_version(client, "2.1").url == "https://test.cloud.databricks.com/api/2.1"
+        assert client.url == "https://test.cloud.databricks.com/api/2.0"
+
+    @pytest.mark.asyncio
+    async def test_lists_expanded_jobs(self):
+        client = MockApiClient()
+        assert await self.generate(client) == [job_id for job_id in range(60) if job_id % 2 == 0]
+        assert not any(path == "/jobs/get" for _, path in client.calls)
+        # Permissions are only fetched for the jobs which match the patterns
+        assert len([path for _, path in client.calls if path.startswith("/preview/permissions/jobs/")]) == 30
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_get_job(self):
+        client = MockApiClient(supports_jobs_21=False)
+        assert await self.generate(client) == [job_id for job_id in range(60) if job_id % 2 == 0]
+        assert len([path for _, path in client.calls if path == "/jobs/get"]) == 30
+
+    @pytest.mark.asyncio
+    async def test_lists_again_when_jobs_are_deleted(self):
+        client = MockApiClient(deleted_after_first_page=(2, 4))
+        # The deleted jobs were already exported from the first page and no job moved off the shifted pages is missed
+        assert await self.generate(client) == [job_id for job_id in range(60) if job_id % 2 == 0]
+        assert len([path for _, path in client.calls if path == "/jobs/list"]) > 3
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from databricks_sync.sdk.manifest import ArtifactManifest
+from databricks_sync.sdk.message import Artifact
+
+
+class MockArtifact(Artifact):
+
+    def get_content(self):
+        return b"content"
+
+
+def make_artifact(base_path, name, version):
+    return MockArtifact(remote_path=f"/{name}", local_path=Path(base_path) / "exports" / "notebook" / "data" / name,
+                        service=None, version=version)
+
+
+def export(base_path, artifacts):
+    manifest = ArtifactManifest(Path(base_path), Path(base_path) / "exports" / "notebook")
+    downloaded = []
+    for artifact in artifacts:
+        if manifest.restore(artifact):
+            continue
+        artifact.local_path.parent.mkdir(parents=True, exist_ok=True)
+        artifact.local_path.write_bytes(artifact.get_content())
+        manifest.add(artifact, artifact.get_content())
+        downloaded.append(artifact.remote_path)
+    manifest.write()
+    return downloaded
+
+
+class TestArtifactManifest:
+
+    def test_keeps_unchanged_artifacts(self, tmpdir):
+        assert export(tmpdir, [make_artifact(tmpdir, "a", {"v": 1}), make_artifact(tmpdir, "b", {"v": 1}),
+                               make_artifact(tmpdir, "c", None)]) == ["/a", "/b", "/c"]
+        # changed versions, artifacts without a version and locally modified files are downloaded again
+        (Path(tmpdir) / "exports" / "notebook" / "data" / "b").write_bytes(b"modified")
+        assert export(tmpdir, [make_artifact(tmpdir, "a", {"v": 1}), make_artifact(tmpdir, "b", {"v": 1}),
+                               make_artifact(tmpdir, "c", None)]) == ["/b", "/c"]
+        assert export(tmpdir, [make_artifact(tmpdir, "a", {"v": 2})]) == ["/a"]
+
+    def test_prepare_and_prune(self, tmpdir):
+        base_path = Path(tmpdir)
+        exports_path = base_path / "exports"
+        export(tmpdir, [make_artifact(tmpdir, "a", {"v": 1}), make_artifact(tmpdir, "b", {"v": 1})])
+        (exports_path / "notebook" / "hcl").mkdir()
+        (exports_path / "cluster").mkdir()
+        (exports_path / "mapped_variables.tf.json").write_text("{}")
+
+        ArtifactManifest.prepare(exports_path, ["notebook"])
+        assert sorted(path.name for path in exports_path.iterdir()) == ["notebook"]
+        assert sorted(path.name for path in (exports_path / "notebook").iterdir()) == \
+               [ArtifactManifest.FILE_NAME, "data"]
+
+        export(tmpdir, [make_artifact(tmpdir, "a", {"v": 1})])
+        ArtifactManifest.prune(exports_path, base_path)
+        assert sorted(path.name for path in (exports_path / "notebook" / "data").iterdir()) == ["a"]
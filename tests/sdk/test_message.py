@@ -1,4 +1,8 @@
-from databricks_sync.sdk.message import Variable, ErrorMixin
+import tracemalloc
+from base64 import b64encode
+
+from databricks_sync.sdk.message import Variable, ErrorMixin, LineagePolicy, Artifact
+from databricks_sync.sdk.processor import MappedGrokVariableBasicAnnotationProcessor
 from tests.sdk import *
 
 
@@ -30,6 +34,15 @@ def normalize_multiline(val):
     return "\n".join([line.lstrip(" ") for line in val.split("\n")])
 
 
+class TestArtifact:
+
+    def test_iter_b64decode(self):
+        content = bytes(range(256)) * 10
+        chunks = list(Artifact.iter_b64decode(b64encode(content).decode(), chunk_size=400))
+        assert len(chunks) == 9
+        assert b"".join(chunks) == content
+
+
 class TestVariable:
     my_dummy_variable = "varname"
     value_default = "hello world"
@@ -93,6 +106,53 @@ class TestHCLConvertData:
         assert len(hcl_convert_data_with_no_processors.resource_variables) == 1
         assert hcl_convert_data_with_no_processors.resource_variables[0] == var
 
+    def test_copy(self, hcl_convert_data_with_no_processors, sample_api_data_with_artifacts):
+        copied = hcl_convert_data_with_no_processors.copy()
+        new_data = {"new": "lineage"}
+        copied.modify_json(new_data)
+        copied.add_mapped_variable("test-var", "default-val")
+        assert copied.lineage[0] is hcl_convert_data_with_no_processors.lineage[0]
+        assert copied.latest_version == new_data
+        assert hcl_convert_data_with_no_processors.lineage == [sample_api_data_with_artifacts.data]
+        assert hcl_convert_data_with_no_processors.mapped_variables == []
+
+    def test_processors_run_on_copies(self):
+        raw_data = {"spark_conf": {"spark.foo": "Standard_DS3", "spark.bar": "baz"}, "node_type_id": "Standard_DS3"}
+        hcl_data = HCLConvertData(resource_name, APIData(raw_id, workspace_url, hcl_resource_identifier, raw_data,
+                                                         local_save_path))
+        copied = hcl_data.copy()
+        # Escaped dots are part of the key like in every other dot path lookup
+        MappedGrokVariableBasicAnnotationProcessor(resource_name, {"spark_conf.spark\\.foo": None}).process(copied)
+        assert copied.latest_version["spark_conf"] == {"spark.foo": "${var.Standard_DS3}", "spark.bar": "baz"}
+        assert [var.variable_name for var in copied.mapped_variables] == ["Standard_DS3"]
+        # The source message and the untouched sub trees are not modified
+        assert hcl_data.latest_version["spark_conf"]["spark.foo"] == "Standard_DS3"
+        assert copied.latest_version["node_type_id"] == "Standard_DS3"
+
+    def test_lineage_keeps_first_and_latest(self, hcl_convert_data_with_no_processors, sample_api_data_with_artifacts):
+        assert HCLConvertData.lineage_policy == LineagePolicy.FIRST_AND_LATEST
+        for i in range(5):
+            hcl_convert_data_with_no_processors.modify_json({"version": i})
+        assert hcl_convert_data_with_no_processors.lineage == [sample_api_data_with_artifacts.data, {"version": 4}]
+
+    def test_memory_per_object(self):
+        count = 1000
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        objects = []
+        for i in range(count):
+            hcl_data = HCLConvertData(resource_name, APIData(str(i), workspace_url, hcl_resource_identifier, data,
+                                                              local_save_path))
+            for version in range(5):
+                hcl_data.modify_json(data)
+            hcl_data.add_mapped_variable("test-var", "default-val")
+            hcl_data.add_for_each_var_name_pairs([("id", "name")])
+            objects.append(hcl_data)
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        per_object = (after - before) / count
+        assert per_object < 1000, f"each message takes {per_object} bytes"
+
     def test_to_hcl(self, hcl_convert_data_with_no_processors):
         variable_name = "test-var"
         default_value = "default-val"
@@ -0,0 +1,180 @@
+import asyncio
+import io
+import zipfile
+from base64 import b64encode
+from pathlib import Path
+
+import pytest
+import requests
+
+from databricks_sync.sdk.generators.notebook import NotebookArchives, NotebookArtifact, NotebookHCLGenerator
+from databricks_sync.sdk.service.concurrency import download_budget
+from databricks_sync.sdk.service.scim import scim_users
+
+NOTEBOOKS = {
+    "/Shared/a/nb1": "PYTHON",
+    "/Shared/a/b/nb2": "SQL",
+    "/Shared/big/nb3": "PYTHON",
+    "/Shared/big/c/nb4": "SCALA",
+    "/Shared/nb5": "PYTHON",
+}
+EXTENSIONS = {"PYTHON": ".py", "SQL": ".sql", "SCALA": ".scala"}
+
+
+def source(path):
+    return f"# Databricks notebook source\nprint('{path}')\n".encode()
+
+
+class MockWorkspaceService:
+
+    def __init__(self, too_large=()):
+        self.exported = []
+        self.too_large = too_large
+
+    def export_workspace(self, path, format=None):
+        self.exported.append(path)
+        if path in NOTEBOOKS:
+            return {"content": b64encode(source(path)).decode()}
+        if path in self.too_large:
+            raise requests.exceptions.HTTPError("MAX_NOTEBOOK_SIZE_EXCEEDED")
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w") as archive:
+            for notebook, language in NOTEBOOKS.items():
+                if notebook.startswith(path + "/"):
+                    name = path.split("/")[-1] + notebook[len(path):] + EXTENSIONS[language]
+                    archive.writestr(name, source(notebook))
+        return {"content": b64encode(output.getvalue()).decode()}
+
+
+class TestNotebookArchives:
+
+    @pytest.mark.parametrize("too_large, exported", [
+        ((), ["/Shared/a", "/Shared/big", "/Shared/nb5"]),
+        # Directories above the size limit are split into their sub directories
+        (("/Shared/big",), ["/Shared/a", "/Shared/big", "/Shared/big/nb3", "/Shared/big/c", "/Shared/nb5"]),
+    ])
+    def test_exports_directories_once(self, tmp_path, too_large, exported):
+        service = MockWorkspaceService(too_large=too_large)
+        archives = NotebookArchives(service, ["/Shared"])
+        for notebook in NOTEBOOKS:
+            artifact = NotebookArtifact(remote_path=notebook, local_path=tmp_path / "nb", service=service,
+                                        archives=archives)
+            assert b"".join(artifact.iter_content()) == source(notebook)
+        assert service.exported == exported
+
+    def test_reserves_notebooks_before_extracting_them(self, tmp_path, monkeypatch):
+        service = MockWorkspaceService()
+        archives = NotebookArchives(service, ["/Shared"])
+        read = zipfile.ZipFile.read
+        reserved = []
+
+        def read_reserved(archive, name, *args, **kwargs):
+            reserved.append(download_budget.in_flight)
+            return read(archive, name, *args, **kwargs)
+
+        monkeypatch.setattr(zipfile.ZipFile, "read", read_reserved)
+        artifact = NotebookArtifact(remote_path="/Shared/a/b/nb2", local_path=tmp_path / "nb", service=service,
+                                    archives=archives)
+        assert b"".join(artifact.iter_content()) == source("/Shared/a/b/nb2")
+        assert reserved == [len(source("/Shared/a/b/nb2"))]
+        assert download_budget.in_flight == 0
+
+
+class MockScimApiClient:
+    url = "https://test.cloud.databricks.com/api/2.0"
+
+    def __init__(self):
+        self.calls = []
+
+    def perform_query(self, method, path, data=None, headers=None):
+        self.calls.append(path)
+        if path == "/preview/scim/v2/Users":
+            return {"Resources": [{"userName": "bob@x.com"}, {"userName": "alice@x.com"}]}
+        raise ValueError(path)
+
+
+class TestValidUserPaths:
+
+    @pytest.mark.parametrize("path, is_valid", [
+        ("/Users", True),
+        ("/Shared/bob@x.com", True),
+        ("/Users/bob@x.com", True),
+        ("/Users/alice@x.com/project/nb", True),
+        ("/Users/removed@x.com/project", False),
+        # Only whole user names are valid homes
+        ("/Users/bob@x.com.old/project", False),
+    ])
+    @pytest.mark.asyncio
+    async def test_is_valid_user_path(self, path, is_valid):
+        client = MockScimApiClient()
+        generator = NotebookHCLGenerator(client, Path("/tmp"), "/Users", exclude_deleted_users=True)
+        await generator._get_valid_user_paths()
+        assert generator._is_valid_user_path(path) is is_valid
+
+    @pytest.mark.asyncio
+    async def test_users_are_listed_once_per_client(self):
+        client = MockScimApiClient()
+        generator = NotebookHCLGenerator(client, Path("/tmp"), "/Users", exclude_deleted_users=True)
+        await generator._get_valid_user_paths()
+        assert generator._is_valid_user_path("/Users/bob@x.com") is True
+        assert len(await scim_users.get(client)) == 2
+        assert client.calls == ["/preview/scim/v2/Users"]
+
+
+class MockWorkspaceApiClient:
+    url = "https://test.cloud.databricks.com/api/2.0"
+    notebooks = [{"object_type": "NOTEBOOK", "object_id": i, "path": f"/Shared/big/nb{i}", "language": "PYTHON"}
+                 for i in range(50)]
+
+    def __init__(self):
+        self.calls = []
+
+    def perform_query(self, method, path, data=None, headers=None):
+        self.calls.append(path)
+        if path == "/workspace/list" and data["path"] == "/Shared/big":
+            return {"objects": self.notebooks + [{"object_type": "DIRECTORY", "object_id": 2000 + i,
+                                                  "path": f"/Shared/big/sub{i}"} for i in range(3)]}
+        if path == "/workspace/list" and data["path"] == "/Shared/big/sub2":
+            return {"objects": []}
+        if path == "/workspace/list":
+            return {"objects": [{"object_type": "NOTEBOOK", "object_id": 3000 + int(data["path"][-1]),
+                                 "path": f"{data['path']}/nb", "language": "PYTHON"}]}
+        if path == "/workspace/get-status":
+            return {"object_type": "DIRECTORY", "object_id": 1000, "path": data["path"]}
+        if path.startswith("/preview/permissions/"):
+            return {"access_control_list": []}
+        raise ValueError(path)
+
+
+class TestNotebookPermissions:
+
+    def notebook_permission_calls(self, client):
+        return [path for path in client.calls if path.startswith("/preview/permissions/notebooks/")
+                and path.rsplit("/", 1)[-1].isdigit()]
+
+    @pytest.mark.asyncio
+    async def test_prefetches_a_window_of_notebook_permissions(self):
+        client = MockWorkspaceApiClient()
+        generator = NotebookHCLGenerator(client, Path("/tmp"), "/Shared/big")
+        items = generator._generate()
+        assert (await items.__anext__()).resource_name == "databricks_notebook"
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+        # Only a window ahead of the exported notebook is requested, not the whole folder
+        assert len(self.notebook_permission_calls(client)) == NotebookHCLGenerator.MAX_PREFETCH_PERMISSIONS + 1
+        async for _ in items:
+            pass
+        assert sorted(self.notebook_permission_calls(client)) == \
+               sorted([f"/preview/permissions/notebooks/{i}" for i in range(50)] +
+                      [f"/preview/permissions/notebooks/{3000 + i}" for i in range(2)])
+
+    @pytest.mark.asyncio
+    async def test_forgets_folders_once_walked(self):
+        client = MockWorkspaceApiClient()
+        generator = NotebookHCLGenerator(client, Path("/tmp"), "/Shared/big")
+        async for _ in generator._generate():
+            pass
+        # The sub folders are looked up from the listing, only the base path needs its status
+        assert [path for path in client.calls if path == "/workspace/get-status"] == ["/workspace/get-status"]
+        # Including the empty folder whose permissions are never fetched
+        assert generator._NotebookHCLGenerator__listed_folders == {}
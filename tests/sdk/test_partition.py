@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from databricks_sync.sdk.pipeline import ExportFileUtils
+from databricks_sync.sdk.sync.merge import ExportMerger
+from databricks_sync.sdk.sync.partition import PathPartition, ExportPartitioner, ExportShard, ForEachPartition
+
+
+class MockApiClient:
+
+    def perform_query(self, method, path, data=None, headers=None):
+        if path == "/workspace/list":
+            return {"objects": [{"path": "/Users", "object_type": "DIRECTORY"},
+                                {"path": "/Shared", "object_type": "DIRECTORY"},
+                                {"path": "/nb", "object_type": "NOTEBOOK"}]}
+        if path == "/dbfs/list":
+            return {"files": [{"path": "/tests/a", "is_dir": True},
+                              {"path": "/tests/f.txt", "is_dir": False}]}
+        raise ValueError(path)
+
+
+class TestPathPartition:
+
+    def test_ownership(self):
+        partition = PathPartition(["/Users", "/Shared"], ["/Users"], owns_root=False)
+        assert partition.is_owned("/Users/a@b.com/nb") is True
+        assert partition.is_owned("/Shared/nb") is False
+        assert partition.is_owned("/nb") is False
+        assert partition.should_visit("/") is True
+        assert partition.should_visit("/Shared") is False
+
+    def test_root_owner_with_dbfs_paths(self):
+        partition = PathPartition(["dbfs:/tests/a"], [], owns_root=True)
+        assert partition.is_owned("/tests/f.txt") is True
+        assert partition.is_owned("/tests/a/g.txt") is False
+        assert partition.should_visit("dbfs:/tests") is True
+        assert partition.should_visit("dbfs:/tests/a") is False
+
+
+class TestExportPartitioner:
+
+    def test_plan(self):
+        objects = {"notebook": {"notebook_path": "/"}, "dbfs_file": {"dbfs_path": "dbfs:/tests"},
+                   "cluster": {"patterns": ["*"]}}
+        partitions = ExportPartitioner(MockApiClient(), 3).plan(objects)
+        assert len(partitions) == 3
+        # every path is owned by exactly one partition
+        for path in ["/nb", "/Users/a/nb", "/Shared/nb"]:
+            assert sum(p.path_partitions["notebook"].is_owned(path) for p in partitions
+                       if "notebook" in p.path_partitions) == 1
+        for path in ["/tests/f.txt", "/tests/a/f.txt"]:
+            assert sum(p.path_partitions["dbfs_file"].is_owned(path) for p in partitions
+                       if "dbfs_file" in p.path_partitions) == 1
+        assert sum("cluster" in p.objects for p in partitions) == 1
+
+    def test_plan_drops_empty_partitions(self):
+        partitions = ExportPartitioner(MockApiClient(), 4).plan({"cluster": {"patterns": ["*"]}})
+        assert [p.index for p in partitions] == [0]
+        assert partitions[0].path_partitions == {}
+
+
+class TestExportShard:
+
+    def test_parse(self):
+        shard = ExportShard.parse("2/4")
+        assert (shard.index, shard.count) == (2, 4)
+        assert str(shard) == "2/4"
+
+    @pytest.mark.parametrize("value", ["0/4", "5/4", "1", "a/b", "1/0"])
+    def test_parse_invalid(self, value):
+        with pytest.raises(ValueError):
+            ExportShard.parse(value)
+
+    def test_every_object_has_one_owner(self):
+        shards = [ExportShard(index, 3) for index in range(1, 4)]
+        for object_id in ["0101-abc", 12345, "/Users/a@b.com/nb", "scope"]:
+            assert sum(shard.owns(object_id) for shard in shards) == 1
+
+
+class TestForEachPartition:
+
+    def test_names(self):
+        assert ForEachPartition().names("databricks_scim_users") == ["databricks_scim_users"]
+        assert ForEachPartition(2).names("databricks_scim_users") == ["databricks_scim_users_0",
+                                                                      "databricks_scim_users_1"]
+
+    def test_keys_are_stable(self):
+        partition = ForEachPartition(4)
+        keys = [f"user{i}@x.com" for i in range(20)]
+        assert [partition.index(key) for key in keys] == [ForEachPartition(4).index(key) for key in keys]
+        assert len({partition.index(key) for key in keys}) > 1
+        assert partition.key_name("databricks_scim_users", keys[0]) == \
+               f"databricks_scim_users_{partition.index(keys[0])}"
+        assert ForEachPartition().key_name("databricks_scim_users", keys[0]) == "databricks_scim_users"
+
+    @pytest.mark.parametrize("count", [0, -1, "2"])
+    def test_invalid_count(self, count):
+        with pytest.raises(ValueError):
+            ForEachPartition(count)
+
+    def test_without_config(self):
+        assert ForEachPartition.from_config().count is None
+
+
+class TestExportMerger:
+
+    def test_merge(self, tmpdir):
+        base_path, first, second = tmpdir / "base", tmpdir / "first", tmpdir / "second"
+        for source, file_path, tfvar in [(first, "/a.txt", "a"), (second, "/b.txt", "b")]:
+            dbfs_dir = source / ExportFileUtils.BASE_DIRECTORY / "dbfs_file"
+            dbfs_dir.ensure(dir=True)
+            (dbfs_dir / "databricks_dbfs_files.tf.json").write(json.dumps(
+                {"locals": {"files": {file_path: {"path": file_path}}}}, indent=4, sort_keys=True))
+            (source / ExportFileUtils.BASE_DIRECTORY / f"{tfvar}.tf.json").write("{}")
+            (source / "terraform.tfvars").write(f'{tfvar}="{tfvar}"\n')
+
+        ExportMerger(base_path).merge([first, second])
+        merged = json.loads((base_path / ExportFileUtils.BASE_DIRECTORY / "dbfs_file" /
+                             "databricks_dbfs_files.tf.json").read())
+        assert sorted(merged["locals"]["files"].keys()) == ["/a.txt", "/b.txt"]
+        assert (base_path / ExportFileUtils.BASE_DIRECTORY / "a.tf.json").exists()
+        assert (base_path / ExportFileUtils.BASE_DIRECTORY / "b.tf.json").exists()
+        assert (base_path / "terraform.tfvars").read() == 'a="a"\nb="b"\n'
+
+    def test_merge_copies_shard_trees(self, tmpdir):
+        base_path, shard = tmpdir / "base", tmpdir / "shard"
+        (shard / ExportFileUtils.BASE_DIRECTORY).ensure(dir=True)
+        (shard / ExportFileUtils.BASE_DIRECTORY / "a.tf.json").write("{}")
+        ExportMerger(base_path, move_files=False).merge([shard])
+        assert (base_path / ExportFileUtils.BASE_DIRECTORY / "a.tf.json").exists()
+        assert (shard / ExportFileUtils.BASE_DIRECTORY / "a.tf.json").exists()
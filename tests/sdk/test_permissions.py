@@ -0,0 +1,35 @@
+import pytest
+
+from databricks_sync.sdk.generators.permissions import PermissionsHelper
+
+
+def acl(*permissions):
+    return {"object_id": "/notebooks/3", "object_type": "notebook",
+            "access_control_list": [{"user_name": "user@x.com", "all_permissions": list(permissions)}]}
+
+
+class TestPermissionsHelper:
+
+    @pytest.mark.parametrize("perm_data, directories", [
+        (acl({"permission_level": "CAN_MANAGE", "inherited": False}), set()),
+        (acl({"permission_level": "CAN_MANAGE", "inherited": False},
+             {"permission_level": "CAN_RUN", "inherited": True,
+              "inherited_from_object": ["/directories/1", "/directories/2"]}),
+         {"/directories/1", "/directories/2"}),
+        # Any parent directory may have direct grants when the source is missing
+        (acl({"permission_level": "CAN_RUN", "inherited": True}), None),
+    ])
+    def test_get_inherited_directories(self, perm_data, directories):
+        assert PermissionsHelper.get_inherited_directories(perm_data) == directories
+
+    def test_prefetches_a_window_ahead_of_the_yielded_object(self, monkeypatch):
+        helper = PermissionsHelper(None)
+        prefetched = []
+        monkeypatch.setattr(helper, "prefetch_permissions",
+                            lambda resource_name, raw_id: prefetched.append((resource_name, raw_id)))
+        objects = helper.iter_prefetched("databricks_cluster", ({"id": i} for i in range(40)), lambda obj: obj["id"])
+        assert next(objects) == {"id": 0}
+        # Only the window after the first object is requested instead of every listed object
+        assert prefetched == [("databricks_cluster", i) for i in range(PermissionsHelper.MAX_PREFETCH_PERMISSIONS + 1)]
+        assert [obj["id"] for obj in objects] == list(range(1, 40))
+        assert prefetched == [("databricks_cluster", i) for i in range(40)]
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+import requests
+
+from databricks_sync.sdk.service.rate_limit import RateLimiter, RateLimitedApiClient, EndpointFamilyLimiter
+
+
+class MockResponse:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = json.dumps({"message": "throttled"})
+
+
+class ThrottlingApiClient:
+
+    def __init__(self, throttled_responses):
+        self.url = "https://test.cloud.databricks.com/api/2.0"
+        self.throttled_responses = list(throttled_responses)
+        self.calls = 0
+
+    def perform_query(self, method, path, data={}, headers=None):
+        self.calls += 1
+        if len(self.throttled_responses) > 0:
+            raise requests.HTTPError("throttled", response=self.throttled_responses.pop(0))
+        return {"path": path}
+
+
+class TestRateLimiter:
+
+    def test_get_family(self):
+        assert RateLimiter.get_family("/preview/scim/v2/Users") == "scim"
+        assert RateLimiter.get_family("/preview/permissions/notebooks/123") == "permissions"
+        assert RateLimiter.get_family("/workspace/list") == "workspace"
+        assert RateLimiter.get_family("") == RateLimiter.DEFAULT_FAMILY
+
+    def test_retries_throttled_requests(self):
+        limiter = RateLimiter({"scim": 100}, backoff_seconds=0.01)
+        api_client = ThrottlingApiClient([MockResponse(429, {"Retry-After": "0"}), MockResponse(503)])
+        client = RateLimitedApiClient(api_client, limiter=limiter)
+        assert client.perform_query("GET", "/preview/scim/v2/Users") == {"path": "/preview/scim/v2/Users"}
+        assert api_client.calls == 3
+        assert client.url == api_client.url
+        summary = limiter.summary()
+        assert summary["throttled"] == {"scim": 2}
+        assert summary["requests"] == {"scim": 3}
+
+    def test_gives_up_after_max_retries(self):
+        limiter = RateLimiter(max_retries=1, backoff_seconds=0.01)
+        api_client = ThrottlingApiClient([MockResponse(429)] * 3)
+        client = RateLimitedApiClient(api_client, limiter=limiter)
+        with pytest.raises(requests.HTTPError):
+            client.perform_query("GET", "/jobs/list")
+        assert api_client.calls == 2
+
+    def test_other_errors_are_not_retried(self):
+        limiter = RateLimiter()
+        api_client = ThrottlingApiClient([MockResponse(404)])
+        client = RateLimitedApiClient(api_client, limiter=limiter)
+        with pytest.raises(requests.HTTPError):
+            client.perform_query("GET", "/jobs/get")
+        assert api_client.calls == 1
+        assert limiter.summary()["throttled"] == {}
+
+    def test_aimd_window(self):
+        family = EndpointFamilyLimiter("jobs", 100, 8)
+        family.acquire()
+        family.release(throttled=True)
+        assert family.window == 4
+        for _ in range(8):
+            family.acquire()
+            family.release(throttled=False)
+        assert 5 < family.window <= 8
+
+    def test_retry_after_header(self):
+        assert RateLimiter.get_retry_after(MockResponse(429, {"Retry-After": "3"})) == 3
+        assert RateLimiter.get_retry_after(MockResponse(429)) is None
@@ -0,0 +1,49 @@
+from databricks_sync.sdk.sync.resume import ExportResume
+
+
+class MockItem:
+
+    def __init__(self, hcl_resource_identifier, for_each_var_id_name_pairs=None):
+        self.resource_name = "databricks_notebook"
+        self.hcl_resource_identifier = hcl_resource_identifier
+        self.for_each_var_id_name_pairs = for_each_var_id_name_pairs or []
+
+
+class TestExportResume:
+    statuses = {
+        ("databricks_notebook", "done"): "SUCCEEDED",
+        ("databricks_notebook", "failed"): "FAILED",
+        ("databricks_notebook", "started"): "STARTED",
+        ("databricks_notebook", "no_checkpoint"): "SUCCEEDED",
+        ("databricks_notebook", "a"): "SUCCEEDED",
+        ("databricks_notebook", "b"): "FAILED",
+    }
+    checkpoints = {
+        ("databricks_notebook", "done"): {"mapped_variables": {}, "tfvars": [["a", "b"]], "spark_envs": []},
+        ("databricks_notebook", "aggregate"): {"mapped_variables": {}, "tfvars": [], "spark_envs": []},
+    }
+
+    def test_resume(self):
+        resume = ExportResume(self.statuses, self.checkpoints)
+        assert resume.should_export(MockItem("done")) is False
+        assert resume.should_export(MockItem("failed")) is True
+        assert resume.should_export(MockItem("started")) is True
+        assert resume.should_export(MockItem("new")) is True
+        # variables can not be collected without a checkpoint so the object is exported again
+        assert resume.should_export(MockItem("no_checkpoint")) is True
+        # for_each resources are exported again if any of their objects did not succeed
+        assert resume.should_export(MockItem("aggregate", [("a", "a"), ("b", "b")])) is True
+        assert resume.should_export(MockItem("aggregate", [("a", "a")])) is False
+
+    def test_retry_failed(self):
+        resume = ExportResume(self.statuses, self.checkpoints, retry_failed=True)
+        assert resume.should_export(MockItem("done")) is False
+        assert resume.should_export(MockItem("failed")) is True
+        assert resume.should_export(MockItem("started")) is True
+        assert resume.should_export(MockItem("new")) is False
+
+    def test_skip_keeps_variables(self):
+        resume = ExportResume(self.statuses, self.checkpoints)
+        resume.skip(MockItem("done"))
+        resume.skip(MockItem("new"))
+        assert resume.skipped_variables == [self.checkpoints[("databricks_notebook", "done")]]
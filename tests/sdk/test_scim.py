@@ -0,0 +1,69 @@
+import pytest
+
+from databricks_sync.sdk.generators.identity import IdentityHCLGenerator
+from databricks_sync.sdk.service.concurrency import AsyncService
+from databricks_sync.sdk.service.scim import ScimService, list_scim_resources
+
+USERS = [{"id": f"u{i}", "userName": f"user{i}@x.com", "active": True, "groups": [{"value": "g1"}],
+          "roles": [{"value": "arn:aws:iam::123:instance-profile/shared"}]} for i in range(23)]
+GROUPS = [{"id": "g1", "displayName": "data eng", "members": [],
+           "roles": [{"value": "arn:aws:iam::123:instance-profile/shared"}]}]
+
+
+class MockApiClient:
+    url = "https://test.cloud.databricks.com/api/2.0"
+
+    def __init__(self, max_page_size=None, deleted_after_first_page=()):
+        self.max_page_size = max_page_size
+        self.deleted_after_first_page = deleted_after_first_page
+        self.users = list(USERS)
+        self.calls = []
+
+    def perform_query(self, method, path, data=None, headers=None):
+        self.calls.append((path, dict(data or {})))
+        if path == "/preview/scim/v2/Users" and len(self.calls) == 2:
+            self.users = [user for i, user in enumerate(self.users) if i not in self.deleted_after_first_page]
+        resources = {"/preview/scim/v2/Users": self.users, "/preview/scim/v2/Groups": GROUPS,
+                     "/preview/scim/v2/ServicePrincipals": []}.get(path, None)
+        if resources is None:
+            raise ValueError(path)
+        if self.max_page_size is None:
+            return {"totalResults": len(resources), "Resources": resources}
+        start, count = data.get("startIndex", 1), min(data.get("count", 100), self.max_page_size)
+        page = resources[start - 1:start - 1 + count]
+        return {"totalResults": len(resources), "startIndex": start, "itemsPerPage": len(page), "Resources": page}
+
+
+class TestScimPagination:
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("max_page_size, pages", [
+        (None, 1),
+        # Pages are as large as the workspace serves them and overlap by one user
+        (5, 6),
+    ])
+    async def test_lists_every_page(self, max_page_size, pages):
+        client = MockApiClient(max_page_size=max_page_size)
+        users = await list_scim_resources(AsyncService(ScimService(client)).list_users, ScimService.USER_ATTRIBUTES)
+        assert users == USERS
+        assert [data["startIndex"] for _, data in client.calls] == [1 + i * 4 for i in range(pages)]
+        assert all(data["attributes"] == ",".join(ScimService.USER_ATTRIBUTES) for _, data in client.calls)
+
+    @pytest.mark.asyncio
+    async def test_lists_again_when_users_are_deleted(self):
+        client = MockApiClient(max_page_size=5, deleted_after_first_page=(2, 4))
+        users = await list_scim_resources(AsyncService(ScimService(client)).list_users, ScimService.USER_ATTRIBUTES)
+        # The users which were deleted after they were listed are still exported but none of the shifted ones is missed
+        assert users == USERS
+        assert len([data for _, data in client.calls if data["startIndex"] == 1]) == 2
+
+    @pytest.mark.asyncio
+    async def test_group_roles_come_from_the_listing(self):
+        client = MockApiClient(max_page_size=10)
+        generator = IdentityHCLGenerator(client, "/tmp")
+        items = [item async for item in generator._generate() if item is not None]
+        # Users get their instance profile through their group so no user instance profiles are exported
+        assert not any(item.resource_name == "databricks_user_instance_profile" for item in items)
+        assert sorted({path for path, _ in client.calls}) == ["/preview/scim/v2/Groups",
+                                                               "/preview/scim/v2/ServicePrincipals",
+                                                               "/preview/scim/v2/Users"]
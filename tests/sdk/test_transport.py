@@ -0,0 +1,18 @@
+from databricks_cli.sdk import ApiClient
+
+from databricks_sync.sdk.service.rate_limit import RateLimitedApiClient
+from databricks_sync.sdk.service.transport import HttpTransport
+
+
+class TestHttpTransport:
+
+    def test_bind_shares_session(self):
+        transport = HttpTransport(pool_size=32)
+        api_client = ApiClient(host="https://test.cloud.databricks.com", token="token")
+        other_api_client = ApiClient(host="https://test.cloud.databricks.com", token="token")
+        transport.bind(RateLimitedApiClient(api_client))
+        transport.bind(other_api_client)
+        assert api_client.session is transport.session
+        assert other_api_client.session is transport.session
+        assert transport.session.get_adapter("https://test.cloud.databricks.com")._pool_maxsize == 32
+        transport.close()